@@ -1,13 +1,17 @@
 import os
 import logging
-from typing import Tuple, Optional, Union, List, Dict
-from openai import OpenAI
+from typing import Tuple, Optional, Union, List, Dict, Callable, Awaitable, AsyncIterator
+import httpx
+from openai import AsyncOpenAI
 import google.genai as genai
 from dotenv import load_dotenv
 from google.genai import types
 from datetime import datetime
 from dateutil.parser import parse as date_parse
 import re
+from config import settings
+from services.provider_router import ProviderRouter, NoProviderAvailable, UnsupportedProvider
+from services.rate_limiter import AILimiter
 
 load_dotenv(dotenv_path=os.getenv("ENV_FILE", ".env"))
 # Setup logging
@@ -20,65 +24,244 @@ gemini_client = None
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 
+# Connection pool for outbound LLM calls (shared by every provider client)
+AI_HTTP_MAX_CONNECTIONS = int(os.getenv("AI_HTTP_MAX_CONNECTIONS", "200"))
+AI_HTTP_MAX_KEEPALIVE = int(os.getenv("AI_HTTP_MAX_KEEPALIVE", "50"))
+AI_HTTP_TIMEOUT = float(os.getenv("AI_HTTP_TIMEOUT", "30"))
+
+DEFAULT_MODELS = {
+    "openai": "gpt-4o-mini",
+    "gemini": "gemini-2.5-flash",
+}
+
+# One pooled async HTTP client, so concurrent webhooks reuse keep-alive
+# connections instead of each opening its own.
+http_client = httpx.AsyncClient(
+    limits=httpx.Limits(
+        max_connections=AI_HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=AI_HTTP_MAX_KEEPALIVE,
+    ),
+    timeout=httpx.Timeout(AI_HTTP_TIMEOUT, connect=5.0),
+)
+
 # Initialize AI clients
-openai_client = OpenAI(api_key=OPENAI_API_KEY)
+openai_client = AsyncOpenAI(api_key=OPENAI_API_KEY, http_client=http_client)
 if GEMINI_API_KEY:
-    gemini_client = genai.Client(api_key=GEMINI_API_KEY)
+    gemini_client = genai.Client(
+        api_key=GEMINI_API_KEY,
+        http_options=types.HttpOptions(httpx_async_client=http_client)
+    )
+
+
+# Earlier conversation turns: [{"role": "user" | "assistant", "content": ...}, ...]
+History = List[Dict[str, str]]
+
+
+def _openai_messages(message_text: str, system_prompt: str, history: Optional[History]) -> List[Dict[str, str]]:
+    return [
+        {"role": "system", "content": system_prompt},
+        *(history or []),
+        {"role": "user", "content": message_text}
+    ]
+
+
+def _gemini_contents(message_text: str, history: Optional[History]) -> list:
+    if not history:
+        return [message_text]
+    contents = [
+        types.Content(role="model" if turn["role"] == "assistant" else "user", parts=[types.Part(text=turn["content"])])
+        for turn in history
+    ]
+    contents.append(types.Content(role="user", parts=[types.Part(text=message_text)]))
+    return contents
+
+
+async def _openai_completion(
+    message_text: str, system_prompt: str, model: str, temperature: float, history: Optional[History] = None
+) -> str:
+    response = await openai_client.chat.completions.create(
+        model=model,
+        messages=_openai_messages(message_text, system_prompt, history),
+        temperature=temperature
+    )
+    return response.choices[0].message.content
+
+
+async def _gemini_completion(
+    message_text: str, system_prompt: str, model: str, temperature: float, history: Optional[History] = None
+) -> str:
+    if gemini_client is None:
+        raise RuntimeError("GEMINI_API_KEY is not configured")
+
+    response = await gemini_client.aio.models.generate_content(
+        model=model,
+        contents=_gemini_contents(message_text, history),
+        config=types.GenerateContentConfig(
+            system_instruction=system_prompt,  # Use the system_prompt argument
+            temperature=temperature,
+            max_output_tokens=300
+        )
+    )
+    return response.text
+
+
+async def _openai_stream(
+    message_text: str, system_prompt: str, model: str, temperature: float, history: Optional[History] = None
+) -> AsyncIterator[str]:
+    stream = await openai_client.chat.completions.create(
+        model=model,
+        messages=_openai_messages(message_text, system_prompt, history),
+        temperature=temperature,
+        stream=True
+    )
+    async for chunk in stream:
+        delta = chunk.choices[0].delta.content if chunk.choices else None
+        if delta:
+            yield delta
+
+
+async def _gemini_stream(
+    message_text: str, system_prompt: str, model: str, temperature: float, history: Optional[History] = None
+) -> AsyncIterator[str]:
+    if gemini_client is None:
+        raise RuntimeError("GEMINI_API_KEY is not configured")
+
+    stream = await gemini_client.aio.models.generate_content_stream(
+        model=model,
+        contents=_gemini_contents(message_text, history),
+        config=types.GenerateContentConfig(
+            system_instruction=system_prompt,
+            temperature=temperature,
+            max_output_tokens=300
+        )
+    )
+    async for chunk in stream:
+        if chunk.text:
+            yield chunk.text
 
 
-def get_ai_response(
+# Provider name -> async completion function
+PROVIDERS: Dict[str, Callable[..., Awaitable[str]]] = {
+    "openai": _openai_completion,
+    "gemini": _gemini_completion,
+}
+
+# Provider name -> async generator of reply text chunks
+STREAMING_PROVIDERS: Dict[str, Callable[..., AsyncIterator[str]]] = {
+    "openai": _openai_stream,
+    "gemini": _gemini_stream,
+}
+
+
+def _configured(provider: str) -> bool:
+    if provider == "openai":
+        return bool(OPENAI_API_KEY)
+    if provider == "gemini":
+        return gemini_client is not None
+    return False
+
+
+# Failover, hedging and circuit breakers across the providers above
+provider_router = ProviderRouter(
+    completions=PROVIDERS,
+    streams=STREAMING_PROVIDERS,
+    default_models=DEFAULT_MODELS,
+    configured=_configured,
+    hedge_enabled=settings.AI_HEDGE_ENABLED,
+    hedge_default_delay=settings.AI_HEDGE_DEFAULT_DELAY_SECONDS,
+    hedge_min_delay=settings.AI_HEDGE_MIN_DELAY_SECONDS,
+    hedge_min_samples=settings.AI_HEDGE_MIN_SAMPLES,
+    breaker_failures=settings.AI_BREAKER_FAILURES,
+    breaker_error_rate=settings.AI_BREAKER_ERROR_RATE,
+    breaker_cooldown=settings.AI_BREAKER_COOLDOWN_SECONDS,
+    limiter=AILimiter(
+        max_concurrency=settings.AI_MAX_CONCURRENCY,
+        requests_per_minute=settings.AI_REQUESTS_PER_MINUTE,
+        tokens_per_minute=settings.AI_TOKENS_PER_MINUTE,
+        max_wait=settings.AI_LIMITER_MAX_WAIT_SECONDS,
+        max_queue=settings.AI_LIMITER_MAX_QUEUE,
+        overrides=settings.AI_LIMIT_OVERRIDES
+    ),
+    completion_tokens=settings.AI_COMPLETION_TOKEN_ESTIMATE
+)
+
+
+async def get_ai_response(
     message_text: str,
     ai_provider: str = "gemini",
     system_prompt: str = "",
     model: str = None,
-    temperature: float = 0.7
+    temperature: float = 0.7,
+    history: Optional[History] = None,
+    tenant_id=None
 ) -> Tuple[str, float]:
     """
     Returns AI-generated response and confidence score.
     Supports 'openai' and 'gemini'.
     Multi-tenant ready: accepts tenant-specific system_prompt, model, and temperature.
+    `history` holds earlier turns of the conversation, oldest first.
+    Non-blocking: awaits the provider, so the event loop keeps serving other webhooks.
+    Goes through provider_router (failover / hedging / rate limits, queued
+    fairly per `tenant_id`); when no provider can answer in time, returns
+    settings.AI_FALLBACK_REPLY with confidence 0 (escalated).
     """
+    ai_provider = (ai_provider or "openai").lower()
     try:
-        if ai_provider.lower() == "openai":
-            if not model:
-                model = "gpt-4o-mini"  # default OpenAI model
-
-            response = openai_client.chat.completions.create(
-                model=model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": message_text}
-                ],
-                temperature=temperature
-            )
-            reply = response.choices[0].message.content
-            confidence = 0.9  # placeholder, can be replaced with scoring logic
-
-        elif ai_provider.lower() == "gemini":
-            if not model:
-                model = "gemini-2.5-flash"
-
-            response = gemini_client.models.generate_content(
-                model=model,
-                contents=[message_text],
-                config=types.GenerateContentConfig( 
-                    system_instruction=system_prompt, # Use the system_prompt argument
-                    temperature=temperature,
-                    max_output_tokens=300
-                )
-            )
-            reply = response.text
-            confidence = 0.9
-
-        else:
-            reply = "AI provider not supported."
-            confidence = 0.0
+        reply, (used_provider, _) = await provider_router.complete(
+            message_text,
+            ai_provider,
+            system_prompt or "",
+            model if model and ai_provider in PROVIDERS else None,
+            0.7 if temperature is None else temperature,
+            history,
+            tenant_id
+        )
+        if used_provider != ai_provider:
+            logger.info(f"AI reply served by {used_provider} instead of {ai_provider}")
+        confidence = 0.9  # placeholder, can be replaced with scoring logic
 
         return reply, confidence
 
-    except Exception as e:
+    except UnsupportedProvider as e:
+        logger.error(str(e))
+        return "AI provider not supported.", 0.0
+
+    except NoProviderAvailable as e:
         logger.error(f"AI response error for provider {ai_provider}: {str(e)}")
-        return f"[AI Error]: {str(e)}", 0.0
+        return settings.AI_FALLBACK_REPLY, 0.0
+
+
+async def stream_ai_response(
+    message_text: str,
+    ai_provider: str = "gemini",
+    system_prompt: str = "",
+    model: str = None,
+    temperature: float = 0.7,
+    history: Optional[History] = None,
+    tenant_id=None
+) -> AsyncIterator[str]:
+    """
+    Streaming variant of get_ai_response: yields reply text as the provider
+    produces it, failing over to another provider until the first chunk.
+    Errors are raised to the caller (some text may already have been sent, so
+    there is no single error reply to substitute).
+    """
+    ai_provider = (ai_provider or "openai").lower()
+    async for text in provider_router.stream(
+        message_text,
+        ai_provider,
+        system_prompt or "",
+        model if model and ai_provider in STREAMING_PROVIDERS else None,
+        0.7 if temperature is None else temperature,
+        history,
+        tenant_id
+    ):
+        yield text
+
+
+async def close_ai_clients() -> None:
+    """Close the shared HTTP connection pool (called on app shutdown)."""
+    await http_client.aclose()
 
 def extract_appointment_datetime(text: str) -> Optional[datetime]:
     """
@@ -4,6 +4,7 @@ from sqlalchemy.orm import Session
 from database import get_db
 from models import Tenant
 from auth.security import decode_token
+from services.tenant import get_tenant_cached
 from typing import Optional
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
@@ -31,7 +32,7 @@ def get_current_tenant(token: str = Depends(oauth2_scheme), db: Session = Depend
     except Exception:
         raise credentials_exception
     
-    tenant = db.query(Tenant).filter(Tenant.id == tenant_id).first()
+    tenant = get_tenant_cached(db, tenant_id)
     if tenant is None or not tenant.is_active:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -0,0 +1,19 @@
+import argparse
+import uuid
+from database import SessionLocal
+from services.analytics_rollup import backfill
+
+
+def backfill_analytics(tenant_id=None):
+    print("Rebuilding analytics rollups...")
+    db = SessionLocal()
+    try:
+        written = backfill(db, tenant_id)
+    finally:
+        db.close()
+    print(f"Wrote {written} rollup rows.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild the analytics rollup rows from messages and voice_messages")
+    parser.add_argument("--tenant", type=uuid.UUID, help="only this tenant (default: all tenants)")
+    backfill_analytics(parser.parse_args().tenant)
@@ -0,0 +1,119 @@
+"""
+Concurrent webhook throughput: blocking vs async AI provider calls.
+
+Starts a local fake OpenAI-compatible server that answers every chat
+completion after a fixed delay, then fires N concurrent "webhooks" at it:
+
+- before: async handler calling the synchronous OpenAI client (old path)
+- after:  async handler awaiting ai_providers.get_ai_response
+
+Run from the repo root:
+    python -m benchmarks.bench_ai_providers --requests 200 --latency 0.25
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def start_fake_provider(latency: float) -> ThreadingHTTPServer:
+    """Serve /v1/chat/completions with a canned reply after `latency` seconds."""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            time.sleep(latency)
+            body = json.dumps({
+                "id": "chatcmpl-fake",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": "fake-model",
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "We are open 9 to 5."},
+                    "finish_reason": "stop",
+                }],
+                "usage": {"prompt_tokens": 10, "completion_tokens": 8, "total_tokens": 18},
+            }).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+async def run_blocking(base_url: str, n: int) -> float:
+    from openai import OpenAI
+
+    client = OpenAI(api_key="fake", base_url=base_url)
+
+    async def webhook():
+        # Same shape as the old get_ai_response: sync call inside async def
+        client.chat.completions.create(
+            model="fake-model",
+            messages=[{"role": "user", "content": "What are your hours?"}],
+            temperature=0.7,
+        )
+
+    start = time.perf_counter()
+    await asyncio.gather(*(webhook() for _ in range(n)))
+    return time.perf_counter() - start
+
+
+async def run_async(n: int) -> float:
+    import ai_providers
+
+    async def webhook():
+        await ai_providers.get_ai_response(
+            message_text="What are your hours?",
+            ai_provider="openai",
+            model="fake-model",
+        )
+
+    start = time.perf_counter()
+    await asyncio.gather(*(webhook() for _ in range(n)))
+    elapsed = time.perf_counter() - start
+    await ai_providers.close_ai_clients()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.25, help="fake provider latency in seconds")
+    args = parser.parse_args()
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    server = start_fake_provider(args.latency)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+    # ai_providers reads these at import time
+    os.environ["OPENAI_API_KEY"] = "fake"
+    os.environ["OPENAI_BASE_URL"] = base_url
+
+    blocking = asyncio.run(run_blocking(base_url, args.requests))
+    non_blocking = asyncio.run(run_async(args.requests))
+    server.shutdown()
+
+    print(f"{args.requests} concurrent webhooks, provider latency {args.latency * 1000:.0f} ms")
+    print(f"  before (sync client):   {blocking:8.2f} s  {args.requests / blocking:8.1f} req/s")
+    print(f"  after  (async client):  {non_blocking:8.2f} s  {args.requests / non_blocking:8.1f} req/s")
+    print(f"  speedup: {blocking / non_blocking:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
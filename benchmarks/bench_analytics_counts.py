@@ -0,0 +1,148 @@
+"""
+Dashboard counters: one query per metric (old) vs one COUNT(*) FILTER pass.
+
+Fills a scratch schema (bench_analytics, dropped afterwards unless --keep)
+with a synthetic messages table of --rows rows spread over --tenants tenants
+(3 channels each, one voice message per 20 messages, a year of history), then
+times the analytics dashboard numbers for one tenant both ways:
+
+- old: the per-metric queries get_basic_analytics used to run (total,
+  resolved, escalated, channels, one count per channel type, voice, 14-day
+  histogram)
+- new: routes.analytics._raw_counts, a single statement built by
+  services.aggregates.count_by_day
+
+Needs DATABASE_URL (Postgres); only the scratch schema is written.
+Loading 10M rows takes a few minutes.
+
+Run from the repo root:
+    python -m benchmarks.bench_analytics_counts --rows 10000000 --tenants 20
+"""
+import argparse
+import statistics
+import time
+from datetime import datetime, timedelta
+from typing import Dict
+from sqlalchemy import func, cast, Date, text
+from sqlalchemy.orm import Session
+from database import engine, Base
+from models import Tenant, Channel, Message, VoiceMessage
+from routes.analytics import _raw_counts
+
+SCHEMA = "bench_analytics"
+
+
+def old_counts(db: Session, tenant_id, fourteen_days_ago, today) -> Dict:
+    """get_basic_analytics before the single-pass query, one round-trip per metric."""
+    total_messages = db.query(func.count(Message.id)).filter(Message.tenant_id == tenant_id).scalar() or 0
+    ai_resolved = db.query(func.count(Message.id)).filter(
+        Message.tenant_id == tenant_id,
+        (Message.status == 'replied') | (Message.escalated_to_human == False)
+    ).scalar() or 0
+    escalated = db.query(func.count(Message.id)).filter(
+        Message.tenant_id == tenant_id, Message.escalated_to_human == True
+    ).scalar() or 0
+    channel_type_map = {"sms": [], "email": [], "chat": []}
+    for ch in db.query(Channel).filter(Channel.tenant_id == tenant_id).all():
+        if ch.type in channel_type_map:
+            channel_type_map[ch.type].append(ch.id)
+    counts = {"sms": 0, "email": 0, "chat": 0}
+    for channel_type, channel_ids in channel_type_map.items():
+        if channel_ids:
+            counts[channel_type] = db.query(func.count(Message.id)).filter(
+                Message.tenant_id == tenant_id, Message.channel_id.in_(channel_ids)
+            ).scalar() or 0
+    voice_count = db.query(func.count(VoiceMessage.id)).filter(VoiceMessage.tenant_id == tenant_id).scalar() or 0
+    day = cast(Message.created_at, Date)
+    daily = db.query(day.label('day'), func.count(Message.id).label('count')).filter(
+        Message.tenant_id == tenant_id, day >= fourteen_days_ago, day <= today
+    ).group_by(day).order_by(day).all()
+    return {
+        "total_messages": total_messages, "ai_resolved": ai_resolved, "escalated": escalated,
+        "sms_count": counts["sms"], "email_count": counts["email"], "chat_count": counts["chat"],
+        "voice_count": voice_count, "daily": {str(row.day): row.count for row in daily},
+    }
+
+
+def load(connection, rows: int, tenants: int) -> None:
+    connection.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+    connection.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+    Base.metadata.create_all(connection)
+    with Session(connection) as db:
+        for t in range(tenants):
+            tenant = Tenant(email=f"bench{t}@example.com", hashed_password="x", business_name=f"Bench {t}")
+            db.add(tenant)
+            db.flush()
+            for channel_type in ("sms", "email", "chat"):
+                db.add(Channel(tenant_id=tenant.id, type=channel_type, identifier=f"{channel_type}-{t}"))
+        db.flush()
+    for table, count, columns, values in (
+        ("messages", rows,
+         "id, tenant_id, channel_id, direction, message_text, status, escalated_to_human, created_at, updated_at",
+         "gen_random_uuid(), c.tenant_id, c.id, 'incoming', 'hello', "
+         "(ARRAY['replied', 'replied', 'pending', 'failed', 'escalated'])[1 + g % 5], g % 10 = 0, "
+         "now() - (g % 365) * interval '1 day' - (g % 86400) * interval '1 second', now()"),
+        ("voice_messages", rows // 20,
+         "id, tenant_id, channel_id, transcription, ai_response, created_at, updated_at",
+         "gen_random_uuid(), c.tenant_id, c.id, 'hi', 'hello', now() - (g % 365) * interval '1 day', now()"),
+    ):
+        connection.execute(text(f"""
+            INSERT INTO {table} ({columns})
+            SELECT {values}
+            FROM generate_series(0, :count - 1) g
+            JOIN (SELECT id, tenant_id, row_number() OVER (ORDER BY id) - 1 AS n FROM channels) c
+              ON c.n = g % :channels
+        """), {"count": count, "channels": tenants * 3})
+    connection.execute(text("ANALYZE"))
+
+
+def time_runs(fn, runs: int):
+    latencies, result = [], None
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = fn()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--tenants", type=int, default=20)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--keep", action="store_true", help="keep the scratch schema (and skip loading if it exists)")
+    args = parser.parse_args()
+
+    engine.echo = False
+    scratch = engine.execution_options(schema_translate_map={None: SCHEMA})
+    with scratch.connect() as connection:
+        loaded = connection.execute(text(
+            f"SELECT count(*) FROM information_schema.tables WHERE table_schema = '{SCHEMA}' AND table_name = 'messages'"
+        )).scalar()
+        if not (args.keep and loaded):
+            start = time.perf_counter()
+            connection.execute(text(f"SET search_path TO {SCHEMA}"))
+            load(connection, args.rows, args.tenants)
+            connection.commit()
+            print(f"loaded {args.rows} messages in {time.perf_counter() - start:.1f} s")
+
+        with Session(connection) as db:
+            tenant_id = db.query(Tenant.id).order_by(Tenant.email).first()[0]
+            today = datetime.utcnow().date()
+            since = today - timedelta(days=13)
+            old_ms, old = time_runs(lambda: old_counts(db, tenant_id, since, today), args.runs)
+            new_ms, new = time_runs(lambda: _raw_counts(db, tenant_id, since), args.runs)
+            db.rollback()
+
+        if not args.keep:
+            connection.execute(text(f"DROP SCHEMA {SCHEMA} CASCADE"))
+            connection.commit()
+
+    print(f"{args.rows} messages, {args.tenants} tenants, dashboard numbers for one tenant, {args.runs} runs")
+    for name, ms in (("old  per-metric queries", old_ms), ("new  single FILTER pass", new_ms)):
+        print(f"  {name}  median {statistics.median(ms):9.1f} ms  min {min(ms):9.1f} ms")
+    print(f"  speedup: {statistics.median(old_ms) / statistics.median(new_ms):.1f}x   results equal: {old == new}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+TwiML rendering cost: per-request f-strings (old) vs services.twiml.
+
+Times the three bodies the webhooks send - SMS reply, voice reply and call
+greeting - with the old f-string builders (no escaping) and services.twiml,
+plus a reply that needs escaping. No database or Twilio needed.
+
+Run from the repo root:
+    python -m benchmarks.bench_twiml --iterations 200000
+"""
+import argparse
+import timeit
+from services import twiml
+
+REPLY = "We are open 9 to 5, Monday to Saturday. Would you like to book a massage for tomorrow?"
+ESCAPED_REPLY = "Tom & Jerry's Spa: facials <60 min> & massages, book now!"
+BUSINESS = "Sunrise Wellness Spa"
+
+
+def old_sms_twiml(reply_text):
+    return f'<?xml version="1.0" encoding="UTF-8"?><Response><Message>{reply_text}</Message></Response>'.encode()
+
+
+def old_voice_twiml(say_text):
+    return f"""<?xml version="1.0" encoding="UTF-8"?>
+<Response>
+    <Say voice="Polly.Joanna">{say_text}</Say>
+    <Gather input="speech" action="/api/voice/receive" method="POST" speechTimeout="auto"/>
+</Response>""".encode()
+
+
+def bench(label: str, fn, iterations: int) -> None:
+    seconds = min(timeit.repeat(fn, number=iterations, repeat=5))
+    print(f"  {label:<36} {seconds / iterations * 1e9:8.0f} ns/op")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=200000)
+    args = parser.parse_args()
+    n = args.iterations
+
+    print(f"{n} renders, best of 5")
+    bench("sms    old f-string", lambda: old_sms_twiml(REPLY), n)
+    bench("sms    twiml.sms_reply", lambda: twiml.sms_reply(REPLY), n)
+    bench("sms    twiml.sms_reply (escaping)", lambda: twiml.sms_reply(ESCAPED_REPLY), n)
+    bench("voice  old f-string", lambda: old_voice_twiml(REPLY), n)
+    bench("voice  twiml.voice_reply", lambda: twiml.voice_reply(REPLY, "Polly.Joanna"), n)
+    bench(
+        "greet  old f-string",
+        lambda: old_voice_twiml(f"Hello! This is {BUSINESS}. How can I help you today?"),
+        n
+    )
+    bench("greet  twiml.greeting (cached)", lambda: twiml.greeting(BUSINESS, "Polly.Joanna"), n)
+
+    # Sanity: escaped output is well-formed XML
+    import xml.dom.minidom
+    xml.dom.minidom.parseString(twiml.sms_reply(ESCAPED_REPLY))
+    xml.dom.minidom.parseString(twiml.voice_reply(ESCAPED_REPLY, "Polly.Joanna"))
+
+
+if __name__ == "__main__":
+    main()
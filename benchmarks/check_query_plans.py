@@ -0,0 +1,182 @@
+"""
+EXPLAIN regression check for the hot tenant-scoped queries.
+
+Loads a synthetic dataset into a scratch schema (bench_plans, dropped
+afterwards unless --keep) with the tables and indexes from models.py, runs
+EXPLAIN on each hot query and checks that the planner uses one of the
+indexes built for it and never seq-scans the big table. Exits 1 if any plan regressed,
+so it can gate migrations / query changes in CI.
+
+Needs DATABASE_URL (Postgres); only the scratch schema is written.
+
+Run from the repo root:
+    python -m benchmarks.check_query_plans --tenants 2000 --messages 500000
+"""
+import argparse
+import sys
+import uuid
+from datetime import datetime, timedelta
+from typing import List, Tuple, Iterator, Dict, Any
+from sqlalchemy import select, text, and_
+from database import engine, Base
+from models import Channel, Message, VoiceMessage, Appointment
+from services.aggregates import counts_statement
+from services.conversation import conversation_store, ConversationKey
+from services.routing import _route_query
+
+SCHEMA = "bench_plans"
+
+
+def load(connection, tenants: int, messages: int) -> None:
+    connection.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+    connection.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+    connection.execute(text(f"SET search_path TO {SCHEMA}"))
+    Base.metadata.create_all(connection)
+    connection.execute(text("""
+        INSERT INTO tenants (id, email, hashed_password, business_name)
+        SELECT gen_random_uuid(), 'plans' || t || '@example.com', 'x', 'Tenant ' || t
+        FROM generate_series(0, :tenants - 1) t
+    """), {"tenants": tenants})
+    connection.execute(text("""
+        INSERT INTO channels (id, tenant_id, type, identifier, status, ai_cache_enabled)
+        SELECT gen_random_uuid(), t.id, c.type, c.type || '-' || t.email, 'active', true
+        FROM tenants t CROSS JOIN (VALUES ('sms'), ('email'), ('chat'), ('voice')) AS c(type)
+    """))
+    channel_pick = """
+        FROM generate_series(0, :count - 1) g
+        JOIN (SELECT id, tenant_id, type, row_number() OVER (ORDER BY id) - 1 AS n
+              FROM channels WHERE type {types}) c
+          ON c.n = g % :channels
+    """
+    connection.execute(text(f"""
+        INSERT INTO messages (id, tenant_id, channel_id, direction, message_text, ai_response, status,
+                              escalated_to_human, customer_contact, created_at, updated_at)
+        SELECT gen_random_uuid(), c.tenant_id, c.id, 'incoming', 'hello', 'hi',
+               (ARRAY['replied', 'replied', 'pending', 'failed'])[1 + g % 4], false,
+               '+1555' || (g % 997), now() - (g % 365) * interval '1 day', now()
+        {channel_pick.format(types="<> 'voice'")}
+    """), {"count": messages, "channels": tenants * 3})
+    connection.execute(text(f"""
+        INSERT INTO voice_messages (id, tenant_id, channel_id, from_contact, transcription, ai_response,
+                                    created_at, updated_at)
+        SELECT gen_random_uuid(), c.tenant_id, c.id, '+1555' || (g % 997), 'hi', 'hello',
+               now() - (g % 365) * interval '1 day', now()
+        {channel_pick.format(types="= 'voice'")}
+    """), {"count": messages // 5, "channels": tenants})
+    connection.execute(text(f"""
+        INSERT INTO appointments (id, tenant_id, channel_id, customer_contact, confirmed_time, status,
+                                  created_at, updated_at)
+        SELECT gen_random_uuid(), c.tenant_id, c.id, '+1555' || (g % 997),
+               now() + (g % 720 - 360) * interval '1 hour',
+               (ARRAY['pending', 'confirmed', 'completed', 'canceled', 'completed', 'canceled'])[1 + g % 6],
+               now() - (g % 365) * interval '1 day', now()
+        {channel_pick.format(types="= 'sms'")}
+    """), {"count": messages // 5, "channels": tenants})
+    connection.execute(text("ANALYZE"))
+
+
+def hot_queries(connection) -> List[Tuple[str, Any, str, Tuple[str, ...]]]:
+    """(name, statement, table that must not be seq-scanned, indexes of which the plan must use one)"""
+    tenant_id, sms_id, voice_id = connection.execute(text("""
+        SELECT s.tenant_id, s.id, v.id FROM channels s JOIN channels v ON v.tenant_id = s.tenant_id
+        WHERE s.type = 'sms' AND v.type = 'voice' ORDER BY s.identifier LIMIT 1
+    """)).one()
+    identifier = connection.execute(text("SELECT identifier FROM channels WHERE id = :id"), {"id": sms_id}).scalar()
+    now = datetime.utcnow()
+    since = (now - timedelta(days=29)).date()
+    open_slot = Appointment.status.in_(["confirmed", "pending"])
+
+    return [
+        ("sms / email list", select(Message).where(
+            Message.tenant_id == tenant_id, Message.channel_id.in_([sms_id, uuid.uuid4()])
+        ).order_by(Message.created_at.desc()), "messages", ("ix_messages_tenant_channel_created",)),
+        ("voice logs", select(VoiceMessage).where(
+            VoiceMessage.tenant_id == tenant_id
+        ).order_by(VoiceMessage.created_at.desc()), "voice_messages", (
+            "ix_voice_messages_tenant_created", "ix_voice_messages_tenant_channel_created"
+        )),
+        ("appointment list", select(Appointment).where(
+            Appointment.tenant_id == tenant_id
+        ).order_by(Appointment.created_at.desc()), "appointments", ("ix_appointments_tenant_created",)),
+        ("appointment summary", counts_statement(Appointment, {
+            "total": None, "pending": Appointment.status == "pending"
+        }, Appointment.created_at, since, where=(
+            Appointment.tenant_id == tenant_id,
+            Appointment.created_at >= datetime.combine(since, datetime.min.time())
+        )), "appointments", ("ix_appointments_tenant_created",)),
+        ("messages over time", counts_statement(Message, {"total_messages": None}, Message.created_at, since, where=(
+            Message.tenant_id == tenant_id,
+        )), "messages", ("ix_messages_tenant_created", "ix_messages_tenant_channel_created")),
+        ("conversation history", conversation_store._history_query(
+            ConversationKey(tenant_id, sms_id, "+1555" + "1")
+        ), "messages", ("ix_messages_tenant_channel_created", "ix_messages_tenant_created")),
+        ("voice conversation history", conversation_store._history_query(
+            ConversationKey(tenant_id, voice_id, "+1555" + "1", voice=True)
+        ), "voice_messages", ("ix_voice_messages_tenant_channel_created", "ix_voice_messages_tenant_created")),
+        ("webhook channel routing", _route_query().where(
+            Channel.type == "sms", Channel.identifier == identifier
+        ).limit(1), "channels", ("ix_channels_type_identifier",)),
+        ("slot availability", select(Appointment.id).where(and_(
+            Appointment.tenant_id == tenant_id, open_slot,
+            Appointment.confirmed_time < now + timedelta(hours=1), Appointment.confirmed_time >= now - timedelta(hours=1)
+        )).limit(1), "appointments", ("ix_appointments_tenant_confirmed_open",)),
+        ("available slots", select(Appointment.confirmed_time).where(and_(
+            Appointment.tenant_id == tenant_id, open_slot,
+            Appointment.confirmed_time >= now, Appointment.confirmed_time < now + timedelta(days=1)
+        )), "appointments", ("ix_appointments_tenant_confirmed_open",)),
+    ]
+
+
+def plan_nodes(node: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    yield node
+    for child in node.get("Plans", ()):
+        yield from plan_nodes(child)
+
+
+def explain(connection, statement) -> List[Dict[str, Any]]:
+    compiled = statement.compile(dialect=connection.dialect, compile_kwargs={"render_postcompile": True})
+    plan = connection.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {compiled}", compiled.params).scalar()
+    return list(plan_nodes(plan[0]["Plan"]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tenants", type=int, default=2000)
+    parser.add_argument("--messages", type=int, default=500_000)
+    parser.add_argument("--keep", action="store_true", help="keep the scratch schema (and skip loading if it exists)")
+    args = parser.parse_args()
+
+    engine.echo = False
+    scratch = engine.execution_options(schema_translate_map={None: SCHEMA})
+    failures = 0
+    with scratch.connect() as connection:
+        loaded = connection.execute(text(
+            f"SELECT count(*) FROM information_schema.tables WHERE table_schema = '{SCHEMA}' AND table_name = 'messages'"
+        )).scalar()
+        if not (args.keep and loaded):
+            load(connection, args.tenants, args.messages)
+            connection.commit()
+        connection.execute(text(f"SET search_path TO {SCHEMA}"))
+
+        print(f"{args.tenants} tenants, {args.messages} messages")
+        for name, statement, table, expected in hot_queries(connection):
+            nodes = explain(connection, statement)
+            indexes = {n["Index Name"] for n in nodes if "Index Name" in n}
+            seq_scan = any(n["Node Type"] == "Seq Scan" and n.get("Relation Name") == table for n in nodes)
+            ok = bool(indexes & set(expected)) and not seq_scan
+            failures += not ok
+            used = ", ".join(sorted(indexes)) or "no index"
+            print(f"  {'ok  ' if ok else 'FAIL'} {name:<28} {used}" + (f" (seq scan on {table})" if seq_scan else ""))
+
+        connection.rollback()
+        if not args.keep:
+            connection.execute(text(f"DROP SCHEMA {SCHEMA} CASCADE"))
+            connection.commit()
+
+    if failures:
+        print(f"{failures} query plan(s) regressed")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
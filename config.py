@@ -1,7 +1,7 @@
 # config.py
 from pydantic_settings import BaseSettings
 from pydantic import Field
-from typing import Optional
+from typing import Optional, Dict
 
 
 class Settings(BaseSettings):
@@ -18,6 +18,7 @@ class Settings(BaseSettings):
     TWILIO_ACCOUNT_SID: Optional[str] = Field(None, env="TWILIO_ACCOUNT_SID")
     TWILIO_AUTH_TOKEN: Optional[str] = Field(None, env="TWILIO_AUTH_TOKEN")
     TWILIO_PHONE_NUMBER: Optional[str] = Field(None, env="TWILIO_PHONE_NUMBER")
+    TWILIO_VOICE: str = "Polly.Joanna"  # <Say> voice for calls
     
     # Paddle
     PADDLE_WEBHOOK_SECRET: Optional[str] = Field(None, env="PADDLE_WEBHOOK_SECRET")
@@ -29,7 +30,123 @@ class Settings(BaseSettings):
 
     # AI settings
     DEFAULT_AI_PROVIDER: str = "openai"  # fallback
-    MAX_CONVERSATION_TOKENS: int = 4000
+    MAX_CONVERSATION_TOKENS: int = 4000  # prompt + history + message sent to the provider
+
+    # Conversation memory (earlier turns sent as context, see services/conversation.py)
+    CONVERSATION_MEMORY_ENABLED: bool = True
+    CONVERSATION_MAX_TURNS: int = 20
+    CONVERSATION_MAX_CONVERSATIONS: int = 10000
+    CONVERSATION_IDLE_TTL_SECONDS: int = 1800
+    CONVERSATION_LOOKBACK_HOURS: int = 24
+
+    # AI provider routing (failover, hedged requests, circuit breakers)
+    AI_FALLBACK_REPLY: str = (
+        "Thanks for your message! We can't answer automatically right now; "
+        "a member of our team will get back to you shortly."
+    )
+    AI_HEDGE_ENABLED: bool = True
+    AI_HEDGE_DEFAULT_DELAY_SECONDS: float = 2.0  # until the provider has AI_HEDGE_MIN_SAMPLES latencies
+    AI_HEDGE_MIN_DELAY_SECONDS: float = 0.5
+    AI_HEDGE_MIN_SAMPLES: int = 20
+    AI_BREAKER_FAILURES: int = 5
+    AI_BREAKER_ERROR_RATE: float = 0.5
+    AI_BREAKER_COOLDOWN_SECONDS: int = 30
+
+    # AI admission control, per provider/model (0 disables a limit).
+    # AI_LIMIT_OVERRIDES: {"openai/gpt-4o-mini": {"concurrency": 100, "rpm": 5000, "tpm": 2000000}, "gemini": {...}}
+    AI_MAX_CONCURRENCY: int = 50
+    AI_REQUESTS_PER_MINUTE: int = 500
+    AI_TOKENS_PER_MINUTE: int = 200000
+    AI_LIMIT_OVERRIDES: Dict[str, Dict[str, int]] = {}
+    AI_LIMITER_MAX_WAIT_SECONDS: float = 5.0
+    AI_LIMITER_MAX_QUEUE: int = 1000
+    AI_COMPLETION_TOKEN_ESTIMATE: int = 300  # reply tokens charged up front per call
+
+    # Share one provider call between identical messages that arrive while it is in flight
+    AI_SINGLE_FLIGHT_ENABLED: bool = True
+
+    # Deferred SMS replies (webhook acks immediately, workers reply via Twilio REST)
+    SMS_DEFERRED_REPLIES: bool = False
+    SMS_QUEUE_BACKEND: str = "database"  # database / memory
+    SMS_WORKER_CONCURRENCY: int = 20
+    SMS_TENANT_CONCURRENCY: int = 4
+    SMS_TENANT_MAX_PARKED: int = 20  # jobs held in memory over a tenant's cap before its rows are left unclaimed
+
+    # Email batch mode (webhook stores the email as pending; replies are generated in micro-batches)
+    EMAIL_BATCH_MODE: bool = False
+    EMAIL_BATCH_SIZE: int = 50
+    EMAIL_BATCH_CONCURRENCY: int = 8
+    EMAIL_BATCH_INTERVAL_SECONDS: float = 5.0
+    # Batched replies are POSTed here for delivery; batch mode stays off without it
+    EMAIL_REPLY_WEBHOOK_URL: Optional[str] = None
+    EMAIL_REPLY_WEBHOOK_TIMEOUT_SECONDS: float = 10.0
+
+    # Dashboard reads counters kept per tenant/day/channel type in the analytics table
+    # (off: it counts the message tables directly). Run backfill_analytics.py first.
+    ANALYTICS_ROLLUPS_ENABLED: bool = False
+
+    # Dashboard lists (sms, email, voice logs, appointments): cursor pages and cached totals
+    LIST_DEFAULT_LIMIT: int = 50
+    LIST_MAX_LIMIT: int = 200
+    LIST_TOTAL_CACHE_TTL_SECONDS: int = 60
+    LIST_TOTAL_CACHE_MAX_SIZE: int = 10000
+
+    # Streaming exports (rows fetched and written per batch; each export holds one DB connection)
+    EXPORT_BATCH_SIZE: int = 1000
+    EXPORT_MAX_CONCURRENT: int = 2
+
+    # Webhook idempotency (Twilio retries)
+    WEBHOOK_DEDUPE_MAX_SIZE: int = 10000
+    WEBHOOK_DEDUPE_TTL_SECONDS: int = 600
+
+    # Voice call sessions (per-CallSid state between <Gather> turns)
+    VOICE_SESSION_IDLE_TIMEOUT_SECONDS: int = 300
+    VOICE_SESSION_MAX_SESSIONS: int = 5000
+
+    # Caching
+    TENANT_CACHE_TTL_SECONDS: int = 60
+    TENANT_CACHE_MAX_SIZE: int = 1024
+    CHANNEL_ROUTE_TTL_SECONDS: int = 300
+
+    # Exact-match AI reply cache (per tenant, opt-out per channel)
+    REPLY_CACHE_ENABLED: bool = True
+    REPLY_CACHE_TTL_SECONDS: int = 3600
+    REPLY_CACHE_TENANT_MAX_BYTES: int = 256 * 1024
+    REPLY_CACHE_MAX_TENANTS: int = 1000
+
+    # Embeddings (semantic cache / retrieval)
+    EMBEDDING_PROVIDER: str = "hashing"  # hashing (local, deterministic) / openai
+    EMBEDDING_MODEL: str = "text-embedding-3-small"
+    EMBEDDING_DIM: int = 256
+
+    # Semantic reply cache (reuses answers to similar earlier questions);
+    # only takes effect with a semantic EMBEDDING_PROVIDER (not hashing)
+    SEMANTIC_CACHE_ENABLED: bool = False
+    SEMANTIC_CACHE_THRESHOLD: float = 0.85
+    SEMANTIC_CACHE_MIN_CONFIDENCE: float = 0.8
+    SEMANTIC_CACHE_MAX_ENTRIES: int = 5000
+    SEMANTIC_CACHE_LOOKBACK_DAYS: int = 30
+
+    # Knowledge base retrieval (top-k passages added to the prompt)
+    KB_RETRIEVAL_ENABLED: bool = True
+    KB_TOP_K: int = 3
+    KB_MIN_SCORE: float = 0.3
+    KB_PASSAGE_MAX_CHARS: int = 800
+    KB_IVF_MIN_ROWS: int = 4096  # exact search below this, clustered (IVF) search above
+    KB_IVF_NPROBE: int = 8
+
+    # FAQ retrieval mode (core prompt + top-N relevant FAQs instead of every FAQ)
+    FAQ_RETRIEVAL_ENABLED: bool = True
+    FAQ_TOP_N: int = 5
+    FAQ_RETRIEVAL_MIN_FAQS: int = 10  # below this the whole list is cheap enough
+
+    # Retrieval backend for FAQ selection and KB passages: embedding / bm25 (lexical, no embedder)
+    RETRIEVAL_BACKEND: str = "embedding"
+    BM25_FAST_ANSWER_THRESHOLD: float = 0.8
+
+    # Zero-LLM FAQ fast path (opt-in per tenant; this switch turns it off everywhere)
+    FAQ_FAST_PATH_ENABLED: bool = True
+    FAQ_FAST_PATH_THRESHOLD: float = 0.8  # default when the tenant sets none
 
     # Security
     REQUIRE_TWILIO_VALIDATION: bool = True
@@ -1,6 +1,8 @@
 # database.py
 import os
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.orm import sessionmaker, declarative_base
 from sqlalchemy.pool import QueuePool
 from dotenv import load_dotenv
@@ -27,6 +29,40 @@ engine = create_engine(
 # Session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+
+def _async_database_url(url: str):
+    """
+    Convert the sync Postgres URL into an asyncpg one.
+    asyncpg does not understand libpq query params like sslmode/channel_binding,
+    so sslmode is moved into connect_args.
+    """
+    async_url = make_url(url)
+    query = dict(async_url.query)
+    connect_args = {}
+    sslmode = query.pop("sslmode", None)
+    query.pop("channel_binding", None)
+    if sslmode and sslmode != "disable":
+        connect_args["ssl"] = sslmode
+    return async_url.set(drivername="postgresql+asyncpg", query=query), connect_args
+
+
+ASYNC_DATABASE_URL, ASYNC_CONNECT_ARGS = _async_database_url(DATABASE_URL)
+
+# Async engine (asyncpg) for webhook hot paths, same pool sizing as the sync engine
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    echo=False,
+    pool_size=5,
+    max_overflow=10,
+    pool_timeout=30,
+    pool_recycle=300,
+    pool_pre_ping=True,
+    connect_args=ASYNC_CONNECT_ARGS,
+)
+
+# Async session factory (objects stay usable after commit for building responses)
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
 # Base class for models
 Base = declarative_base()
 
@@ -37,3 +73,12 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+# Async dependency for FastAPI routes
+async def get_async_db():
+    db: AsyncSession = AsyncSessionLocal()
+    try:
+        yield db
+    finally:
+        await db.close()
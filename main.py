@@ -1,6 +1,11 @@
 from fastapi import FastAPI
-from routes import email, sms, chat, voice, voice_logs, analytics, appointments, subscription, tenant
+from routes import email, sms, chat, voice, voice_logs, analytics, appointments, subscription, tenant, metrics, export
 from auth import routes as auth_routes
+from ai_providers import close_ai_clients
+from services.routing import warm_routes
+from services.sms_queue import sms_pipeline
+from services.email_batch import email_batcher
+from config import settings
 
 app = FastAPI()
 
@@ -15,6 +20,24 @@ app.include_router(analytics.router, prefix="/api/analytics", tags=["Analytics"]
 app.include_router(appointments.router, prefix="/api/appointments", tags=["Appointments"])
 app.include_router(subscription.router, prefix="/api/subscription", tags=["Subscription"])
 app.include_router(tenant.router, prefix="/api/tenant", tags=["Tenant"])
+app.include_router(metrics.router, prefix="/api/metrics", tags=["Metrics"])
+app.include_router(export.router, prefix="/api/export", tags=["Export"])
+
+@app.on_event("startup")
+async def startup():
+    await warm_routes()
+    if settings.SMS_DEFERRED_REPLIES:
+        await sms_pipeline.start(processor=sms.process_sms_job)
+    if email_batcher.enabled:
+        await email_batcher.start()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await sms_pipeline.stop()
+    await email_batcher.stop()
+    await close_ai_clients()
+
 
 @app.get("/")
 def home():
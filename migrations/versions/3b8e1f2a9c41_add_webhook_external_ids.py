@@ -0,0 +1,37 @@
+"""add_webhook_external_ids
+
+Revision ID: 3b8e1f2a9c41
+Revises: business_name_fix
+Create Date: 2026-10-17 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3b8e1f2a9c41'
+down_revision: Union[str, Sequence[str], None] = 'business_name_fix'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Twilio MessageSid / CallSid keys so webhook retries are not stored twice
+    op.add_column('messages', sa.Column('external_id', sa.String(length=64), nullable=True))
+    op.create_unique_constraint('uq_messages_external_id', 'messages', ['external_id'])
+
+    op.add_column('voice_messages', sa.Column('external_id', sa.String(length=128), nullable=True))
+    op.create_unique_constraint('uq_voice_messages_external_id', 'voice_messages', ['external_id'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_constraint('uq_voice_messages_external_id', 'voice_messages', type_='unique')
+    op.drop_column('voice_messages', 'external_id')
+
+    op.drop_constraint('uq_messages_external_id', 'messages', type_='unique')
+    op.drop_column('messages', 'external_id')
@@ -0,0 +1,29 @@
+"""add_message_reply_source
+
+Revision ID: 5e9a7b3c2d18
+Revises: 8d2c4e6f1a37
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5e9a7b3c2d18'
+down_revision: Union[str, Sequence[str], None] = '8d2c4e6f1a37'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Where a stored reply came from (ai, reply_cache, semantic_cache, appointment)
+    op.add_column('messages', sa.Column('reply_source', sa.String(length=20), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('messages', 'reply_source')
@@ -0,0 +1,29 @@
+"""add_channel_ai_cache_enabled
+
+Revision ID: 8d2c4e6f1a37
+Revises: 3b8e1f2a9c41
+Create Date: 2026-10-17 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8d2c4e6f1a37'
+down_revision: Union[str, Sequence[str], None] = '3b8e1f2a9c41'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Per-channel opt-out of the AI reply cache
+    op.add_column('channels', sa.Column('ai_cache_enabled', sa.Boolean(), server_default=sa.text('true'), nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('channels', 'ai_cache_enabled')
@@ -0,0 +1,29 @@
+"""add_tenant_ai_core_prompt
+
+Revision ID: a41f6d8b9e25
+Revises: 5e9a7b3c2d18
+Create Date: 2026-10-17 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a41f6d8b9e25'
+down_revision: Union[str, Sequence[str], None] = '5e9a7b3c2d18'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # System prompt without the FAQ list; filled in the next time the tenant runs setup
+    op.add_column('tenants', sa.Column('ai_core_prompt', sa.Text(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('tenants', 'ai_core_prompt')
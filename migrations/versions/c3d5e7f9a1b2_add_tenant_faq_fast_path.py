@@ -0,0 +1,31 @@
+"""add_tenant_faq_fast_path
+
+Revision ID: c3d5e7f9a1b2
+Revises: a41f6d8b9e25
+Create Date: 2026-10-17 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c3d5e7f9a1b2'
+down_revision: Union[str, Sequence[str], None] = 'a41f6d8b9e25'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Per-tenant zero-LLM FAQ answers (off by default)
+    op.add_column('tenants', sa.Column('faq_fast_path_enabled', sa.Boolean(), server_default=sa.text('false'), nullable=False))
+    op.add_column('tenants', sa.Column('faq_fast_path_threshold', sa.Float(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('tenants', 'faq_fast_path_threshold')
+    op.drop_column('tenants', 'faq_fast_path_enabled')
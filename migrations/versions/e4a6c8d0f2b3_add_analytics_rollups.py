@@ -0,0 +1,33 @@
+"""add_analytics_rollups
+
+Revision ID: e4a6c8d0f2b3
+Revises: c3d5e7f9a1b2
+Create Date: 2026-10-17 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e4a6c8d0f2b3'
+down_revision: Union[str, Sequence[str], None] = 'c3d5e7f9a1b2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Rollup rows per tenant / day / channel type (fill with: python backfill_analytics.py)
+    op.add_column('analytics', sa.Column('channel_type', sa.String(length=50), server_default='other', nullable=False))
+    op.create_unique_constraint(
+        'uq_analytics_tenant_period_channel', 'analytics', ['tenant_id', 'period_start', 'channel_type']
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_constraint('uq_analytics_tenant_period_channel', 'analytics', type_='unique')
+    op.drop_column('analytics', 'channel_type')
@@ -0,0 +1,54 @@
+"""add_tenant_time_indexes
+
+Revision ID: f5b7d9e1a3c4
+Revises: e4a6c8d0f2b3
+Create Date: 2026-10-17 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f5b7d9e1a3c4'
+down_revision: Union[str, Sequence[str], None] = 'e4a6c8d0f2b3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# name, table, columns, partial index predicate
+INDEXES = [
+    # list endpoints and analytics: WHERE tenant_id = ? ORDER BY created_at
+    ('ix_messages_tenant_created', 'messages', ['tenant_id', 'created_at'], None),
+    ('ix_voice_messages_tenant_created', 'voice_messages', ['tenant_id', 'created_at'], None),
+    ('ix_appointments_tenant_created', 'appointments', ['tenant_id', 'created_at'], None),
+    # per-channel lists and conversation history
+    ('ix_messages_tenant_channel_created', 'messages', ['tenant_id', 'channel_id', 'created_at'], None),
+    ('ix_voice_messages_tenant_channel_created', 'voice_messages', ['tenant_id', 'channel_id', 'created_at'], None),
+    # inbound webhook routing looks channels up by (type, identifier) without a tenant
+    ('ix_channels_type_identifier', 'channels', ['type', 'identifier'], None),
+    # slot availability only checks bookings that still hold their slot
+    ('ix_appointments_tenant_confirmed_open', 'appointments', ['tenant_id', 'confirmed_time'],
+     "status IN ('pending', 'confirmed')"),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # CONCURRENTLY so writes to the big tables are not blocked while the indexes build
+    with op.get_context().autocommit_block():
+        for name, table, columns, where in INDEXES:
+            op.create_index(
+                name, table, columns,
+                postgresql_concurrently=True,
+                postgresql_where=sa.text(where) if where else None,
+                if_not_exists=True
+            )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for name, table, _, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
@@ -2,7 +2,7 @@ import uuid
 from datetime import datetime
 from sqlalchemy import (
     Column, String, DateTime, Boolean, ForeignKey, Text, Float, JSON, Integer,
-    UniqueConstraint
+    UniqueConstraint, Index, text
 )
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
@@ -29,7 +29,10 @@ class Tenant(Base):
     # AI settings
     ai_provider = Column(String(50), default="openai")
     ai_system_prompt = Column(Text, nullable=True)
+    ai_core_prompt = Column(Text, nullable=True)  # system prompt without the FAQ list (FAQ retrieval mode)
     faqs = Column(JSON, nullable=True)
+    faq_fast_path_enabled = Column(Boolean, default=False, server_default="false", nullable=False)  # answer strong FAQ matches without the LLM
+    faq_fast_path_threshold = Column(Float, nullable=True)  # 0..1, settings.FAQ_FAST_PATH_THRESHOLD when null
     services = Column(JSON, nullable=True)
     escalation_phone = Column(String(50), nullable=True)
 
@@ -64,6 +67,7 @@ class Channel(Base):
     identifier = Column(String(255), nullable=False)  # phone number, email address, etc.
     description = Column(String(255), nullable=True)
     status = Column(String(50), default="active")
+    ai_cache_enabled = Column(Boolean, default=True, server_default="true", nullable=False)  # reuse cached AI replies
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -72,7 +76,10 @@ class Channel(Base):
     voice_messages = relationship("VoiceMessage", back_populates="channel", cascade="all, delete-orphan")
     appointments = relationship("Appointment", back_populates="channel", cascade="all, delete-orphan")
 
-    __table_args__ = (UniqueConstraint('tenant_id', 'type', 'identifier', name='uq_tenant_type_identifier'),)
+    __table_args__ = (
+        UniqueConstraint('tenant_id', 'type', 'identifier', name='uq_tenant_type_identifier'),
+        Index('ix_channels_type_identifier', 'type', 'identifier'),  # inbound webhook routing
+    )
 
 
 # MESSAGES (single table for all channels: SMS, email, chat)
@@ -90,11 +97,19 @@ class Message(Base):
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     escalated_to_human = Column(Boolean, default=False)
     customer_contact = Column(String(255), nullable=True)  # phone number, email, etc.
+    external_id = Column(String(64), nullable=True)  # provider message id (Twilio MessageSid) for webhook dedupe
+    reply_source = Column(String(20), nullable=True)  # ai, ai_history, faq, reply_cache, semantic_cache, coalesced, appointment
 
     tenant = relationship("Tenant", back_populates="messages")
     channel = relationship("Channel", back_populates="messages")
     escalation = relationship("Escalation", back_populates="message", uselist=False, cascade="all, delete-orphan")
 
+    __table_args__ = (
+        UniqueConstraint('external_id', name='uq_messages_external_id'),
+        Index('ix_messages_tenant_created', 'tenant_id', 'created_at'),
+        Index('ix_messages_tenant_channel_created', 'tenant_id', 'channel_id', 'created_at'),
+    )
+
 
 # VOICE MESSAGES (for inbound calls transcribed)
 class VoiceMessage(Base):
@@ -106,12 +121,19 @@ class VoiceMessage(Base):
     transcription = Column(Text, nullable=True)
     ai_response = Column(Text, nullable=True)
     confidence_score = Column(Float, nullable=True)
+    external_id = Column(String(128), nullable=True)  # CallSid + per-turn webhook token, for dedupe
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     tenant = relationship("Tenant", back_populates="voice_messages")
     channel = relationship("Channel", back_populates="voice_messages")
 
+    __table_args__ = (
+        UniqueConstraint('external_id', name='uq_voice_messages_external_id'),
+        Index('ix_voice_messages_tenant_created', 'tenant_id', 'created_at'),
+        Index('ix_voice_messages_tenant_channel_created', 'tenant_id', 'channel_id', 'created_at'),
+    )
+
 
 # KNOWLEDGE BASE (per-tenant documents with embedding JSON)
 class KnowledgeBase(Base):
@@ -152,7 +174,8 @@ class Analytics(Base):
     __tablename__ = "analytics"
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     tenant_id = Column(UUID(as_uuid=True), ForeignKey("tenants.id"), nullable=False)
-    period_start = Column(DateTime, nullable=False)
+    period_start = Column(DateTime, nullable=False)  # day, or 1970-01-01 for the lifetime row
+    channel_type = Column(String(50), nullable=False, server_default="other")  # sms, email, chat, voice
     total_messages = Column(Integer, default=0)
     ai_resolved = Column(Integer, default=0)
     escalated = Column(Integer, default=0)
@@ -161,6 +184,10 @@ class Analytics(Base):
 
     tenant = relationship("Tenant", back_populates="analytics")
 
+    __table_args__ = (
+        UniqueConstraint('tenant_id', 'period_start', 'channel_type', name='uq_analytics_tenant_period_channel'),
+    )
+
 
 # APPOINTMENT (appointment booking flows created by AI)
 class Appointment(Base):
@@ -181,4 +208,13 @@ class Appointment(Base):
 
     # relationships
     tenant = relationship("Tenant", back_populates="appointments")
-    channel = relationship("Channel", back_populates="appointments")
\ No newline at end of file
+    channel = relationship("Channel", back_populates="appointments")
+
+    __table_args__ = (
+        Index('ix_appointments_tenant_created', 'tenant_id', 'created_at'),
+        # slot availability checks only look at bookings that still hold their slot
+        Index(
+            'ix_appointments_tenant_confirmed_open', 'tenant_id', 'confirmed_time',
+            postgresql_where=text("status IN ('pending', 'confirmed')")
+        ),
+    )
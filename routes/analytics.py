@@ -1,10 +1,13 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
-from sqlalchemy import func, cast, Date
+from sqlalchemy import select, union_all, literal, null
 from sqlalchemy.exc import SQLAlchemyError
 from database import get_db
 from models import Tenant, Channel, Message, VoiceMessage
 from auth.dependencies import get_current_tenant
+from services.analytics_rollup import read_rollups, VOICE
+from services.aggregates import count_by_day
+from config import settings
 from schemas.analytics import BasicAnalyticsResponse, MessageOverTimeItem
 from datetime import datetime, timedelta
 from typing import Dict
@@ -12,6 +15,54 @@ from typing import Dict
 router = APIRouter()
 
 
+def _raw_counts(db: Session, tenant_id, fourteen_days_ago) -> Dict:
+    """
+    Dashboard numbers counted from the message tables (ANALYTICS_ROLLUPS_ENABLED
+    off): one pass over the tenant's messages and voice messages.
+    """
+    rows = union_all(
+        select(
+            literal("message").label("kind"),
+            Channel.type.label("channel_type"),
+            Message.status,
+            Message.escalated_to_human,
+            Message.created_at
+        ).select_from(Message).outerjoin(Channel, Channel.id == Message.channel_id).where(Message.tenant_id == tenant_id),
+        select(
+            literal("voice"), null(), null(), literal(False), VoiceMessage.created_at
+        ).where(VoiceMessage.tenant_id == tenant_id)
+    ).subquery()
+    is_message = rows.c.kind == "message"
+    totals, daily = count_by_day(db, rows, {
+        "total_messages": is_message,
+        # AI Resolved: status='replied' OR escalated_to_human=False
+        "ai_resolved": is_message & ((rows.c.status == "replied") | (rows.c.escalated_to_human == False)),
+        "escalated": is_message & (rows.c.escalated_to_human == True),
+        "sms_count": is_message & (rows.c.channel_type == "sms"),
+        "email_count": is_message & (rows.c.channel_type == "email"),
+        "chat_count": is_message & (rows.c.channel_type == "chat"),
+        "voice_count": rows.c.kind == "voice",
+    }, rows.c.created_at, fourteen_days_ago)
+    return {**totals, "daily": {day: counts["total_messages"] for day, counts in daily.items()}}
+
+
+def _rollup_counts(db: Session, tenant_id, fourteen_days_ago) -> Dict:
+    """Dashboard numbers from the analytics rollup rows (a few dozen rows per tenant)."""
+    rollups = read_rollups(db, tenant_id, fourteen_days_ago)
+    totals = rollups["totals"]
+    messages = [row for channel_type, row in totals.items() if channel_type != VOICE]
+    return {
+        "total_messages": sum(row["total_messages"] for row in messages),
+        "ai_resolved": sum(row["ai_resolved"] for row in messages),
+        "escalated": sum(row["escalated"] for row in messages),
+        "sms_count": totals.get("sms", {}).get("total_messages", 0),
+        "email_count": totals.get("email", {}).get("total_messages", 0),
+        "chat_count": totals.get("chat", {}).get("total_messages", 0),
+        "voice_count": totals.get(VOICE, {}).get("total_messages", 0),
+        "daily": rollups["daily"],
+    }
+
+
 @router.get("/basic", response_model=BasicAnalyticsResponse)
 def get_basic_analytics(
     current_tenant: Tenant = Depends(get_current_tenant),
@@ -22,88 +73,17 @@ def get_basic_analytics(
     """
     try:
         tenant_id = current_tenant.id
-        # 1. Total Messages (all channels)
-        total_messages = db.query(func.count(Message.id)).filter(
-            Message.tenant_id == tenant_id
-        ).scalar() or 0
-
-        # 2. AI Resolved: status='replied' OR escalated_to_human=False
-        ai_resolved = db.query(func.count(Message.id)).filter(
-            Message.tenant_id == tenant_id,
-            (Message.status == 'replied') | (Message.escalated_to_human == False)
-        ).scalar() or 0
-
-        # 3. Escalated count
-        escalated = db.query(func.count(Message.id)).filter(
-            Message.tenant_id == tenant_id,
-            Message.escalated_to_human == True
-        ).scalar() or 0
-
-        # 4.Get all channels for this tenant
-        channels = db.query(Channel).filter(
-            Channel.tenant_id == tenant_id
-        ).all()
-
-        # Create channel type mapping
-        channel_type_map: Dict[str, list] = {
-            "sms": [],
-            "email": [],
-            "chat": []
-        }
-        for ch in channels:
-            if ch.type in channel_type_map:
-                channel_type_map[ch.type].append(ch.id)
-
-        # Count messages by channel type
-        sms_count = 0
-        email_count = 0
-        chat_count = 0
-
-        if channel_type_map["sms"]:
-            sms_count = db.query(func.count(Message.id)).filter(
-                Message.tenant_id == tenant_id,
-                Message.channel_id.in_(channel_type_map["sms"])
-            ).scalar() or 0
-
-        if channel_type_map["email"]:
-            email_count = db.query(func.count(Message.id)).filter(
-                Message.tenant_id == tenant_id,
-                Message.channel_id.in_(channel_type_map["email"])
-            ).scalar() or 0
-
-        if channel_type_map["chat"]:
-            chat_count = db.query(func.count(Message.id)).filter(
-                Message.tenant_id == tenant_id,
-                Message.channel_id.in_(channel_type_map["chat"])
-            ).scalar() or 0
-
-        # 5. Voice count from voice_messages table
-        voice_count = db.query(func.count(VoiceMessage.id)).filter(
-            VoiceMessage.tenant_id == tenant_id
-        ).scalar() or 0
-
-        # 6. Messages over time (last 14 days)
+        # Messages over time covers the last 14 days
         today = datetime.utcnow().date()
         fourteen_days_ago = today - timedelta(days=13)
 
-        # Query messages grouped by day
-        daily_counts = db.query(
-            cast(Message.created_at, Date).label('day'),
-            func.count(Message.id).label('count')
-        ).filter(
-            Message.tenant_id == tenant_id,
-            cast(Message.created_at, Date) >= fourteen_days_ago,
-            cast(Message.created_at, Date) <= today
-        ).group_by(
-            cast(Message.created_at, Date)
-        ).order_by(
-            cast(Message.created_at, Date)
-        ).all()
-
-        # Create a dict for quick lookup
-        counts_dict = {str(row.day): row.count for row in daily_counts}
+        if settings.ANALYTICS_ROLLUPS_ENABLED:
+            counts = _rollup_counts(db, tenant_id, fourteen_days_ago)
+        else:
+            counts = _raw_counts(db, tenant_id, fourteen_days_ago)
 
         # Build full 14-day list with 0 for missing days
+        counts_dict = counts.pop("daily")
         messages_over_time = []
         for i in range(14):
             day = fourteen_days_ago + timedelta(days=i)
@@ -115,20 +95,10 @@ def get_basic_analytics(
                 )
             )
 
-        return BasicAnalyticsResponse(
-            total_messages=total_messages,
-            ai_resolved=ai_resolved,
-            escalated=escalated,
-            sms_count=sms_count,
-            email_count=email_count,
-            chat_count=chat_count,
-            voice_count=voice_count,
-            messages_over_time=messages_over_time
-        )
+        return BasicAnalyticsResponse(**counts, messages_over_time=messages_over_time)
 
     except SQLAlchemyError as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Database error: Failed to retrieve analytics"
         )
-
@@ -1,10 +1,13 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Query
 from sqlalchemy.orm import Session
-from sqlalchemy import func, cast, Date, or_
+from sqlalchemy import or_
 from sqlalchemy.exc import SQLAlchemyError
 from database import get_db
 from models import Tenant, Appointment
 from auth.dependencies import get_current_tenant
+from services.aggregates import count_by_day
+from services.pagination import keyset_page, list_totals, InvalidCursor
+from config import settings
 from schemas.appointments import (
     AppointmentResponse,
     AppointmentListResponse,
@@ -51,11 +54,15 @@ def get_appointments(
     status: Optional[str] = Query(None, pattern="^(pending|confirmed|completed|canceled)$"),
     service: Optional[str] = Query(None),
     search: Optional[str] = Query(None, description="Search by customer name or contact"),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    limit: int = Query(settings.LIST_DEFAULT_LIMIT, ge=1, le=settings.LIST_MAX_LIMIT),
+    include_total: bool = Query(False, description="Also return the (cached, approximate) total"),
     current_tenant: Tenant = Depends(get_current_tenant),
     db: Session = Depends(get_db)
 ):
     """
-    Get all appointments for the authenticated tenant with optional filters.
+    Get appointments for the authenticated tenant with optional filters, one page at a time.
+    Ordered by created_at descending; pass next_cursor to get the next page.
     """
     try:
         query = db.query(Appointment).filter(
@@ -80,16 +87,25 @@ def get_appointments(
             )
 
         # Order by created_at DESC
-        appointments = query.order_by(Appointment.created_at.desc()).all()
+        try:
+            appointments, next_cursor = keyset_page(query, Appointment.created_at, Appointment.id, cursor, limit)
+        except InvalidCursor:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        total = None
+        if include_total:
+            key = ("appointments", current_tenant.id, start_date, end_date, status, service, search)
+            total = list_totals.get(key, query.count)
 
         return AppointmentListResponse(
             appointments=[appointment_to_response(apt) for apt in appointments],
-            total=len(appointments)
+            next_cursor=next_cursor,
+            total=total
         )
 
     except SQLAlchemyError:
+        # (the `status` filter parameter shadows fastapi.status here)
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            status_code=500,
             detail="Database error: Failed to retrieve appointments"
         )
 
@@ -111,36 +127,19 @@ def get_appointment_summary(
         today = datetime.utcnow().date()
         start_date = today - timedelta(days=days - 1)
 
-        # Base query for date range
-        base_query = db.query(Appointment).filter(
-            Appointment.tenant_id == tenant_id,
-            cast(Appointment.created_at, Date) >= start_date,
-            cast(Appointment.created_at, Date) <= today
-        )
-
-        # Count by status
-        total = base_query.count()
-        pending = base_query.filter(Appointment.status == "pending").count()
-        confirmed = base_query.filter(Appointment.status == "confirmed").count()
-        completed = base_query.filter(Appointment.status == "completed").count()
-        canceled = base_query.filter(Appointment.status == "canceled").count()
-
-        # Trend: group by day
-        daily_counts = db.query(
-            cast(Appointment.created_at, Date).label('day'),
-            func.count(Appointment.id).label('count')
-        ).filter(
+        # Counts by status and per day, in one pass over the date range
+        totals, daily = count_by_day(db, Appointment, {
+            "total": None,
+            "pending": Appointment.status == "pending",
+            "confirmed": Appointment.status == "confirmed",
+            "completed": Appointment.status == "completed",
+            "canceled": Appointment.status == "canceled",
+        }, Appointment.created_at, start_date, where=(
             Appointment.tenant_id == tenant_id,
-            cast(Appointment.created_at, Date) >= start_date,
-            cast(Appointment.created_at, Date) <= today
-        ).group_by(
-            cast(Appointment.created_at, Date)
-        ).order_by(
-            cast(Appointment.created_at, Date)
-        ).all()
-
-        # Create dict for lookup
-        counts_dict = {str(row.day): row.count for row in daily_counts}
+            Appointment.created_at >= datetime.combine(start_date, datetime.min.time()),
+            Appointment.created_at < datetime.combine(today + timedelta(days=1), datetime.min.time())
+        ))
+        counts_dict = {day: counts["total"] for day, counts in daily.items()}
 
         # Build full trend with 0 for missing days
         trend = []
@@ -149,14 +148,7 @@ def get_appointment_summary(
             day_str = str(day)
             trend.append(TrendItem(date=day_str, count=counts_dict.get(day_str, 0)))
 
-        return AppointmentSummaryResponse(
-            total=total,
-            pending=pending,
-            confirmed=confirmed,
-            completed=completed,
-            canceled=canceled,
-            trend=trend
-        )
+        return AppointmentSummaryResponse(**totals, trend=trend)
 
     except SQLAlchemyError:
         raise HTTPException(
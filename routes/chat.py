@@ -1,19 +1,28 @@
-from fastapi import APIRouter, Depends, HTTPException, Request
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
 from models import Tenant, Channel, Message
-from ai_providers import get_ai_response
+from services.responder import generate_ai_reply, stream_ai_reply, stream_ttfb, faq_fast_path_threshold
+from services.conversation import ConversationKey
 from datetime import datetime
 from uuid import UUID
-from database import get_db
+from database import get_async_db, AsyncSessionLocal
+from contextlib import aclosing
+from typing import Tuple, Dict, Any, AsyncIterator
+import asyncio
+import json
+import logging
+import time
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
+
+# Background saves for streams the client abandoned (kept referenced until done)
+_pending_saves: set = set()
 
-@router.post("/receive")
-async def receive_chat(request: Request, db: Session = Depends(get_db)):
-    data = await request.json()
-    channel_id = data.get("channel_id")
-    message_text = data.get("message_text")
 
+async def _load_chat_channel(db: AsyncSession, channel_id, message_text) -> Tuple[Channel, Tenant]:
     if not channel_id:
         raise HTTPException(status_code=400, detail="channel_id is required")
     if not message_text:
@@ -24,41 +33,70 @@ async def receive_chat(request: Request, db: Session = Depends(get_db)):
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid channel_id UUID format")
 
-    channel = db.query(Channel).filter(Channel.id == channel_uuid).first()
+    channel = await db.get(Channel, channel_uuid)
     if not channel:
         raise HTTPException(status_code=404, detail=f"Channel {channel_id} not found")
 
     # Get the tenant for AI settings
-    tenant = db.query(Tenant).filter(Tenant.id == channel.tenant_id).first()
+    tenant = await db.get(Tenant, channel.tenant_id)
     if not tenant:
         raise HTTPException(status_code=404, detail="Tenant not found")
+    return channel, tenant
 
-    # Get AI response
-    ai_reply, confidence = get_ai_response(
+
+def _reply_args(tenant: Tenant, channel: Channel, data: dict) -> Dict[str, Any]:
+    """
+    Arguments for generate_ai_reply / stream_ai_reply from the tenant's settings.
+    Anonymous chats (no customer_contact) get no conversation memory.
+    """
+    message_text = data["message_text"]
+    contact = data.get("customer_contact")
+    return dict(
+        tenant_id=tenant.id,
         message_text=message_text,
-        ai_provider=tenant.ai_provider or "openai",
-        system_prompt=tenant.ai_system_prompt or ""
+        ai_provider=tenant.ai_provider,
+        system_prompt=tenant.ai_system_prompt,
+        use_cache=channel.ai_cache_enabled,
+        core_prompt=tenant.ai_core_prompt,
+        faqs=tenant.faqs,
+        services=tenant.services,
+        faq_fast_path_threshold=faq_fast_path_threshold(tenant.faq_fast_path_enabled, tenant.faq_fast_path_threshold),
+        conversation=ConversationKey(tenant.id, channel.id, contact) if contact else None
     )
 
+
+async def _save_chat_message(
+    db: AsyncSession,
+    tenant_id,
+    channel_id,
+    data: dict,
+    ai_reply: str,
+    confidence: float,
+    reply_source: str
+) -> Message:
     # Determine status based on confidence
     status = "replied" if confidence > 0.7 else "escalated"
 
     message = Message(
-        tenant_id=tenant.id,
-        channel_id=channel.id,
+        tenant_id=tenant_id,
+        channel_id=channel_id,
         direction=data.get("direction", "incoming"),
-        message_text=message_text,
+        message_text=data.get("message_text"),
         ai_response=ai_reply,
         confidence_score=confidence,
+        reply_source=reply_source,
         status=status,
         escalated_to_human=confidence <= 0.7,
         customer_contact=data.get("customer_contact", "anonymous")
     )
 
     db.add(message)
-    db.commit()
-    db.refresh(message)
+    await db.commit()
+    await db.refresh(message)
+    return message
+
 
+def _message_payload(message: Message, ai_reply: str, confidence: float, provider: str) -> Dict[str, Any]:
     return {
         "id": str(message.id),
         "tenant_id": str(message.tenant_id),
@@ -67,6 +105,118 @@ async def receive_chat(request: Request, db: Session = Depends(get_db)):
         "ai_reply": ai_reply,
         "confidence": confidence,
         "status": message.status,
-        "provider_used": tenant.ai_provider,
+        "provider_used": provider,
         "created_at": message.created_at.isoformat(),
-    }
\ No newline at end of file
+    }
+
+
+@router.post("/receive")
+async def receive_chat(request: Request, db: AsyncSession = Depends(get_async_db)):
+    data = await request.json()
+    channel, tenant = await _load_chat_channel(db, data.get("channel_id"), data.get("message_text"))
+
+    # Get AI response
+    ai_reply, confidence, reply_source = await generate_ai_reply(**_reply_args(tenant, channel, data))
+
+    message = await _save_chat_message(db, tenant.id, channel.id, data, ai_reply, confidence, reply_source)
+    return _message_payload(message, ai_reply, confidence, tenant.ai_provider)
+
+
+# ==========================================
+# Streaming chat (SSE + WebSocket)
+# ==========================================
+async def _save_abandoned(tenant_id, channel_id, data: dict, partial_reply: str, reply_stream) -> None:
+    """Record an exchange whose client disconnected mid-stream (as escalated) and stop the provider stream."""
+    try:
+        await reply_stream.aclose()
+        async with AsyncSessionLocal() as db:
+            await _save_chat_message(db, tenant_id, channel_id, data, partial_reply, 0.0, reply_stream.source)
+    except Exception as e:
+        logger.error(f"Failed to save abandoned chat stream: {e}")
+
+
+async def _chat_stream(data: dict, started: float) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Yields ("token", {"text": ...}) events while the reply is generated, then
+    one ("done", message payload) after the Message row is saved. The row is
+    written once, when the stream closes.
+    """
+    async with AsyncSessionLocal() as db:
+        channel, tenant = await _load_chat_channel(db, data.get("channel_id"), data.get("message_text"))
+
+    reply = stream_ai_reply(**_reply_args(tenant, channel, data))
+    sent = []
+    completed = False
+    try:
+        async for text in reply:
+            if not sent:
+                stream_ttfb.add(time.perf_counter() - started)
+            sent.append(text)
+            yield "token", {"text": text}
+        completed = True
+    finally:
+        if not completed:
+            # Client went away: awaiting here would be cancelled, so save in the background
+            task = asyncio.create_task(_save_abandoned(tenant.id, channel.id, data, "".join(sent), reply))
+            _pending_saves.add(task)
+            task.add_done_callback(_pending_saves.discard)
+
+    async with AsyncSessionLocal() as db:
+        message = await _save_chat_message(db, tenant.id, channel.id, data, reply.reply, reply.confidence, reply.source)
+    yield "done", _message_payload(message, reply.reply, reply.confidence, tenant.ai_provider)
+
+
+@router.post("/stream")
+async def stream_chat(request: Request):
+    """
+    Same request body as /receive; answers with Server-Sent Events:
+    `token` events carry reply text as the provider streams it, a final
+    `done` event carries the saved message (same fields as /receive).
+    """
+    started = time.perf_counter()
+    data = await request.json()
+    stream = _chat_stream(data, started)
+    # Resolve the channel up front so bad requests still get a 4xx instead of a broken stream
+    try:
+        first_event = await stream.__anext__()
+    except StopAsyncIteration:
+        first_event = None
+
+    async def events():
+        async with aclosing(stream):
+            if first_event is not None:
+                yield _sse(*first_event)
+            async for event in stream:
+                yield _sse(*event)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+def _sse(event: str, payload: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+
+@router.websocket("/ws")
+async def chat_websocket(websocket: WebSocket):
+    """
+    Send {"channel_id", "message_text", ...} (same fields as /receive) per
+    message; receive {"type": "token", "text"} frames, then {"type": "done", ...}
+    with the saved message, or {"type": "error", "status", "detail"}.
+    """
+    await websocket.accept()
+    try:
+        while True:
+            data = await websocket.receive_json()
+            started = time.perf_counter()
+            try:
+                async with aclosing(_chat_stream(data, started)) as stream:
+                    async for event, payload in stream:
+                        await websocket.send_json({"type": event, **payload})
+            except HTTPException as e:
+                await websocket.send_json({"type": "error", "status": e.status_code, "detail": e.detail})
+    except WebSocketDisconnect:
+        pass
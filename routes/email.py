@@ -1,7 +1,9 @@
-from fastapi import APIRouter, Request, HTTPException, Depends, status
+from fastapi import APIRouter, Request, HTTPException, Depends, Query, status
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import SQLAlchemyError
-from database import SessionLocal, get_db
+from sqlalchemy import select
+from database import AsyncSessionLocal, get_db
 from models import Tenant, Channel, Message
 from auth.dependencies import get_current_tenant
 from schemas.email import (
@@ -11,7 +13,11 @@ from schemas.email import (
     SendEmailResponse,
     ReceiveEmailRequest
 )
-from ai_providers import get_ai_response
+from services.responder import generate_ai_reply, faq_fast_path_threshold
+from services.conversation import ConversationKey
+from services.email_batch import email_batcher
+from services.pagination import keyset_page, list_totals, InvalidCursor
+from config import settings
 import uuid
 from datetime import datetime
 from typing import Optional
@@ -52,17 +58,48 @@ def get_or_create_email_channel(db: Session, tenant: Tenant) -> Channel:
     return channel
 
 
+async def get_or_create_email_channel_async(db: AsyncSession, tenant: Tenant) -> Channel:
+    """Async variant of get_or_create_email_channel for the webhook path."""
+    channel = await db.scalar(
+        select(Channel).where(
+            Channel.tenant_id == tenant.id,
+            Channel.type == "email"
+        ).limit(1)
+    )
+
+    if not channel:
+        # Auto-create email channel
+        email_identifier = f"support@{tenant.business_name.lower().replace(' ', '')}.com"
+        channel = Channel(
+            id=uuid.uuid4(),
+            tenant_id=tenant.id,
+            type="email",
+            identifier=email_identifier,
+            description="Auto-created email channel",
+            status="active",
+            created_at=datetime.utcnow(),
+            updated_at=datetime.utcnow()
+        )
+        db.add(channel)
+        await db.commit()
+
+    return channel
+
+
 # ==========================================
 # 1️⃣ GET /email/messages - Get all emails for tenant
 # ==========================================
 @router.get("/messages", response_model=EmailMessageListResponse)
 def get_email_messages(
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    limit: int = Query(settings.LIST_DEFAULT_LIMIT, ge=1, le=settings.LIST_MAX_LIMIT),
+    include_total: bool = Query(False, description="Also return the (cached, approximate) total"),
     current_tenant: Tenant = Depends(get_current_tenant),
     db: Session = Depends(get_db)
 ):
     """
-    Get all email messages for the authenticated tenant.
-    Returns emails ordered by created_at descending (most recent first).
+    Get email messages for the authenticated tenant, one page at a time.
+    Returns emails ordered by created_at descending (most recent first); pass next_cursor to get the next page.
     """
     try:
         # Get email channels for this tenant
@@ -72,17 +109,22 @@ def get_email_messages(
         ).all()
 
         if not email_channels:
-            return EmailMessageListResponse(emails=[], total=0)
+            return EmailMessageListResponse(emails=[], total=0 if include_total else None)
 
         channel_ids = [ch.id for ch in email_channels]
         # Map channel identifiers for from/to email resolution
         channel_map = {ch.id: ch.identifier for ch in email_channels}
 
         # Query messages for email channels
-        messages = db.query(Message).filter(
+        query = db.query(Message).filter(
             Message.tenant_id == current_tenant.id,
             Message.channel_id.in_(channel_ids)
-        ).order_by(Message.created_at.desc()).all()
+        )
+        try:
+            messages, next_cursor = keyset_page(query, Message.created_at, Message.id, cursor, limit)
+        except InvalidCursor:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        total = list_totals.get(("email", current_tenant.id), query.count) if include_total else None
 
         # Convert to response format
         email_list = []
@@ -110,7 +152,7 @@ def get_email_messages(
                 )
             )
 
-        return EmailMessageListResponse(emails=email_list, total=len(email_list))
+        return EmailMessageListResponse(emails=email_list, next_cursor=next_cursor, total=total)
 
     except SQLAlchemyError:
         raise HTTPException(
@@ -184,7 +226,10 @@ def send_email(
 async def receive_email(request: Request):
     """
     Webhook endpoint for receiving incoming emails.
-    Processes with AI and stores in database.
+    Processes with AI and stores in database. In batch mode
+    (EMAIL_BATCH_MODE with EMAIL_REPLY_WEBHOOK_URL) the email is stored as
+    pending and answered and delivered by the email batcher; the response
+    then only acknowledges it.
     """
     data = await request.json()
     customer_email = data.get("customer_email")
@@ -195,26 +240,56 @@ async def receive_email(request: Request):
     if not customer_email or not message_text or not tenant_id:
         raise HTTPException(status_code=400, detail="Missing required fields")
 
-    db: Session = SessionLocal()
+    db: AsyncSession = AsyncSessionLocal()
     try:
-        tenant = db.query(Tenant).filter(Tenant.id == tenant_id).first()
+        tenant = await db.scalar(select(Tenant).where(Tenant.id == tenant_id))
         if not tenant:
             raise HTTPException(status_code=404, detail="Tenant not found")
 
         # Get or create email channel
-        channel = get_or_create_email_channel(db, tenant)
+        channel = await get_or_create_email_channel_async(db, tenant)
+        full_message = f"[Subject: {subject}]\n\n{message_text}" if subject else message_text
+
+        if email_batcher.enabled:
+            message = Message(
+                id=uuid.uuid4(),
+                tenant_id=tenant.id,
+                channel_id=channel.id,
+                customer_contact=customer_email,
+                message_text=full_message,
+                status="pending",
+                escalated_to_human=False,
+                direction="incoming",
+                created_at=datetime.utcnow(),
+                updated_at=datetime.utcnow()
+            )
+            db.add(message)
+            await db.commit()
+            email_batcher.notify()
+            return {
+                "customer_message": message_text,
+                "subject": subject,
+                "status": "queued",
+                "message_id": str(message.id)
+            }
 
         # Get AI response
-        ai_reply, confidence = get_ai_response(
+        ai_reply, confidence, reply_source = await generate_ai_reply(
+            tenant_id=tenant.id,
             message_text=message_text,
-            ai_provider=tenant.ai_provider or "openai",
-            system_prompt=tenant.ai_system_prompt or "",
+            ai_provider=tenant.ai_provider,
+            system_prompt=tenant.ai_system_prompt,
             model=getattr(tenant, "ai_model", None),
-            temperature=getattr(tenant, "ai_temperature", 0.7)
+            temperature=getattr(tenant, "ai_temperature", 0.7),
+            use_cache=channel.ai_cache_enabled,
+            core_prompt=tenant.ai_core_prompt,
+            faqs=tenant.faqs,
+            services=tenant.services,
+            faq_fast_path_threshold=faq_fast_path_threshold(tenant.faq_fast_path_enabled, tenant.faq_fast_path_threshold),
+            conversation=ConversationKey(tenant.id, channel.id, customer_email)
         )
 
         # Store incoming email
-        full_message = f"[Subject: {subject}]\n\n{message_text}" if subject else message_text
         message = Message(
             id=uuid.uuid4(),
             tenant_id=tenant.id,
@@ -223,6 +298,7 @@ async def receive_email(request: Request):
             message_text=full_message,
             ai_response=ai_reply,
             confidence_score=confidence,
+            reply_source=reply_source,
             status="replied",
             escalated_to_human=False,
             direction="incoming",
@@ -230,7 +306,7 @@ async def receive_email(request: Request):
             updated_at=datetime.utcnow()
         )
         db.add(message)
-        db.commit()
+        await db.commit()
 
         return {
             "customer_message": message_text,
@@ -240,4 +316,4 @@ async def receive_email(request: Request):
             "provider_used": tenant.ai_provider
         }
     finally:
-        db.close()
\ No newline at end of file
+        await db.close()
\ No newline at end of file
@@ -0,0 +1,136 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select, Select
+from models import Tenant, Channel, Message, VoiceMessage, Appointment
+from auth.dependencies import get_current_tenant
+from services.export import export_rows, export_slot_available, FORMATS
+from datetime import datetime
+from typing import Optional
+
+router = APIRouter()
+
+FORMAT_QUERY = Query("ndjson", alias="format", pattern="^(ndjson|csv)$", description="ndjson or csv")
+GZIP_QUERY = Query(False, description="gzip the export on the fly (.gz download)")
+
+
+def _between(statement: Select, created_at, since: Optional[datetime], until: Optional[datetime]) -> Select:
+    if since:
+        statement = statement.where(created_at >= since)
+    if until:
+        statement = statement.where(created_at < until)
+    return statement
+
+
+def _stream(statement: Select, name: str, fmt: str, gzip: bool) -> StreamingResponse:
+    """Stream `statement` as a file download, rows fetched and written batch by batch."""
+    if not export_slot_available():
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many exports in progress, try again shortly"
+        )
+    filename = f"{name}-{datetime.utcnow():%Y%m%d}.{fmt}" + (".gz" if gzip else "")
+    return StreamingResponse(
+        export_rows(statement, fmt, compress=gzip),
+        media_type="application/gzip" if gzip else FORMATS[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
+# ==========================================
+# GET /export/messages - SMS, email and chat history
+# ==========================================
+@router.get("/messages")
+def export_messages(
+    fmt: str = FORMAT_QUERY,
+    gzip: bool = GZIP_QUERY,
+    channel_type: Optional[str] = Query(None, pattern="^(sms|email|chat)$"),
+    since: Optional[datetime] = Query(None, description="Only messages created at or after this time"),
+    until: Optional[datetime] = Query(None, description="Only messages created before this time"),
+    current_tenant: Tenant = Depends(get_current_tenant)
+):
+    """
+    Export the tenant's messages, oldest first, as NDJSON or CSV.
+    Streamed from a server-side cursor, so any history size can be exported.
+    """
+    statement = select(
+        Message.id,
+        Message.created_at,
+        Channel.type.label("channel_type"),
+        Channel.identifier.label("channel_identifier"),
+        Message.direction,
+        Message.customer_contact,
+        Message.message_text,
+        Message.ai_response,
+        Message.confidence_score,
+        Message.status,
+        Message.escalated_to_human,
+        Message.reply_source
+    ).join(Channel, Channel.id == Message.channel_id).where(
+        Message.tenant_id == current_tenant.id
+    ).order_by(Message.created_at, Message.id)
+    if channel_type:
+        statement = statement.where(Channel.type == channel_type)
+    statement = _between(statement, Message.created_at, since, until)
+    return _stream(statement, channel_type or "messages", fmt, gzip)
+
+
+# ==========================================
+# GET /export/calls - Voice call turns
+# ==========================================
+@router.get("/calls")
+def export_calls(
+    fmt: str = FORMAT_QUERY,
+    gzip: bool = GZIP_QUERY,
+    since: Optional[datetime] = Query(None, description="Only turns created at or after this time"),
+    until: Optional[datetime] = Query(None, description="Only turns created before this time"),
+    current_tenant: Tenant = Depends(get_current_tenant)
+):
+    """
+    Export the tenant's voice call turns (transcription + AI reply), oldest first.
+    """
+    statement = select(
+        VoiceMessage.id,
+        VoiceMessage.created_at,
+        Channel.identifier.label("channel_identifier"),
+        VoiceMessage.from_contact,
+        VoiceMessage.transcription,
+        VoiceMessage.ai_response,
+        VoiceMessage.confidence_score
+    ).join(Channel, Channel.id == VoiceMessage.channel_id).where(
+        VoiceMessage.tenant_id == current_tenant.id
+    ).order_by(VoiceMessage.created_at, VoiceMessage.id)
+    statement = _between(statement, VoiceMessage.created_at, since, until)
+    return _stream(statement, "calls", fmt, gzip)
+
+
+# ==========================================
+# GET /export/appointments - Appointments
+# ==========================================
+@router.get("/appointments")
+def export_appointments(
+    fmt: str = FORMAT_QUERY,
+    gzip: bool = GZIP_QUERY,
+    since: Optional[datetime] = Query(None, description="Only appointments created at or after this time"),
+    until: Optional[datetime] = Query(None, description="Only appointments created before this time"),
+    current_tenant: Tenant = Depends(get_current_tenant)
+):
+    """
+    Export the tenant's appointments, oldest first, including the AI conversation.
+    """
+    statement = select(
+        Appointment.id,
+        Appointment.created_at,
+        Appointment.updated_at,
+        Appointment.customer_name,
+        Appointment.customer_contact,
+        Appointment.service,
+        Appointment.requested_time,
+        Appointment.confirmed_time,
+        Appointment.status,
+        Appointment.notes,
+        Appointment.ai_conversation
+    ).where(
+        Appointment.tenant_id == current_tenant.id
+    ).order_by(Appointment.created_at, Appointment.id)
+    statement = _between(statement, Appointment.created_at, since, until)
+    return _stream(statement, "appointments", fmt, gzip)
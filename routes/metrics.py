@@ -0,0 +1,45 @@
+from fastapi import APIRouter
+from services.tenant import tenant_cache_stats
+from services.routing import routing_stats
+from services.sms_queue import sms_pipeline
+from services.email_batch import email_batcher
+from services.idempotency import recent_replies
+from services.reply_cache import reply_cache
+from services.semantic_cache import semantic_cache
+from services.knowledge_index import knowledge_index
+from services.faq_index import faq_index
+from services.bm25 import bm25_index
+from services.conversation import conversation_store
+from services.session import call_sessions
+from services.twiml import twiml_stats
+from services.pagination import list_totals
+from ai_providers import provider_router
+from services.responder import responder_stats
+
+router = APIRouter()
+
+
+@router.get("")
+async def get_metrics():
+    """
+    In-process cache and pipeline counters for this worker.
+    Values are per process and reset on restart.
+    """
+    return {
+        "replies": responder_stats(),
+        "tenant_cache": tenant_cache_stats(),
+        "channel_routing": routing_stats(),
+        "sms_pipeline": await sms_pipeline.stats(),
+        "email_batch": await email_batcher.stats(),
+        "webhook_dedupe": recent_replies.stats(),
+        "reply_cache": reply_cache.stats(),
+        "semantic_cache": semantic_cache.stats(),
+        "knowledge_index": knowledge_index.stats(),
+        "faq_retrieval": faq_index.stats(),
+        "bm25": bm25_index.stats(),
+        "conversations": conversation_store.stats(),
+        "voice_sessions": call_sessions.stats(),
+        "twiml": twiml_stats(),
+        "list_totals": list_totals.stats(),
+        "ai_providers": provider_router.stats(),
+    }
@@ -1,54 +1,64 @@
-from fastapi import APIRouter, Request, HTTPException, Depends
+from fastapi import APIRouter, Request, HTTPException, Depends, Query
 from sqlalchemy.orm import Session
-from sqlalchemy import and_
-from database import SessionLocal, get_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import and_, select, update
+from sqlalchemy.exc import IntegrityError
+from database import AsyncSessionLocal, get_db
 from models import Tenant, Channel, Message, Appointment
-from ai_providers import get_ai_response, parse_appointment_from_user_message
+from ai_providers import parse_appointment_from_user_message
+from services.responder import generate_ai_reply, faq_fast_path_threshold
+from services.conversation import conversation_store, ConversationKey
 from auth.dependencies import get_current_tenant
+from services.routing import resolve_route, ChannelRoute
+from services.sms_queue import sms_pipeline, SMSJob
+from services.idempotency import recent_replies
+from services.twiml import sms_reply
+from services.pagination import keyset_page, list_totals, InvalidCursor
 from schemas.sms import SMSMessageResponse, SMSMessageListResponse, SendSMSRequest, SendSMSResponse
 from datetime import datetime, timedelta
-from twilio.rest import Client
 from twilio.base.exceptions import TwilioRestException
 from config import settings
+from services.notification import twilio_client, send_sms_message
 import uuid
 from fastapi.responses import Response
-from typing import List
+from typing import List, Tuple, Optional
+import logging
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
-# Initialize Twilio client
-twilio_client = None
-if settings.TWILIO_ACCOUNT_SID and settings.TWILIO_AUTH_TOKEN:
-    twilio_client = Client(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN)
 
-
-def check_slot_available(db: Session, tenant_id, requested_time: datetime, duration_minutes: int = 60) -> bool:
+async def check_slot_available(db: AsyncSession, tenant_id, requested_time: datetime, duration_minutes: int = 60) -> bool:
     """Check if the requested time slot is available."""
     slot_end = requested_time + timedelta(minutes=duration_minutes)
-    existing = db.query(Appointment).filter(
-        and_(
-            Appointment.tenant_id == tenant_id,
-            Appointment.status.in_(["confirmed", "pending"]),
-            Appointment.confirmed_time < slot_end,
-            Appointment.confirmed_time >= requested_time - timedelta(minutes=duration_minutes)
-        )
-    ).first()
+    existing = await db.scalar(
+        select(Appointment.id).where(
+            and_(
+                Appointment.tenant_id == tenant_id,
+                Appointment.status.in_(["confirmed", "pending"]),
+                Appointment.confirmed_time < slot_end,
+                Appointment.confirmed_time >= requested_time - timedelta(minutes=duration_minutes)
+            )
+        ).limit(1)
+    )
     return existing is None
 
 
-def get_available_slots(db: Session, tenant_id, requested_date: datetime, open_hour: int, close_hour: int) -> list:
+async def get_available_slots(db: AsyncSession, tenant_id, requested_date: datetime, open_hour: int, close_hour: int) -> list:
     """Get available time slots for a given date."""
     day_start = requested_date.replace(hour=0, minute=0, second=0, microsecond=0)
     day_end = day_start + timedelta(days=1)
 
-    booked_times = db.query(Appointment.confirmed_time).filter(
-        and_(
-            Appointment.tenant_id == tenant_id,
-            Appointment.status.in_(["confirmed", "pending"]),
-            Appointment.confirmed_time >= day_start,
-            Appointment.confirmed_time < day_end
+    booked_times = (await db.execute(
+        select(Appointment.confirmed_time).where(
+            and_(
+                Appointment.tenant_id == tenant_id,
+                Appointment.status.in_(["confirmed", "pending"]),
+                Appointment.confirmed_time >= day_start,
+                Appointment.confirmed_time < day_end
+            )
         )
-    ).all()
+    )).all()
 
     booked_hours = {bt[0].hour for bt in booked_times if bt[0]}
     available_slots = []
@@ -62,12 +72,119 @@ def get_available_slots(db: Session, tenant_id, requested_date: datetime, open_h
     return available_slots[:3]
 
 
+
+async def generate_sms_reply(db: AsyncSession, route: ChannelRoute, from_number: str, message_text: str) -> Tuple[str, float, str]:
+    """
+    Work out the reply text, confidence and reply source for an inbound SMS.
+    Appointment requests are booked (or answered with free slots) directly;
+    everything else goes to the tenant's AI provider.
+    A booked Appointment is added to `db`; the caller commits.
+    """
+    conversation = ConversationKey(route.tenant_id, route.channel_id, from_number)
+
+    # Get working hours
+    open_hour = int(route.open_time.split(":")[0]) if route.open_time else 9
+    close_hour = int(route.close_time.split(":")[0]) if route.close_time else 17
+
+    # --- Extract Appointment from USER TEXT FIRST ---
+    tenant_settings = {"services": route.services or []}
+    try:
+        appointment_info = parse_appointment_from_user_message(message_text, tenant_settings=tenant_settings)
+    except Exception:
+        appointment_info = None
+
+    # If appointment info detected with both time and service
+    if appointment_info:
+        appointment_time = appointment_info.get("datetime")
+        service_name = appointment_info.get("service")
+
+        if appointment_time and service_name:
+            # Check if within working hours
+            if open_hour <= appointment_time.hour < close_hour:
+                # Check availability
+                if await check_slot_available(db, route.tenant_id, appointment_time):
+                    # SLOT AVAILABLE - Create appointment directly
+                    appointment = Appointment(
+                        id=uuid.uuid4(),
+                        tenant_id=route.tenant_id,
+                        channel_id=route.channel_id,
+                        customer_contact=from_number,
+                        requested_time=appointment_time,
+                        confirmed_time=appointment_time,
+                        service=service_name,
+                        status="confirmed",
+                        created_at=datetime.utcnow(),
+                        updated_at=datetime.utcnow()
+                    )
+                    db.add(appointment)
+
+                    confirmation_text = (
+                        f"Great! Your appointment for {service_name} is confirmed on "
+                        f"{appointment_time.strftime('%A, %B %d, %Y at %I:%M %p')}. "
+                        f"We look forward to seeing you!"
+                    )
+                    conversation_store.append(conversation, message_text, confirmation_text)
+                    return confirmation_text, 1.0, "appointment"
+
+                # SLOT NOT AVAILABLE - Get suggestions
+                available_slots = await get_available_slots(db, route.tenant_id, appointment_time, open_hour, close_hour)
+
+                if available_slots:
+                    slots_text = ", ".join([s.strftime("%I:%M %p") for s in available_slots])
+                    suggestion_text = (
+                        f"Sorry, {appointment_time.strftime('%I:%M %p')} on "
+                        f"{appointment_time.strftime('%B %d')} is not available for {service_name}. "
+                        f"Available times: {slots_text}. Please reply with your preferred time."
+                    )
+                else:
+                    suggestion_text = (
+                        f"Sorry, no availability on {appointment_time.strftime('%B %d')} for {service_name}. "
+                        f"Please try another date."
+                    )
+                conversation_store.append(conversation, message_text, suggestion_text)
+                return suggestion_text, 0.9, "appointment"
+
+            # Outside working hours
+            outside_text = (
+                f"Sorry, we're open {open_hour}:00 AM to {close_hour}:00 PM. "
+                f"Please choose a time within our hours for {service_name}."
+            )
+            conversation_store.append(conversation, message_text, outside_text)
+            return outside_text, 0.9, "appointment"
+
+    # --- NO appointment detected → Regular AI response ---
+    return await generate_ai_reply(
+        tenant_id=route.tenant_id,
+        message_text=message_text,
+        ai_provider=route.ai_provider,
+        system_prompt=route.ai_system_prompt,
+        use_cache=route.ai_cache_enabled,
+        core_prompt=route.ai_core_prompt,
+        faqs=route.faqs,
+        services=route.services,
+        faq_fast_path_threshold=faq_fast_path_threshold(route.faq_fast_path_enabled, route.faq_fast_path_threshold),
+        conversation=conversation
+    )
+
+
+async def _stored_reply(db: AsyncSession, message_sid: str) -> Optional[bytes]:
+    """TwiML for a MessageSid we already stored, or None if it is new."""
+    stored = (await db.execute(
+        select(Message.status, Message.ai_response).where(Message.external_id == message_sid)
+    )).first()
+    if stored is None:
+        return None
+    # Still pending in deferred mode: the worker will send the reply
+    return sms_reply(stored.ai_response if stored.status not in ("pending", "processing") else None)
+
+
 @router.post("/receive")
 async def receive_sms(request: Request):
     data = await request.form()
     from_number = data.get("From")
     message_text = data.get("Body")
     to_number = data.get("To")
+    message_sid = data.get("MessageSid")
 
     if not from_number or not message_text or not to_number:
         raise HTTPException(
@@ -75,197 +192,147 @@ async def receive_sms(request: Request):
             detail=f"Missing required fields. Got From={from_number}, Body={message_text}, To={to_number}"
         )
 
-    db: Session = SessionLocal()
-    try:
-        # Get channel
-        channel = db.query(Channel).filter(
-            Channel.type == "sms",
-            Channel.identifier == to_number
-        ).first()
-
-        if not channel:
-            raise HTTPException(status_code=404, detail=f"SMS channel for {to_number} not found")
-
-        # Get tenant
-        tenant = db.query(Tenant).filter(Tenant.id == channel.tenant_id).first()
-        if not tenant:
-            raise HTTPException(status_code=404, detail="Tenant not found")
-
-        # Get working hours
-        open_hour = int(tenant.open_time.split(":")[0]) if tenant.open_time else 9
-        close_hour = int(tenant.close_time.split(":")[0]) if tenant.close_time else 17
-
-        # --- Extract Appointment from USER TEXT FIRST ---
-        tenant_settings = {"services": tenant.services or []}
-        try:
-            appointment_info = parse_appointment_from_user_message(message_text, tenant_settings=tenant_settings)
-        except Exception:
-            appointment_info = None
-
-        # If appointment info detected with both time and service
-        if appointment_info:
-            appointment_time = appointment_info.get("datetime")
-            service_name = appointment_info.get("service")
-
-            if appointment_time and service_name:
-                # Check if within working hours
-                if open_hour <= appointment_time.hour < close_hour:
-                    # Check availability
-                    if check_slot_available(db, tenant.id, appointment_time):
-                        # SLOT AVAILABLE - Create appointment directly
-                        appointment = Appointment(
-                            id=uuid.uuid4(),
-                            tenant_id=tenant.id,
-                            channel_id=channel.id,
-                            customer_contact=from_number,
-                            requested_time=appointment_time,
-                            confirmed_time=appointment_time,
-                            service=service_name,
-                            status="confirmed",
-                            created_at=datetime.utcnow(),
-                            updated_at=datetime.utcnow()
-                        )
-                        db.add(appointment)
-
-                        confirmation_text = (
-                            f"Great! Your appointment for {service_name} is confirmed on "
-                            f"{appointment_time.strftime('%A, %B %d, %Y at %I:%M %p')}. "
-                            f"We look forward to seeing you!"
-                        )
-
-                        message = Message(
-                            id=uuid.uuid4(),
-                            tenant_id=tenant.id,
-                            channel_id=channel.id,
-                            message_text=message_text,
-                            ai_response=confirmation_text,
-                            confidence_score=1.0,
-                            status="replied",
-                            escalated_to_human=False,
-                            direction="incoming",
-                            customer_contact=from_number,
-                            created_at=datetime.utcnow(),
-                            updated_at=datetime.utcnow()
-                        )
-                        db.add(message)
-                        db.commit()
-
-                        return Response(
-                            content=f'<?xml version="1.0" encoding="UTF-8"?><Response><Message>{confirmation_text}</Message></Response>',
-                            media_type="application/xml"
-                        )
-
-                    else:
-                        # SLOT NOT AVAILABLE - Get suggestions
-                        available_slots = get_available_slots(db, tenant.id, appointment_time, open_hour, close_hour)
-
-                        if available_slots:
-                            slots_text = ", ".join([s.strftime("%I:%M %p") for s in available_slots])
-                            suggestion_text = (
-                                f"Sorry, {appointment_time.strftime('%I:%M %p')} on "
-                                f"{appointment_time.strftime('%B %d')} is not available for {service_name}. "
-                                f"Available times: {slots_text}. Please reply with your preferred time."
-                            )
-                        else:
-                            suggestion_text = (
-                                f"Sorry, no availability on {appointment_time.strftime('%B %d')} for {service_name}. "
-                                f"Please try another date."
-                            )
-
-                        message = Message(
-                            id=uuid.uuid4(),
-                            tenant_id=tenant.id,
-                            channel_id=channel.id,
-                            message_text=message_text,
-                            ai_response=suggestion_text,
-                            confidence_score=0.9,
-                            status="replied",
-                            escalated_to_human=False,
-                            direction="incoming",
-                            customer_contact=from_number,
-                            created_at=datetime.utcnow(),
-                            updated_at=datetime.utcnow()
-                        )
-                        db.add(message)
-                        db.commit()
-
-                        return Response(
-                            content=f'<?xml version="1.0" encoding="UTF-8"?><Response><Message>{suggestion_text}</Message></Response>',
-                            media_type="application/xml"
-                        )
+    # Twilio retries slow webhooks with the same MessageSid; answer those from cache
+    body = await recent_replies.run_once(
+        message_sid,
+        lambda: _handle_inbound_sms(from_number, to_number, message_text, message_sid)
+    )
+    return Response(content=body, media_type="application/xml")
 
-                else:
-                    # Outside working hours
-                    outside_text = (
-                        f"Sorry, we're open {open_hour}:00 AM to {close_hour}:00 PM. "
-                        f"Please choose a time within our hours for {service_name}."
-                    )
 
-                    message = Message(
-                        id=uuid.uuid4(),
-                        tenant_id=tenant.id,
-                        channel_id=channel.id,
-                        message_text=message_text,
-                        ai_response=outside_text,
-                        confidence_score=0.9,
-                        status="replied",
-                        escalated_to_human=False,
-                        direction="incoming",
-                        customer_contact=from_number,
-                        created_at=datetime.utcnow(),
-                        updated_at=datetime.utcnow()
-                    )
-                    db.add(message)
-                    db.commit()
+async def _handle_inbound_sms(from_number: str, to_number: str, message_text: str, message_sid: Optional[str]) -> bytes:
+    db: AsyncSession = AsyncSessionLocal()
+    try:
+        # Get channel + tenant settings (in-memory routing table, DB on miss)
+        route = await resolve_route(db, "sms", to_number)
 
-                    return Response(
-                        content=f'<?xml version="1.0" encoding="UTF-8"?><Response><Message>{outside_text}</Message></Response>',
-                        media_type="application/xml"
-                    )
+        if not route:
+            raise HTTPException(status_code=404, detail=f"SMS channel for {to_number} not found")
 
-        # --- NO appointment detected → Regular AI response ---
-        ai_reply, confidence = get_ai_response(
-            message_text=message_text,
-            ai_provider=tenant.ai_provider or "openai",
-            system_prompt=tenant.ai_system_prompt or ""
-        )
+        # Retry that landed on another worker or outlived the in-memory entry
+        if message_sid:
+            stored = await _stored_reply(db, message_sid)
+            if stored is not None:
+                recent_replies.db_hits += 1
+                return stored
+
+        # --- Deferred mode: store as pending, ack Twilio now, reply from the worker pool ---
+        if settings.SMS_DEFERRED_REPLIES:
+            message = Message(
+                id=uuid.uuid4(),
+                tenant_id=route.tenant_id,
+                channel_id=route.channel_id,
+                message_text=message_text,
+                status="pending",
+                escalated_to_human=False,
+                direction="incoming",
+                customer_contact=from_number,
+                external_id=message_sid,
+                created_at=datetime.utcnow(),
+                updated_at=datetime.utcnow()
+            )
+            db.add(message)
+            try:
+                await db.commit()
+            except IntegrityError:
+                # Concurrent retry already stored this MessageSid
+                await db.rollback()
+                return sms_reply(None)
+
+            await sms_pipeline.enqueue(SMSJob(
+                message_id=message.id,
+                tenant_id=route.tenant_id,
+                channel_id=route.channel_id,
+                from_number=from_number,
+                to_number=to_number,
+                message_text=message_text
+            ))
+
+            return sms_reply(None)
+
+        reply_text, confidence, reply_source = await generate_sms_reply(db, route, from_number, message_text)
 
         message = Message(
             id=uuid.uuid4(),
-            tenant_id=tenant.id,
-            channel_id=channel.id,
+            tenant_id=route.tenant_id,
+            channel_id=route.channel_id,
             message_text=message_text,
-            ai_response=ai_reply,
+            ai_response=reply_text,
             confidence_score=confidence,
+            reply_source=reply_source,
             status="replied",
             escalated_to_human=False,
             direction="incoming",
             customer_contact=from_number,
+            external_id=message_sid,
             created_at=datetime.utcnow(),
             updated_at=datetime.utcnow()
         )
         db.add(message)
-        db.commit()
+        try:
+            await db.commit()
+        except IntegrityError:
+            # Concurrent retry on another worker stored it first; answer with its reply
+            await db.rollback()
+            return await _stored_reply(db, message_sid) or sms_reply(reply_text)
 
-        return Response(
-            content=f'<?xml version="1.0" encoding="UTF-8"?><Response><Message>{ai_reply}</Message></Response>',
-            media_type="application/xml"
-        )
+        return sms_reply(reply_text)
 
     finally:
-        db.close()
+        await db.close()
+
+
+async def process_sms_job(job: SMSJob) -> None:
+    """
+    SMS pipeline worker: generate the reply for a pending message, send it
+    through Twilio and record the outcome on the Message row.
+    """
+    db: AsyncSession = AsyncSessionLocal()
+    reply_text, confidence, reply_source, status = None, None, None, "failed"
+    try:
+        route = await resolve_route(db, "sms", job.to_number)
+        if not route:
+            raise ValueError(f"SMS channel for {job.to_number} not found")
+
+        reply_text, confidence, reply_source = await generate_sms_reply(db, route, job.from_number, job.message_text)
+        await send_sms_message(from_number=job.to_number, to_number=job.from_number, body=reply_text)
+        status = "replied"
+
+    finally:
+        try:
+            if reply_text is None:
+                await db.rollback()
+            # Keep the generated reply (and any booked appointment) even if Twilio failed
+            await db.execute(
+                update(Message)
+                .where(Message.id == job.message_id)
+                .values(
+                    ai_response=reply_text,
+                    confidence_score=confidence,
+                    reply_source=reply_source,
+                    status=status,
+                    updated_at=datetime.utcnow()
+                )
+            )
+            await db.commit()
+        finally:
+            await db.close()
+
 
 # ==========================================
 # 📌 GET /messages/sms - Get all SMS messages for tenant
 # ==========================================
 @router.get("/messages", response_model=SMSMessageListResponse)
 def get_sms_messages(
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    limit: int = Query(settings.LIST_DEFAULT_LIMIT, ge=1, le=settings.LIST_MAX_LIMIT),
+    include_total: bool = Query(False, description="Also return the (cached, approximate) total"),
     current_tenant: Tenant = Depends(get_current_tenant),
     db: Session = Depends(get_db)
 ):
     """
-    Get all SMS messages for the authenticated tenant.
-    Returns messages ordered by created_at ascending.
+    Get SMS messages for the authenticated tenant, one page at a time.
+    Returns messages ordered by created_at ascending; pass next_cursor to get the next page.
     """
     # Get all SMS channels for this tenant
     sms_channels = db.query(Channel).filter(
@@ -274,15 +341,20 @@ def get_sms_messages(
     ).all()
 
     if not sms_channels:
-        return SMSMessageListResponse(messages=[], total=0)
+        return SMSMessageListResponse(messages=[], total=0 if include_total else None)
 
     channel_ids = [ch.id for ch in sms_channels]
 
     # Query messages for SMS channels
-    messages = db.query(Message).filter(
+    query = db.query(Message).filter(
         Message.tenant_id == current_tenant.id,
         Message.channel_id.in_(channel_ids)
-    ).order_by(Message.created_at.asc()).all()
+    )
+    try:
+        messages, next_cursor = keyset_page(query, Message.created_at, Message.id, cursor, limit, descending=False)
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    total = list_totals.get(("sms", current_tenant.id), query.count) if include_total else None
 
     # Convert to response format
     message_list = [
@@ -297,7 +369,7 @@ def get_sms_messages(
         for msg in messages
     ]
 
-    return SMSMessageListResponse(messages=message_list, total=len(message_list))
+    return SMSMessageListResponse(messages=message_list, next_cursor=next_cursor, total=total)
 
 
 # ==========================================
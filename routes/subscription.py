@@ -8,6 +8,7 @@ from schemas.subscription import (
     ActivateSubscriptionResponse,
     WebhookResponse
 )
+from services.tenant import invalidate_tenant
 from datetime import datetime
 from typing import Optional
 import hashlib
@@ -106,6 +107,7 @@ def activate_subscription(
         tenant.updated_at = datetime.utcnow()
 
         db.commit()
+        invalidate_tenant(tenant.id)
         db.refresh(tenant)
 
         logger.info(f"Subscription activated for tenant {tenant.id} - Plan: {request.plan}")
@@ -255,6 +257,10 @@ async def paddle_webhook(
         else:
             logger.info(f"Unhandled Paddle event type: {event_type}")
 
+        # Subscription fields may have changed; drop the cached row
+        if tenant:
+            invalidate_tenant(tenant.id)
+
         return WebhookResponse(
             success=True,
             message=f"Webhook processed: {event_type}"
@@ -5,6 +5,10 @@ from database import get_db
 from models import Tenant, Channel
 from auth.dependencies import get_current_tenant
 from schemas.tenant import TenantSetupRequest, TenantSetupResponse
+from services.tenant import invalidate_tenant
+from services.routing import refresh_tenant_routes
+from services.bm25 import bm25_index
+from services.reply_cache import prompt_hash
 from typing import List, Dict
 import json
 
@@ -48,11 +52,14 @@ def generate_ai_system_prompt(
     timezone: str,
     faqs: List[Dict],
     services: List[Dict],
+    include_faqs: bool = True,
 ) -> str:
     """
     Create a robust, human-readable system prompt suitable for a multi-tenant AI receptionist.
     This prompt is intentionally explicit about behavior, limits, and required fields to make AI
     responses consistent across different businesses and industries.
+    With include_faqs=False the FAQ list is left out (core prompt for FAQ retrieval mode);
+    the relevant FAQs are then appended per message.
     """
 
     # Normalize inputs to avoid None issues
@@ -65,7 +72,10 @@ def generate_ai_system_prompt(
     close_time = (close_time or "").strip()
     timezone = (timezone or "").strip()
 
-    formatted_faqs = _format_faqs_for_prompt(faqs)
+    if include_faqs:
+        formatted_faqs = _format_faqs_for_prompt(faqs)
+    else:
+        formatted_faqs = "The FAQs relevant to the customer's message are listed at the end of these instructions."
     formatted_services = _format_services_for_prompt(services)
 
     prompt = f"""
@@ -175,6 +185,12 @@ def setup_tenant(
         _set_if_changed(current_tenant, "open_time", bh.open_time, "open_time")
         _set_if_changed(current_tenant, "close_time", bh.close_time, "close_time")
 
+        # FAQ fast path settings (left unchanged when not sent)
+        if setup_data.faq_fast_path_enabled is not None:
+            _set_if_changed(current_tenant, "faq_fast_path_enabled", setup_data.faq_fast_path_enabled)
+        if setup_data.faq_fast_path_threshold is not None:
+            _set_if_changed(current_tenant, "faq_fast_path_threshold", setup_data.faq_fast_path_threshold)
+
         # Update FAQs (store as list of dicts)
         faq_list = [{"question": f.question, "answer": f.answer} for f in setup_data.faq]
         if hasattr(current_tenant, "faqs"):
@@ -208,6 +224,24 @@ def setup_tenant(
                 setattr(current_tenant, "ai_system_prompt", ai_prompt)
                 updated_fields["ai_system_prompt"] = "Generated system prompt"
 
+        # Same prompt without the FAQ list, for FAQ retrieval mode
+        core_prompt = generate_ai_system_prompt(
+            business_name=setup_data.business_name,
+            industry=setup_data.industry,
+            tone_of_voice=setup_data.tone_of_voice,
+            greeting_message=setup_data.greeting_message,
+            phone_number=setup_data.phone_number,
+            open_time=bh.open_time,
+            close_time=bh.close_time,
+            timezone=bh.timezone,
+            faqs=faq_list,
+            services=services_list,
+            include_faqs=False,
+        )
+        _set_if_changed(current_tenant, "ai_core_prompt", core_prompt, "ai_core_prompt")
+        if "ai_core_prompt" in updated_fields:
+            updated_fields["ai_core_prompt"] = "Generated core prompt"
+
         # Persist tenant updates
         db.add(current_tenant)
 
@@ -224,19 +258,27 @@ def setup_tenant(
                 new_channel = Channel(
                     tenant_id=current_tenant.id,
                     type=channel_input.type,
-                    identifier=channel_input.identifier
+                    identifier=channel_input.identifier,
+                    ai_cache_enabled=channel_input.ai_cache_enabled is not False
                 )
                 db.add(new_channel)
                 created_channels.append(new_channel)
+            elif channel_input.ai_cache_enabled is not None and existing_channel.ai_cache_enabled != channel_input.ai_cache_enabled:
+                existing_channel.ai_cache_enabled = channel_input.ai_cache_enabled
 
         # Commit all changes
         db.commit()
+        invalidate_tenant(current_tenant.id)
 
         # Refresh to load DB-generated fields like IDs
         db.refresh(current_tenant)
         for ch in created_channels:
             db.refresh(ch)
 
+        # Keep the inbound webhook routing table in sync with new channels/settings
+        refresh_tenant_routes(db, current_tenant.id)
+        bm25_index.update_profile(current_tenant.id, prompt_hash(current_tenant.ai_system_prompt), faq_list, services_list)
+
         return TenantSetupResponse(
             success=True,
             message="Tenant setup completed",
@@ -1,14 +1,34 @@
 from fastapi import APIRouter, Request, HTTPException
 from fastapi.responses import Response
-from sqlalchemy.orm import Session
-from database import SessionLocal
-from models import Tenant, Channel, VoiceMessage
-from ai_providers import get_ai_response
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy import select
+from database import AsyncSessionLocal
+from models import VoiceMessage
+from services.responder import generate_ai_reply
+from services.routing import resolve_route
+from services.session import call_sessions, FINAL_CALL_STATUSES
+from services.twiml import voice_reply, greeting
+from services.idempotency import recent_replies
 from datetime import datetime
+from typing import Optional
 import uuid
 
 router = APIRouter()
 
+
+def _turn_key(call_sid: str, idempotency_token: Optional[str]) -> Optional[str]:
+    """
+    Dedupe key for one <Gather> turn of a call, from the
+    I-Twilio-Idempotency-Token header Twilio repeats on retries. None without
+    the header: the transcript can't tell a retry from the caller saying the
+    same thing again ("yes", "repeat that"), so such turns are not deduped.
+    """
+    if not idempotency_token:
+        return None
+    return f"{call_sid}:{idempotency_token}"[:128]
+
+
 @router.post("/receive")
 async def voice_webhook(request: Request):
     data = await request.form()
@@ -16,61 +36,101 @@ async def voice_webhook(request: Request):
     to_number = data.get("To")
     call_sid = data.get("CallSid")
     speech_text = data.get("SpeechResult")  # from Twilio only exists after <Gather>
-    transcription_to_store = speech_text if speech_text else None
 
     if not from_number or not to_number or not call_sid:
         raise HTTPException(status_code=400, detail="Missing required fields")
 
-    db: Session = SessionLocal()
-
-    # Find voice channel
-    channel = db.query(Channel).filter(Channel.type=="voice", Channel.identifier==to_number).first()
-    if not channel:
-        raise HTTPException(status_code=404, detail="Voice channel not found")
-
-    # Find tenant by Twilio number
-    tenant = db.query(Tenant).filter(Tenant.id == channel.tenant_id).first()
-    if not tenant:
-        raise HTTPException(status_code=404, detail="Tenant not found")
-
-    # First call, no SpeechResult yet → greet
-    if not speech_text:
-        twilio_response = f"""<?xml version="1.0" encoding="UTF-8"?>
-<Response>
-    <Say voice="Polly.Joanna">Hello! This is {tenant.business_name}. How can I help you today?</Say>
-    <Gather input="speech" action="/api/voice/receive" method="POST" speechTimeout="auto"/>
-</Response>"""
-        return Response(content=twilio_response, media_type="application/xml")
-
-    # Process user speech with AI
-    ai_reply, confidence = get_ai_response(
-        message_text=speech_text,
-        ai_provider=tenant.ai_provider,
-        system_prompt=tenant.ai_system_prompt,
-        model=getattr(tenant, "ai_model", None),
-        temperature=getattr(tenant, "ai_temperature", None)
-    )
+    # Greetings run no AI and store nothing, so only speech turns are deduped
+    turn_key = None
+    if speech_text:
+        turn_key = _turn_key(call_sid, request.headers.get("I-Twilio-Idempotency-Token"))
 
-    # Save conversation in voice_messages
-    message = VoiceMessage(
-        id=uuid.uuid4(),
-        tenant_id=tenant.id,
-        channel_id=channel.id,
-        from_contact=from_number,
-        transcription=transcription_to_store,
-        ai_response=ai_reply,
-        confidence_score=confidence,
-        created_at=datetime.utcnow(),
-        updated_at=datetime.utcnow()
+    body = await recent_replies.run_once(
+        turn_key,
+        lambda: _handle_voice_turn(call_sid, from_number, to_number, speech_text, turn_key)
     )
-    db.add(message)
-    db.commit()
+    return Response(content=body, media_type="application/xml")
+
+
+@router.post("/status")
+async def voice_status_callback(request: Request):
+    """
+    Twilio call status callback (configure it as the number's Status Callback
+    URL). Ends the call's in-memory session once the call is over.
+    """
+    data = await request.form()
+    call_sid = data.get("CallSid")
+    if call_sid and data.get("CallStatus") in FINAL_CALL_STATUSES:
+        call_sessions.close(call_sid)
+    return Response(status_code=204)
+
+
+async def _handle_voice_turn(
+    call_sid: str,
+    from_number: str,
+    to_number: str,
+    speech_text: Optional[str],
+    turn_key: Optional[str]
+) -> bytes:
+    transcription_to_store = speech_text if speech_text else None
+
+    db: AsyncSession = AsyncSessionLocal()
+    try:
+        # Channel + tenant settings are resolved once per call and kept in its session
+        session = call_sessions.get(call_sid)
+        if session is None:
+            route = await resolve_route(db, "voice", to_number)
+            if not route:
+                raise HTTPException(status_code=404, detail="Voice channel not found")
+            session = call_sessions.open(call_sid, route, from_number)
+        route = session.route
+
+        # First call, no SpeechResult yet → greet
+        if not speech_text:
+            return greeting(route.business_name)
+
+        # Retry that landed on another worker or outlived the in-memory entry
+        if turn_key:
+            stored_reply = await db.scalar(select(VoiceMessage.ai_response).where(VoiceMessage.external_id == turn_key))
+            if stored_reply is not None:
+                recent_replies.db_hits += 1
+                return voice_reply(stored_reply)
+
+        # Process user speech with AI
+        ai_reply, confidence, _ = await generate_ai_reply(
+            tenant_id=route.tenant_id,
+            message_text=speech_text,
+            ai_provider=route.ai_provider,
+            system_prompt=route.ai_system_prompt,
+            use_cache=route.ai_cache_enabled,
+            core_prompt=route.ai_core_prompt,
+            faqs=route.faqs,
+            services=route.services,
+            conversation=session.conversation
+        )
+        session.turns += 1
 
-    # Respond to user with AI reply, continue gathering
-    twilio_response = f"""<?xml version="1.0" encoding="UTF-8"?>
-<Response>
-    <Say voice="Polly.Joanna">{ai_reply}</Say>
-    <Gather input="speech" action="/api/voice/receive" method="POST" speechTimeout="auto"/>
-</Response>"""
+        # Save conversation in voice_messages
+        message = VoiceMessage(
+            id=uuid.uuid4(),
+            tenant_id=route.tenant_id,
+            channel_id=route.channel_id,
+            from_contact=from_number,
+            transcription=transcription_to_store,
+            ai_response=ai_reply,
+            confidence_score=confidence,
+            external_id=turn_key,
+            created_at=datetime.utcnow(),
+            updated_at=datetime.utcnow()
+        )
+        db.add(message)
+        try:
+            await db.commit()
+        except IntegrityError:
+            # Concurrent retry on another worker stored this turn first
+            await db.rollback()
 
-    return Response(content=twilio_response, media_type="application/xml")
\ No newline at end of file
+        # Respond to user with AI reply, continue gathering
+        return voice_reply(ai_reply)
+    finally:
+        await db.close()
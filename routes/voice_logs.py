@@ -1,40 +1,50 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import SQLAlchemyError
 from database import get_db
 from models import Tenant, VoiceMessage
 from auth.dependencies import get_current_tenant
 from schemas.voice import VoiceLogResponse, VoiceLogListResponse
-from typing import List
+from services.pagination import keyset_page, list_totals, InvalidCursor
+from config import settings
+from typing import List, Optional
 
 router = APIRouter()
 
 
 @router.get("/logs", response_model=VoiceLogListResponse)
 def get_voice_logs(
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    limit: int = Query(settings.LIST_DEFAULT_LIMIT, ge=1, le=settings.LIST_MAX_LIMIT),
+    include_total: bool = Query(False, description="Also return the (cached, approximate) total"),
     current_tenant: Tenant = Depends(get_current_tenant),
     db: Session = Depends(get_db)
 ):
     """
-    Get all voice call logs for the authenticated tenant.
-    Returns logs ordered by created_at descending (most recent first).
+    Get voice call logs for the authenticated tenant, one page at a time.
+    Returns logs ordered by created_at descending (most recent first); pass next_cursor to get the next page.
     
     Requires: Bearer token authentication
     
     Returns:
         - 200: List of voice logs
+        - 400: Invalid cursor
         - 401: Unauthorized (no/invalid token)
         - 404: No voice logs found
         - 500: Database query failed
     """
     try:
         # Query voice messages for this tenant
-        voice_messages = db.query(VoiceMessage).filter(
+        query = db.query(VoiceMessage).filter(
             VoiceMessage.tenant_id == current_tenant.id
-        ).order_by(VoiceMessage.created_at.desc()).all()
+        )
+        try:
+            voice_messages, next_cursor = keyset_page(query, VoiceMessage.created_at, VoiceMessage.id, cursor, limit)
+        except InvalidCursor:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
 
         # Check if any logs exist
-        if not voice_messages:
+        if not voice_messages and not cursor:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="No voice logs found for this tenant"
@@ -53,7 +63,8 @@ def get_voice_logs(
             for msg in voice_messages
         ]
 
-        return VoiceLogListResponse(logs=logs, total=len(logs))
+        total = list_totals.get(("voice", current_tenant.id), query.count) if include_total else None
+        return VoiceLogListResponse(logs=logs, next_cursor=next_cursor, total=total)
 
     except HTTPException:
         # Re-raise HTTP exceptions (like 404)
@@ -29,7 +29,8 @@ class AppointmentResponse(BaseModel):
 class AppointmentListResponse(BaseModel):
     """List of appointments."""
     appointments: List[AppointmentResponse]
-    total: int
+    next_cursor: Optional[str] = None  # pass as ?cursor= for the next page; None on the last page
+    total: Optional[int] = None  # only with ?include_total=true; cached, may lag new rows
 
 
 class TrendItem(BaseModel):
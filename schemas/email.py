@@ -26,7 +26,8 @@ class EmailMessageResponse(BaseModel):
 class EmailMessageListResponse(BaseModel):
     """List of email messages."""
     emails: List[EmailMessageResponse]
-    total: int
+    next_cursor: Optional[str] = None  # pass as ?cursor= for the next page; None on the last page
+    total: Optional[int] = None  # only with ?include_total=true; cached, may lag new rows
 
 
 # ==========================================
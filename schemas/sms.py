@@ -24,7 +24,8 @@ class SMSMessageResponse(BaseModel):
 class SMSMessageListResponse(BaseModel):
     """List of SMS messages."""
     messages: list[SMSMessageResponse]
-    total: int
+    next_cursor: Optional[str] = None  # pass as ?cursor= for the next page; None on the last page
+    total: Optional[int] = None  # only with ?include_total=true; cached, may lag new rows
 
 
 # ==========================================
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Optional
 from datetime import datetime
 import uuid
@@ -23,6 +23,7 @@ class ServiceItem(BaseModel):
 class ChannelInput(BaseModel):
     type: str
     identifier: str
+    ai_cache_enabled: Optional[bool] = None  # None: new channels on, existing ones unchanged
 
 
 class TenantSetupRequest(BaseModel):
@@ -35,6 +36,8 @@ class TenantSetupRequest(BaseModel):
     business_hours: BusinessHours
     faq: List[FAQItem]
     services: List[ServiceItem]
+    faq_fast_path_enabled: Optional[bool] = None  # reply to strong FAQ matches without the LLM
+    faq_fast_path_threshold: Optional[float] = Field(None, ge=0, le=1)
 
 
 class TenantSetupResponse(BaseModel):
@@ -49,6 +52,7 @@ class ChannelResponse(BaseModel):
     type: str
     identifier: str
     status: str
+    ai_cache_enabled: bool
 
     class Config:
         from_attributes = True
\ No newline at end of file
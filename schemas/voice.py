@@ -20,5 +20,6 @@ class VoiceLogResponse(BaseModel):
 class VoiceLogListResponse(BaseModel):
     """List of voice logs."""
     logs: List[VoiceLogResponse]
-    total: int
+    next_cursor: Optional[str] = None  # pass as ?cursor= for the next page; None on the last page
+    total: Optional[int] = None  # only with ?include_total=true; cached, may lag new rows
 
@@ -0,0 +1,59 @@
+# services/aggregates.py
+"""
+Dashboard counters in one round-trip.
+
+count_by_day() turns a set of named conditions into a single statement:
+
+    SELECT <day bucket>, COUNT(*) FILTER (WHERE <cond 1>) AS name1, ...
+    FROM <source> WHERE <where> GROUP BY <day bucket>
+
+so every counter comes out of one scan of the source rows. Rows older than
+`since` fall into one NULL bucket, which still counts towards the totals;
+newer rows are bucketed per day for the over-time charts.
+"""
+from datetime import date, datetime, time as dt_time
+from typing import Dict, Tuple, Sequence
+from sqlalchemy import select, func, case, cast, Date, ColumnElement, FromClause, Select
+from sqlalchemy.orm import Session
+
+
+def counts_statement(
+    source: FromClause,
+    conditions: Dict[str, ColumnElement],
+    day_column: ColumnElement,
+    since: date,
+    where: Sequence[ColumnElement] = ()
+) -> Select:
+    """The single grouped statement behind count_by_day(). A condition of None counts every row."""
+    start = datetime.combine(since, dt_time.min)
+    bucket = case((day_column >= start, cast(day_column, Date))).label("day")
+    counters = [
+        (func.count() if condition is None else func.count().filter(condition)).label(name)
+        for name, condition in conditions.items()
+    ]
+    return select(bucket, *counters).select_from(source).where(*where).group_by(bucket)
+
+
+def count_by_day(
+    db: Session,
+    source: FromClause,
+    conditions: Dict[str, ColumnElement],
+    day_column: ColumnElement,
+    since: date,
+    where: Sequence[ColumnElement] = ()
+) -> Tuple[Dict[str, int], Dict[str, Dict[str, int]]]:
+    """
+    Returns (totals, daily): each counter over all of `source`, and per day
+    ("YYYY-MM-DD") from `since` on.
+    """
+    rows = db.execute(counts_statement(source, conditions, day_column, since, where)).all()
+
+    totals = dict.fromkeys(conditions, 0)
+    daily: Dict[str, Dict[str, int]] = {}
+    for row in rows:
+        counts = row._mapping
+        for name in conditions:
+            totals[name] += counts[name]
+        if row.day is not None:
+            daily[str(row.day)] = {name: counts[name] for name in conditions}
+    return totals, daily
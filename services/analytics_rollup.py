@@ -0,0 +1,175 @@
+# services/analytics_rollup.py
+"""
+Per-tenant message counters in the analytics table, one row per
+(tenant, day, channel type) plus a lifetime row per (tenant, channel type)
+with period_start = LIFETIME.
+
+Rows are upserted in the same transaction as every Message / VoiceMessage
+insert, so the dashboard reads a few dozen rollup rows instead of scanning
+the tenant's message history. The counters only depend on what a message
+looks like when it is stored (escalated_to_human is never changed later, and
+the later status updates do not move a message in or out of "resolved").
+The rows are kept up to date whether or not ANALYTICS_ROLLUPS_ENABLED is set;
+the flag only switches the dashboard over to reading them. Messages stored
+before this code was deployed are not in the rollups, so after the migration
+run backfill() once and only then enable the flag:
+
+    python backfill_analytics.py [--tenant TENANT_ID]
+"""
+import logging
+import uuid
+from datetime import datetime, date, time as dt_time
+from typing import Optional, Dict, Any
+from sqlalchemy import event, select, func, literal, delete, text, case, cast, Date, Integer, DateTime, String
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+from models import Analytics, Channel, Message, VoiceMessage
+
+logger = logging.getLogger(__name__)
+
+# period_start of the lifetime rows
+LIFETIME = datetime(1970, 1, 1)
+
+# Counted for voice_count only; not part of the message totals
+VOICE = "voice"
+
+
+def _day(created_at: Optional[datetime]) -> datetime:
+    return datetime.combine((created_at or datetime.utcnow()).date(), dt_time.min)
+
+
+def _resolved(status: Optional[str], escalated: Optional[bool]) -> bool:
+    """Same rule as the dashboard: replied, or not escalated to a human."""
+    return status == "replied" or escalated is False
+
+
+def _upsert(connection, tenant_id: uuid.UUID, day: datetime, channel_type, resolved: bool, escalated: bool) -> None:
+    now = datetime.utcnow()
+    counts = {"total_messages": 1, "ai_resolved": int(resolved), "escalated": int(escalated)}
+    rows = [
+        {"id": uuid.uuid4(), "tenant_id": tenant_id, "period_start": period, "channel_type": channel_type,
+         "created_at": now, "updated_at": now, **counts}
+        for period in (day, LIFETIME)
+    ]
+    stmt = pg_insert(Analytics).values(rows)
+    connection.execute(stmt.on_conflict_do_update(
+        constraint="uq_analytics_tenant_period_channel",
+        set_={
+            **{name: getattr(Analytics, name) + getattr(stmt.excluded, name) for name in counts},
+            "updated_at": now,
+        }
+    ))
+
+
+@event.listens_for(Message, "after_insert")
+def _message_inserted(mapper, connection, target):
+    channel_type = func.coalesce(select(Channel.type).where(Channel.id == target.channel_id).scalar_subquery(), "other")
+    _upsert(
+        connection, target.tenant_id, _day(target.created_at), channel_type,
+        _resolved(target.status, target.escalated_to_human), target.escalated_to_human is True
+    )
+
+
+@event.listens_for(VoiceMessage, "after_insert")
+def _voice_message_inserted(mapper, connection, target):
+    _upsert(connection, target.tenant_id, _day(target.created_at), VOICE, bool(target.ai_response), False)
+
+
+def read_rollups(db: Session, tenant_id: uuid.UUID, since: date) -> Dict[str, Any]:
+    """
+    Lifetime counters per channel type and per-day message counts from `since`,
+    at most (1 + days) * channel types rows.
+    """
+    rows = db.execute(
+        select(Analytics.period_start, Analytics.channel_type, Analytics.total_messages,
+               Analytics.ai_resolved, Analytics.escalated)
+        .where(
+            Analytics.tenant_id == tenant_id,
+            (Analytics.period_start == LIFETIME) | (Analytics.period_start >= datetime.combine(since, dt_time.min))
+        )
+    ).all()
+
+    totals: Dict[str, Dict[str, int]] = {}
+    daily: Dict[str, int] = {}
+    for row in rows:
+        if row.period_start == LIFETIME:
+            totals[row.channel_type] = {
+                "total_messages": row.total_messages or 0,
+                "ai_resolved": row.ai_resolved or 0,
+                "escalated": row.escalated or 0,
+            }
+        elif row.channel_type != VOICE:
+            day = str(row.period_start.date())
+            daily[day] = daily.get(day, 0) + (row.total_messages or 0)
+    return {"totals": totals, "daily": daily}
+
+
+def backfill(db: Session, tenant_id: Optional[uuid.UUID] = None) -> int:
+    """
+    Rebuild the rollup rows (of one tenant, or all) from messages and
+    voice_messages in one transaction; returns the number of rows written.
+    The table lock makes concurrent inserts wait, so no message is counted
+    twice or missed.
+    """
+    db.execute(text("LOCK TABLE analytics IN EXCLUSIVE MODE"))
+    clear = delete(Analytics)
+    if tenant_id is not None:
+        clear = clear.where(Analytics.tenant_id == tenant_id)
+    db.execute(clear)
+
+    now = datetime.utcnow()
+    channel_type = func.coalesce(Channel.type, "other")
+    resolved = (Message.status == "replied") | (Message.escalated_to_human == False)
+    sources = [
+        (
+            select(
+                Message.tenant_id.label("tenant_id"),
+                channel_type.label("channel_type"),
+                Message.created_at.label("created_at"),
+                case((resolved, 1), else_=0).label("resolved"),
+                case((Message.escalated_to_human == True, 1), else_=0).label("escalated"),
+            )
+            .select_from(Message)
+            .outerjoin(Channel, Channel.id == Message.channel_id)
+        ),
+        select(
+            VoiceMessage.tenant_id,
+            literal(VOICE, String),
+            VoiceMessage.created_at,
+            case((VoiceMessage.ai_response.isnot(None) & (VoiceMessage.ai_response != ""), 1), else_=0),
+            literal(0, Integer),
+        ),
+    ]
+    if tenant_id is not None:
+        sources[0] = sources[0].where(Message.tenant_id == tenant_id)
+        sources[1] = sources[1].where(VoiceMessage.tenant_id == tenant_id)
+    source = sources[0].union_all(sources[1]).subquery()
+
+    written = 0
+    for period in (cast(cast(source.c.created_at, Date), DateTime), literal(LIFETIME, DateTime)):
+        grouped = (
+            select(
+                func.gen_random_uuid(),
+                source.c.tenant_id,
+                period,
+                source.c.channel_type,
+                func.count(),
+                func.sum(source.c.resolved),
+                func.sum(source.c.escalated),
+                literal(now, DateTime),
+                literal(now, DateTime),
+            )
+            .where(source.c.created_at.isnot(None))
+            .group_by(source.c.tenant_id, period, source.c.channel_type)
+        )
+        result = db.execute(
+            pg_insert(Analytics).from_select(
+                ["id", "tenant_id", "period_start", "channel_type", "total_messages",
+                 "ai_resolved", "escalated", "created_at", "updated_at"],
+                grouped
+            )
+        )
+        written += result.rowcount
+    db.commit()
+    logger.info(f"Rebuilt {written} analytics rollup rows" + (f" for tenant {tenant_id}" if tenant_id else ""))
+    return written
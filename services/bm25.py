@@ -0,0 +1,348 @@
+# services/bm25.py
+"""
+Per-tenant BM25 index over the tenant's FAQs, services and knowledge base.
+
+Lexical retrieval that needs no embedding provider. Each term keeps its
+postings in growable NumPy arrays (doc ids as int32, term frequencies as
+float32), so a query is a few vectorized adds per query term.
+
+Documents are added incrementally. Removed documents are tombstoned and
+their document frequencies decremented. The postings are compacted once
+tombstones make up half the index. FAQ/service documents are replaced when
+the tenant saves setup (or when the tenant's prompt hash changes). Knowledge
+base documents follow KnowledgeBase commits.
+"""
+import asyncio
+import logging
+import math
+import re
+import time
+import uuid
+from collections import Counter
+from typing import Optional, Dict, List, NamedTuple, Tuple, Iterable, Any
+import numpy as np
+from sqlalchemy import select
+from database import AsyncSessionLocal
+from models import KnowledgeBase
+from services.stats import LatencyWindow
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+K1 = 1.2
+B = 0.75
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset(
+    "a an and are as at be but by can could do does for from have how i if in is it its me my "
+    "of on or our please so that the their there this to us was we what when where which who "
+    "why will with would you your".split()
+)
+
+KINDS = {"faq": 0, "service": 1, "kb": 2}
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens without stopwords, with plural/-ing endings folded."""
+    tokens = []
+    for word in _TOKEN.findall((text or "").casefold()):
+        if word in STOPWORDS:
+            continue
+        if len(word) > 4 and word.endswith("ies"):
+            word = word[:-3] + "y"
+        elif len(word) > 5 and word.endswith("ing"):
+            word = word[:-3]
+        elif len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        tokens.append(word)
+    return tokens
+
+
+class Document(NamedTuple):
+    kind: str  # faq / service / kb
+    key: Any  # faq index, service index or KnowledgeBase.id
+    title: str
+    text: str
+
+
+class Snippet(NamedTuple):
+    kind: str
+    key: Any
+    title: str
+    text: str
+    score: float
+
+
+class FastAnswer(NamedTuple):
+    question: str
+    answer: str
+    confidence: float  # idf-weighted overlap between the message and the FAQ question, 0..1
+    score: float  # raw BM25 score
+
+
+class _Postings:
+    __slots__ = ("doc_ids", "tfs", "size")
+
+    def __init__(self):
+        self.doc_ids = np.zeros(4, dtype=np.int32)
+        self.tfs = np.zeros(4, dtype=np.float32)
+        self.size = 0
+
+    def append(self, doc_id: int, tf: float) -> None:
+        if self.size == len(self.doc_ids):
+            self.doc_ids = np.resize(self.doc_ids, self.size * 2)
+            self.tfs = np.resize(self.tfs, self.size * 2)
+        self.doc_ids[self.size] = doc_id
+        self.tfs[self.size] = tf
+        self.size += 1
+
+
+class TenantBM25:
+    def __init__(self):
+        self.docs: List[Optional[Document]] = []
+        self.doc_terms: List[Optional[Counter]] = []
+        self.question_terms: Dict[int, frozenset] = {}  # FAQ doc id -> terms of the question only
+        self.by_key: Dict[Tuple[str, Any], int] = {}
+        self.postings: Dict[str, _Postings] = {}
+        self.df: Counter = Counter()
+        self.lengths = np.zeros(16, dtype=np.float32)
+        self.alive = np.zeros(16, dtype=bool)
+        self.kinds = np.zeros(16, dtype=np.int8)
+        self.live = 0
+        self.total_length = 0
+        self.version: Optional[str] = None
+
+    def add(self, doc: Document) -> None:
+        self.remove(doc.kind, doc.key)
+        doc_id = len(self.docs)
+        if doc_id == len(self.lengths):
+            self.lengths = np.resize(self.lengths, doc_id * 2)
+            self.alive = np.resize(self.alive, doc_id * 2)
+            self.kinds = np.resize(self.kinds, doc_id * 2)
+
+        terms = Counter(tokenize(f"{doc.title} {doc.text}"))
+        for term, tf in terms.items():
+            postings = self.postings.get(term)
+            if postings is None:
+                postings = self.postings[term] = _Postings()
+            postings.append(doc_id, tf)
+            self.df[term] += 1
+        if doc.kind == "faq":
+            self.question_terms[doc_id] = frozenset(tokenize(doc.title))
+
+        length = sum(terms.values())
+        self.docs.append(doc)
+        self.doc_terms.append(terms)
+        self.lengths[doc_id] = length
+        self.alive[doc_id] = True
+        self.kinds[doc_id] = KINDS[doc.kind]
+        self.by_key[(doc.kind, doc.key)] = doc_id
+        self.live += 1
+        self.total_length += length
+
+    def remove(self, kind: str, key: Any) -> None:
+        doc_id = self.by_key.pop((kind, key), None)
+        if doc_id is None:
+            return
+        for term in self.doc_terms[doc_id]:
+            self.df[term] -= 1
+            if self.df[term] <= 0:
+                del self.df[term]
+        self.total_length -= int(self.lengths[doc_id])
+        self.alive[doc_id] = False
+        self.docs[doc_id] = None
+        self.doc_terms[doc_id] = None
+        self.question_terms.pop(doc_id, None)
+        self.live -= 1
+
+    def remove_kind(self, kind: str) -> None:
+        for doc_kind, key in [k for k in self.by_key if k[0] == kind]:
+            self.remove(doc_kind, key)
+
+    def needs_compaction(self) -> bool:
+        return len(self.docs) > 64 and self.live < len(self.docs) // 2
+
+    def compacted(self) -> "TenantBM25":
+        fresh = TenantBM25()
+        fresh.version = self.version
+        for doc in self.docs:
+            if doc is not None:
+                fresh.add(doc)
+        return fresh
+
+    def idf(self, term: str) -> float:
+        df = self.df.get(term, 0)
+        return math.log(1 + (self.live - df + 0.5) / (df + 0.5))
+
+    def scores(self, terms: Iterable[str]) -> np.ndarray:
+        n = len(self.docs)
+        scores = np.zeros(n, dtype=np.float32)
+        if not self.live:
+            return scores
+        average_length = max(self.total_length / self.live, 1.0)
+        norm = K1 * (1 - B + B * self.lengths[:n] / average_length)
+        for term in set(terms):
+            postings = self.postings.get(term)
+            if postings is None or term not in self.df:
+                continue
+            ids = postings.doc_ids[:postings.size]
+            tfs = postings.tfs[:postings.size]
+            # doc ids are unique within one posting list, so fancy-index += is safe
+            scores[ids] += self.idf(term) * tfs * (K1 + 1) / (tfs + norm[ids])
+        scores *= self.alive[:n]
+        return scores
+
+    def top(self, terms: List[str], k: int, kinds: Optional[Iterable[str]] = None) -> List[Tuple[int, float]]:
+        scores = self.scores(terms)
+        if kinds is not None:
+            scores *= np.isin(self.kinds[:len(scores)], [KINDS[kind] for kind in kinds])
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        candidates = candidates[np.argsort(-scores[candidates])]
+        return [(int(i), float(scores[i])) for i in candidates]
+
+    def overlap(self, terms: List[str], doc_id: int) -> float:
+        """Harmonic mean of idf-weighted coverage: message terms in the FAQ question, and question terms in the message."""
+        message, question = set(terms), self.question_terms.get(doc_id, frozenset())
+        if not message or not question:
+            return 0.0
+        shared = sum(self.idf(t) for t in message & question)
+        recall = shared / sum(self.idf(t) for t in message)
+        precision = shared / sum(self.idf(t) for t in question)
+        return 0.0 if shared == 0 else 2 * precision * recall / (precision + recall)
+
+
+def profile_documents(faqs: Optional[list], services: Optional[list]) -> List[Document]:
+    docs = [
+        Document("faq", i, (f.get("question") or "").strip(), (f.get("answer") or "").strip())
+        for i, f in enumerate(faqs or []) if f.get("question") or f.get("answer")
+    ]
+    docs += [
+        Document("service", i, (s.get("service") or "").strip(), (s.get("price") or "").strip())
+        for i, s in enumerate(services or []) if s.get("service")
+    ]
+    return docs
+
+
+class BM25Index:
+    def __init__(self, fast_answer_threshold: float):
+        self.fast_answer_threshold = fast_answer_threshold
+        self._tenants: Dict[uuid.UUID, TenantBM25] = {}
+        self._loading: Dict[uuid.UUID, asyncio.Lock] = {}
+        self.loads = 0
+        self.profile_updates = 0
+        self.search_latency = LatencyWindow()
+
+    def update_profile(self, tenant_id: uuid.UUID, version: Optional[str], faqs: Optional[list], services: Optional[list]) -> None:
+        """Replace a loaded tenant's FAQ/service documents (called from setup_tenant)."""
+        index = self._tenants.get(tenant_id)
+        if index is None:
+            return  # built with the new profile on first use
+        index.remove_kind("faq")
+        index.remove_kind("service")
+        for doc in profile_documents(faqs, services):
+            index.add(doc)
+        index.version = version
+        if index.needs_compaction():
+            self._tenants[tenant_id] = index.compacted()
+        self.profile_updates += 1
+
+    def apply_kb_changes(self, changes: List[tuple]) -> None:
+        """Mirror committed KnowledgeBase writes (same tuples as knowledge_index.apply_changes)."""
+        for op, row_id, tenant_id, title, content, _ in changes:
+            index = self._tenants.get(tenant_id)
+            if index is None:
+                continue
+            if op == "delete":
+                index.remove("kb", row_id)
+            else:
+                index.add(Document("kb", row_id, title, content))
+            if index.needs_compaction():
+                self._tenants[tenant_id] = index.compacted()
+
+    async def _index(self, tenant_id: uuid.UUID, version: Optional[str], faqs: Optional[list], services: Optional[list]) -> TenantBM25:
+        index = self._tenants.get(tenant_id)
+        if index is None:
+            lock = self._loading.setdefault(tenant_id, asyncio.Lock())
+            async with lock:
+                index = self._tenants.get(tenant_id)
+                if index is None:
+                    async with AsyncSessionLocal() as db:
+                        rows = (await db.execute(
+                            select(KnowledgeBase.id, KnowledgeBase.title, KnowledgeBase.content)
+                            .where(KnowledgeBase.tenant_id == tenant_id)
+                        )).all()
+                    index = TenantBM25()
+                    for doc in profile_documents(faqs, services):
+                        index.add(doc)
+                    for row in rows:
+                        index.add(Document("kb", row.id, row.title, row.content))
+                    index.version = version
+                    self._tenants[tenant_id] = index
+                    self.loads += 1
+        elif index.version != version:
+            # Setup was saved on another worker
+            self.update_profile(tenant_id, version, faqs, services)
+            index = self._tenants[tenant_id]
+        return index
+
+    async def search(
+        self,
+        tenant_id: uuid.UUID,
+        message_text: str,
+        k: int,
+        version: Optional[str] = None,
+        faqs: Optional[list] = None,
+        services: Optional[list] = None,
+        kinds: Optional[Iterable[str]] = None
+    ) -> List[Snippet]:
+        """
+        Top-k documents for the message. `version` is the tenant's prompt hash;
+        a change triggers a refresh from `faqs` / `services`.
+        """
+        index = await self._index(tenant_id, version, faqs, services)
+        started = time.perf_counter()
+        hits = index.top(tokenize(message_text), k, kinds)
+        self.search_latency.add(time.perf_counter() - started)
+        return [
+            Snippet(index.docs[i].kind, index.docs[i].key, index.docs[i].title, index.docs[i].text, round(score, 4))
+            for i, score in hits
+        ]
+
+    async def fast_answer(
+        self,
+        tenant_id: uuid.UUID,
+        message_text: str,
+        version: Optional[str],
+        faqs: Optional[list],
+        services: Optional[list] = None,
+        threshold: Optional[float] = None
+    ) -> Optional[FastAnswer]:
+        """The stored FAQ answer when the best FAQ match is strong enough to skip the LLM."""
+        index = await self._index(tenant_id, version, faqs, services)
+        terms = tokenize(message_text)
+        started = time.perf_counter()
+        hits = index.top(terms, 1, kinds=("faq",))
+        self.search_latency.add(time.perf_counter() - started)
+        if not hits:
+            return None
+        doc_id, score = hits[0]
+        confidence = round(index.overlap(terms, doc_id), 4)
+        if confidence < (self.fast_answer_threshold if threshold is None else threshold):
+            return None
+        doc = index.docs[doc_id]
+        return FastAnswer(doc.title, doc.text, confidence, round(score, 4))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "tenants": len(self._tenants),
+            "documents": sum(i.live for i in self._tenants.values()),
+            "terms": sum(len(i.df) for i in self._tenants.values()),
+            "tenant_loads": self.loads,
+            "profile_updates": self.profile_updates,
+            "search_latency": self.search_latency.summary(),
+        }
+
+
+bm25_index = BM25Index(fast_answer_threshold=settings.BM25_FAST_ANSWER_THRESHOLD)
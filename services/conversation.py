@@ -0,0 +1,234 @@
+# services/conversation.py
+"""
+Recent turns of each customer conversation, so the AI provider sees the
+context of a multi-turn SMS / chat / email / voice exchange.
+
+Conversations are keyed by (tenant, channel, customer contact). Each one is a
+ring buffer of the last CONVERSATION_MAX_TURNS exchanges, capped at
+MAX_CONVERSATION_TOKENS. A conversation is hydrated from the messages table
+(voice_messages for calls) the first time it is needed and then kept up to
+date in memory by append(). A conversation that has been neither read nor
+appended to for CONVERSATION_IDLE_TTL_SECONDS expires and is re-read from the
+DB on its next turn, which also picks up turns another worker handled.
+"""
+import asyncio
+import logging
+import time
+import uuid
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta
+from typing import Optional, Dict, List, NamedTuple, Deque, Any
+from sqlalchemy import select
+from database import AsyncSessionLocal
+from models import Message, VoiceMessage
+from services.stats import LatencyWindow
+from services.tokens import estimate_tokens
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ConversationKey(NamedTuple):
+    tenant_id: uuid.UUID
+    channel_id: uuid.UUID
+    customer_contact: str
+    voice: bool = False  # history lives in voice_messages instead of messages
+
+
+class Turn(NamedTuple):
+    """One exchange: the customer's message and the reply it got."""
+    message: str
+    reply: str
+    tokens: int
+
+
+def make_turn(message: str, reply: str) -> Turn:
+    return Turn(message, reply, estimate_tokens(message) + estimate_tokens(reply))
+
+
+class Conversation:
+    """Ring buffer of recent turns, trimmed to `max_tokens`."""
+
+    def __init__(self, max_turns: int, max_tokens: int):
+        self.max_tokens = max_tokens
+        self.turns: Deque[Turn] = deque(maxlen=max_turns)
+        self.tokens = 0
+        self.last_used = time.monotonic()
+
+    def touch(self) -> None:
+        self.last_used = time.monotonic()
+
+    def append(self, turn: Turn) -> None:
+        if len(self.turns) == self.turns.maxlen:
+            self.tokens -= self.turns[0].tokens
+        self.turns.append(turn)
+        self.tokens += turn.tokens
+        while self.tokens > self.max_tokens and self.turns:
+            self.tokens -= self.turns.popleft().tokens
+
+    def window(self, budget: int) -> List[Dict[str, str]]:
+        """Newest turns that fit in `budget` tokens, oldest first, as chat messages."""
+        selected = []
+        for turn in reversed(self.turns):
+            if turn.tokens > budget:
+                break
+            budget -= turn.tokens
+            selected.append(turn)
+        history = []
+        for turn in reversed(selected):
+            history.append({"role": "user", "content": turn.message})
+            history.append({"role": "assistant", "content": turn.reply})
+        return history
+
+
+class ConversationStore:
+    def __init__(self, max_conversations: int, max_turns: int, max_tokens: int, idle_ttl: float, lookback_hours: int):
+        self.max_conversations = max_conversations
+        self.max_turns = max_turns
+        self.max_tokens = max_tokens
+        self.idle_ttl = idle_ttl
+        self.lookback_hours = lookback_hours
+        self._conversations: "OrderedDict[ConversationKey, Conversation]" = OrderedDict()
+        self._loading: Dict[ConversationKey, asyncio.Future] = {}
+        self.hits = 0
+        self.loads = 0
+        self.errors = 0
+        self.load_latency = LatencyWindow()
+
+    def _history_query(self, key: ConversationKey):
+        since = datetime.utcnow() - timedelta(hours=self.lookback_hours)
+        if key.voice:
+            query = select(VoiceMessage.transcription, VoiceMessage.ai_response).where(
+                VoiceMessage.tenant_id == key.tenant_id,
+                VoiceMessage.channel_id == key.channel_id,
+                VoiceMessage.from_contact == key.customer_contact,
+                VoiceMessage.transcription.isnot(None),
+                VoiceMessage.ai_response.isnot(None),
+                VoiceMessage.created_at >= since
+            ).order_by(VoiceMessage.created_at.desc())
+        else:
+            query = select(Message.message_text, Message.ai_response).where(
+                Message.tenant_id == key.tenant_id,
+                Message.channel_id == key.channel_id,
+                Message.customer_contact == key.customer_contact,
+                Message.message_text.isnot(None),
+                Message.ai_response.isnot(None),  # skips pending rows (incl. the one being answered)
+                Message.created_at >= since
+            ).order_by(Message.created_at.desc())
+        return query.limit(self.max_turns)
+
+    async def _load(self, key: ConversationKey) -> Conversation:
+        started = time.perf_counter()
+        async with AsyncSessionLocal() as db:
+            rows = (await db.execute(self._history_query(key))).all()
+        conversation = Conversation(self.max_turns, self.max_tokens)
+        for message, reply in reversed(rows):  # oldest first
+            conversation.append(make_turn(message, reply))
+        self.loads += 1
+        self.load_latency.add(time.perf_counter() - started)
+        return conversation
+
+    def _store(self, key: ConversationKey, conversation: Conversation) -> None:
+        self._conversations[key] = conversation
+        self._conversations.move_to_end(key)
+        while len(self._conversations) > self.max_conversations:
+            self._conversations.popitem(last=False)
+
+    async def _conversation(self, key: ConversationKey) -> Conversation:
+        conversation = self._conversations.get(key)
+        if conversation is not None and time.monotonic() - conversation.last_used < self.idle_ttl:
+            self.hits += 1
+            conversation.touch()
+            self._conversations.move_to_end(key)
+            return conversation
+
+        # One DB read per conversation even if several turns arrive at once
+        pending = self._loading.get(key)
+        if pending is not None:
+            try:
+                return await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                if not pending.cancelled():
+                    raise
+                # The loading request was cancelled; load it ourselves
+                return await self._conversation(key)
+        pending = self._loading[key] = asyncio.get_running_loop().create_future()
+        try:
+            conversation = await self._load(key)
+        except Exception as e:
+            pending.set_exception(e)
+            pending.exception()  # waiters (if any) get it; don't warn when there are none
+            raise
+        except BaseException:
+            pending.cancel()
+            raise
+        else:
+            pending.set_result(conversation)
+            self._store(key, conversation)
+            return conversation
+        finally:
+            del self._loading[key]
+
+    async def history(self, key: Optional[ConversationKey], budget: int) -> List[Dict[str, str]]:
+        """
+        Earlier turns of the conversation as chat messages (oldest first),
+        newest turns kept within `budget` tokens. Empty when there is no key
+        or the history can't be read.
+        """
+        if key is None or not key.customer_contact or budget <= 0:
+            return []
+        try:
+            conversation = await self._conversation(key)
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Failed to load conversation history for tenant {key.tenant_id}: {e}")
+            return []
+        return conversation.window(budget)
+
+    async def has_turns(self, key: Optional[ConversationKey]) -> bool:
+        """Whether the conversation has earlier turns (loaded like history(); False if unreadable)."""
+        if key is None or not key.customer_contact:
+            return False
+        try:
+            conversation = await self._conversation(key)
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Failed to load conversation history for tenant {key.tenant_id}: {e}")
+            return False
+        return bool(conversation.turns)
+
+    def append(self, key: Optional[ConversationKey], message: str, reply: str) -> None:
+        """
+        Record a finished turn. Only conversations already in memory are
+        updated; the rest pick the turn up from the DB when first needed.
+        """
+        if key is None or not message or not reply:
+            return
+        conversation = self._conversations.get(key)
+        if conversation is None:
+            return
+        if time.monotonic() - conversation.last_used >= self.idle_ttl:
+            del self._conversations[key]  # expired: re-read with this turn next time
+            return
+        conversation.append(make_turn(message, reply))
+        conversation.touch()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.loads
+        return {
+            "conversations": len(self._conversations),
+            "hits": self.hits,
+            "loads": self.loads,
+            "errors": self.errors,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "load_latency": self.load_latency.summary(),
+        }
+
+
+conversation_store = ConversationStore(
+    max_conversations=settings.CONVERSATION_MAX_CONVERSATIONS,
+    max_turns=settings.CONVERSATION_MAX_TURNS,
+    max_tokens=settings.MAX_CONVERSATION_TOKENS,
+    idle_ttl=settings.CONVERSATION_IDLE_TTL_SECONDS,
+    lookback_hours=settings.CONVERSATION_LOOKBACK_HOURS
+)
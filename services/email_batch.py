@@ -0,0 +1,350 @@
+# services/email_batch.py
+"""
+Batch mode for inbound email.
+
+With EMAIL_BATCH_MODE on, receive_email stores the email as a "pending"
+Message and returns right away. EmailBatcher then claims up to
+EMAIL_BATCH_SIZE pending email rows at a time (FOR UPDATE SKIP LOCKED, so
+several workers can share the backlog), generates the replies with at most
+EMAIL_BATCH_CONCURRENCY provider calls in flight, and writes every reply of
+the batch back with a single UPDATE ... FROM (VALUES ...).
+
+Replies are stored (status "delivering") before any is sent, then each is
+POSTed to EMAIL_REPLY_WEBHOOK_URL (the outbound mail integration) and marked
+"replied", or "failed" if the POST was not accepted. Only "processing" rows
+are ever requeued, so a crash mid-delivery leaves rows in "delivering" for a
+human to check rather than emailing the customer twice. If the batch can't
+be stored, nothing has been sent and its rows go straight back to "pending".
+Without a webhook URL there is no way to send the replies, so batch mode
+stays off and receive_email answers inline.
+"""
+import asyncio
+import logging
+import re
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Optional, Dict, List, Any, Tuple
+import httpx
+from sqlalchemy import select, update, func, values, column, String, Text, Float
+from sqlalchemy.dialects.postgresql import UUID
+from database import AsyncSessionLocal
+from models import Tenant, Channel, Message
+from services.responder import generate_ai_reply, faq_fast_path_threshold
+from services.conversation import ConversationKey
+from services.stats import LatencyWindow
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# receive_email stores "[Subject: <subject>]\n\n<body>" as the message text
+SUBJECT_PREFIX = re.compile(r"\[Subject: ([^\n]*)\]\n\n")
+
+
+def split_subject(message_text: str) -> Tuple[str, str]:
+    """(subject, body) of a stored inbound email; subject is "" when there was none."""
+    match = SUBJECT_PREFIX.match(message_text)
+    if not match:
+        return "", message_text
+    return match.group(1), message_text[match.end():]
+
+
+class EmailBatcher:
+    def __init__(self, batch_size: int, concurrency: int, interval: float, stale_after: timedelta = timedelta(minutes=10)):
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.interval = interval
+        self.stale_after = stale_after
+        self._wakeup = asyncio.Event()
+        self._arrived = 0  # emails queued by this process since the last batch
+        self._task: Optional[asyncio.Task] = None
+        self._skip_logged = False
+        self.batches = 0
+        self.processed = 0
+        self.failed = 0
+        self.undelivered = 0
+        self.last_batch_size = 0
+        self.batch_latency = LatencyWindow()
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    @property
+    def enabled(self) -> bool:
+        """EMAIL_BATCH_MODE and a delivery webhook to send the replies through."""
+        if not settings.EMAIL_BATCH_MODE:
+            return False
+        if not settings.EMAIL_REPLY_WEBHOOK_URL:
+            if not self._skip_logged:
+                self._skip_logged = True
+                logger.warning("Email batch mode disabled: set EMAIL_REPLY_WEBHOOK_URL so batched replies can be delivered")
+            return False
+        return True
+
+    def _pending_email(self):
+        return select(Message.id).join(Channel, Channel.id == Message.channel_id).where(
+            Message.status == "pending",
+            Message.direction == "incoming",
+            Channel.type == "email"
+        )
+
+    async def start(self) -> None:
+        if self.running or not self.enabled:
+            return
+        # Rows left in "processing" by a crashed worker go back to the backlog
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                update(Message)
+                .where(
+                    Message.status == "processing",
+                    Message.updated_at < datetime.utcnow() - self.stale_after,
+                    Message.channel_id.in_(select(Channel.id).where(Channel.type == "email"))
+                )
+                .values(status="pending", updated_at=datetime.utcnow())
+            )
+            await db.commit()
+        if result.rowcount:
+            logger.info(f"Requeued {result.rowcount} stale email replies")
+        self._task = asyncio.create_task(self._loop())
+        logger.info(f"Email batcher started (batch size {self.batch_size}, {self.concurrency} concurrent)")
+
+    async def stop(self) -> None:
+        if not self.running:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def notify(self) -> None:
+        """A pending email was stored; start a batch early once a full one is waiting."""
+        self._arrived += 1
+        if self._arrived >= self.batch_size:
+            self._wakeup.set()
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                count = await self.run_batch()
+            except Exception as e:
+                logger.error(f"Email batch failed: {e}")
+                count = 0
+            if count >= self.batch_size:
+                continue  # backlog: go straight to the next batch
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _claim(self) -> List[Any]:
+        async with AsyncSessionLocal() as db:
+            batch_ids = (
+                self._pending_email()
+                .order_by(Message.created_at)
+                .limit(self.batch_size)
+                .with_for_update(of=Message, skip_locked=True)
+            )
+            rows = (await db.execute(
+                update(Message)
+                .where(Message.id.in_(batch_ids.scalar_subquery()))
+                .values(status="processing", updated_at=datetime.utcnow())
+                .returning(Message.id, Message.tenant_id, Message.channel_id, Message.customer_contact, Message.message_text)
+                .execution_options(synchronize_session=False)
+            )).all()
+            await db.commit()
+        return rows
+
+    async def _settings(self, rows) -> tuple:
+        """Tenants and channels (cache flag, sending address) for a batch, two queries in total."""
+        async with AsyncSessionLocal() as db:
+            tenants = {
+                t.id: t for t in (await db.scalars(
+                    select(Tenant).where(Tenant.id.in_({r.tenant_id for r in rows}))
+                )).all()
+            }
+            channels = {
+                c.id: c for c in (await db.execute(
+                    select(Channel.id, Channel.ai_cache_enabled, Channel.identifier)
+                    .where(Channel.id.in_({r.channel_id for r in rows}))
+                )).all()
+            }
+        return tenants, channels
+
+    async def _deliver(self, client: httpx.AsyncClient, row, channel, subject: str, reply: str) -> bool:
+        """POST one reply to EMAIL_REPLY_WEBHOOK_URL; False if it was not accepted."""
+        payload = {
+            "message_id": str(row.id),
+            "tenant_id": str(row.tenant_id),
+            "from_email": channel.identifier if channel else None,
+            "to_email": row.customer_contact,
+            "subject": f"Re: {subject}" if subject else "Re: your message",
+            "body": reply
+        }
+        try:
+            response = await client.post(settings.EMAIL_REPLY_WEBHOOK_URL, json=payload)
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            logger.error(f"Email reply delivery for message {row.id} failed: {e}")
+            return False
+        return True
+
+    async def _reply(self, row, tenant: Optional[Tenant], channel, slots: asyncio.Semaphore) -> Dict[str, Any]:
+        result = {"id": row.id, "ai_response": None, "confidence_score": None, "reply_source": None, "status": "failed"}
+        if tenant is None:
+            return result
+        _, body = split_subject(row.message_text)
+        async with slots:
+            try:
+                reply, confidence, source = await generate_ai_reply(
+                    tenant_id=tenant.id,
+                    message_text=body,
+                    ai_provider=tenant.ai_provider,
+                    system_prompt=tenant.ai_system_prompt,
+                    use_cache=channel.ai_cache_enabled if channel else True,
+                    core_prompt=tenant.ai_core_prompt,
+                    faqs=tenant.faqs,
+                    services=tenant.services,
+                    faq_fast_path_threshold=faq_fast_path_threshold(tenant.faq_fast_path_enabled, tenant.faq_fast_path_threshold),
+                    conversation=ConversationKey(tenant.id, row.channel_id, row.customer_contact)
+                )
+            except Exception as e:
+                logger.error(f"Email reply for message {row.id} failed: {e}")
+                return result
+        result.update(ai_response=reply, confidence_score=confidence, reply_source=source, status="delivering")
+        return result
+
+    async def _write(self, results: List[Dict[str, Any]]) -> None:
+        """All replies of a batch in one UPDATE ... FROM (VALUES ...)."""
+        replies = values(
+            column("id", UUID(as_uuid=True)),
+            column("ai_response", Text),
+            column("confidence_score", Float),
+            column("reply_source", String),
+            column("status", String),
+            name="replies"
+        ).data([
+            (r["id"], r["ai_response"], r["confidence_score"], r["reply_source"], r["status"]) for r in results
+        ])
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(Message)
+                .where(Message.id == replies.c.id)
+                .values(
+                    ai_response=replies.c.ai_response,
+                    confidence_score=replies.c.confidence_score,
+                    reply_source=replies.c.reply_source,
+                    status=replies.c.status,
+                    updated_at=datetime.utcnow()
+                )
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+
+    async def _release(self, rows) -> None:
+        """Put a batch that could not be stored back to "pending" (none of it was sent)."""
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.execute(
+                    update(Message)
+                    .where(Message.id.in_([row.id for row in rows]), Message.status == "processing")
+                    .values(status="pending", updated_at=datetime.utcnow())
+                    .execution_options(synchronize_session=False)
+                )
+                await db.commit()
+        except Exception as e:
+            # Still "processing": requeued by the stale-row reset on the next start
+            logger.error(f"Failed to release email batch of {len(rows)}: {e}")
+
+    async def _deliver_all(self, rows, channels: Dict, results: List[Dict[str, Any]]) -> None:
+        """Send every stored reply, then mark each row replied / failed (an undelivered reply is kept)."""
+        stored = {r["id"]: r for r in results if r["status"] == "delivering"}
+        slots = asyncio.Semaphore(self.concurrency)
+
+        async def deliver(client: httpx.AsyncClient, row) -> bool:
+            async with slots:
+                subject, _ = split_subject(row.message_text)
+                return await self._deliver(client, row, channels.get(row.channel_id), subject, stored[row.id]["ai_response"])
+
+        sending = [row for row in rows if row.id in stored]
+        async with httpx.AsyncClient(timeout=settings.EMAIL_REPLY_WEBHOOK_TIMEOUT_SECONDS) as client:
+            delivered = await asyncio.gather(*(deliver(client, row) for row in sending))
+        for row, ok in zip(sending, delivered):
+            stored[row.id]["status"] = "replied" if ok else "failed"
+            stored[row.id]["undelivered"] = not ok
+
+        async with AsyncSessionLocal() as db:
+            for status in ("replied", "failed"):
+                ids = [row.id for row in sending if stored[row.id]["status"] == status]
+                if ids:
+                    await db.execute(
+                        update(Message)
+                        .where(Message.id.in_(ids), Message.status == "delivering")
+                        .values(status=status, updated_at=datetime.utcnow())
+                        .execution_options(synchronize_session=False)
+                    )
+            await db.commit()
+
+    async def run_batch(self) -> int:
+        """Claim, answer and store one batch; returns its size (0 when the backlog is empty)."""
+        self._arrived = 0
+        rows = await self._claim()
+        if not rows:
+            return 0
+        started = time.perf_counter()
+        try:
+            tenants, channels = await self._settings(rows)
+            slots = asyncio.Semaphore(self.concurrency)
+            results = await asyncio.gather(*(
+                self._reply(row, tenants.get(row.tenant_id), channels.get(row.channel_id), slots)
+                for row in rows
+            ))
+            await self._write(results)
+        except BaseException:
+            await asyncio.shield(self._release(rows))
+            raise
+        try:
+            await self._deliver_all(rows, channels, results)
+        except Exception as e:
+            logger.error(f"Failed to record email deliveries (rows left in \"delivering\"): {e}")
+
+        failed = sum(1 for r in results if r["status"] == "failed")
+        self.batches += 1
+        self.processed += len(results) - failed
+        self.failed += failed
+        self.undelivered += sum(1 for r in results if r.get("undelivered"))
+        self.last_batch_size = len(results)
+        self.batch_latency.add(time.perf_counter() - started)
+        logger.info(f"Email batch of {len(results)} answered in {time.perf_counter() - started:.2f}s ({failed} failed)")
+        return len(results)
+
+    async def stats(self) -> Dict[str, Any]:
+        try:
+            async with AsyncSessionLocal() as db:
+                backlog = await db.scalar(select(func.count()).select_from(self._pending_email().subquery()))
+        except Exception as e:
+            logger.error(f"Failed to read email backlog: {e}")
+            backlog = None
+        return {
+            "enabled": self.enabled,
+            "running": self.running,
+            "backlog": backlog,
+            "batches": self.batches,
+            "processed": self.processed,
+            "failed": self.failed,
+            "undelivered": self.undelivered,
+            "last_batch_size": self.last_batch_size,
+            "batch_size": self.batch_size,
+            "concurrency": self.concurrency,
+            "batch_latency": self.batch_latency.summary(),
+        }
+
+
+email_batcher = EmailBatcher(
+    batch_size=settings.EMAIL_BATCH_SIZE,
+    concurrency=settings.EMAIL_BATCH_CONCURRENCY,
+    interval=settings.EMAIL_BATCH_INTERVAL_SECONDS
+)
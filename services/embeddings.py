@@ -0,0 +1,109 @@
+# services/embeddings.py
+"""
+Text embedders used by the semantic reply cache and knowledge-base retrieval.
+
+Every embedder returns L2-normalized float32 rows, so cosine similarity is a
+plain dot product. Pick one with EMBEDDING_PROVIDER:
+- "hashing": local, deterministic feature hashing (no network, used in tests)
+- "openai":  OpenAI embeddings API over the shared AI connection pool
+"""
+import logging
+import re
+import zlib
+from typing import List, Dict, Callable, Optional
+import numpy as np
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+_TOKEN = re.compile(r"[a-z0-9']+")
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """L2-normalize each row in place (zero rows stay zero)."""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    np.divide(vectors, norms, out=vectors, where=norms > 0)
+    return vectors
+
+
+class HashingEmbedder:
+    """
+    Bag of words, word bigrams and character trigrams hashed into `dim`
+    signed buckets. Deterministic across processes (crc32, not hash()), so
+    vectors can be stored and compared later. Captures lexical overlap only.
+    """
+
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def _features(self, text: str) -> List[str]:
+        words = _TOKEN.findall((text or "").casefold())
+        features = list(words)
+        features += [f"{a} {b}" for a, b in zip(words, words[1:])]
+        for word in words:
+            padded = f"<{word}>"
+            features += [padded[i:i + 3] for i in range(len(padded) - 2)]
+        return features
+
+    def embed_sync(self, texts: List[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                h = zlib.crc32(feature.encode())
+                vectors[row, h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        return normalize_rows(vectors)
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        return self.embed_sync(texts)
+
+
+class OpenAIEmbedder:
+    """OpenAI embeddings (e.g. text-embedding-3-small) truncated to `dim` dimensions."""
+
+    BATCH_SIZE = 256
+
+    def __init__(self, dim: int = 256, model: str = "text-embedding-3-small"):
+        self.dim = dim
+        self.model = model
+        self.name = f"openai-{model}-{dim}"
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        from ai_providers import openai_client
+
+        rows = []
+        for start in range(0, len(texts), self.BATCH_SIZE):
+            response = await openai_client.embeddings.create(
+                model=self.model,
+                input=[t or " " for t in texts[start:start + self.BATCH_SIZE]],
+                dimensions=self.dim
+            )
+            rows.extend(item.embedding for item in response.data)
+        return normalize_rows(np.asarray(rows, dtype=np.float32).reshape(len(texts), self.dim))
+
+
+# EMBEDDING_PROVIDER -> factory(dim, model)
+EMBEDDERS: Dict[str, Callable[[int, str], object]] = {
+    "hashing": lambda dim, model: HashingEmbedder(dim),
+    "openai": lambda dim, model: OpenAIEmbedder(dim, model),
+}
+
+_embedder: Optional[object] = None
+
+
+def get_embedder():
+    """The process-wide embedder, created from settings on first use."""
+    global _embedder
+    if _embedder is None:
+        factory = EMBEDDERS.get(settings.EMBEDDING_PROVIDER)
+        if factory is None:
+            logger.error(f"Unknown EMBEDDING_PROVIDER {settings.EMBEDDING_PROVIDER!r}, using hashing")
+            factory = EMBEDDERS["hashing"]
+        _embedder = factory(settings.EMBEDDING_DIM, settings.EMBEDDING_MODEL)
+    return _embedder
+
+
+def set_embedder(embedder) -> None:
+    """Swap in another embedder (anything with `dim`, `name` and async `embed(texts)`)."""
+    global _embedder
+    _embedder = embedder
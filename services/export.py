@@ -0,0 +1,96 @@
+# services/export.py
+"""
+Streaming NDJSON / CSV exports of a tenant's history.
+
+export_rows() runs the statement on its own session with a server-side
+cursor (yield_per -> stream_results) and serializes EXPORT_BATCH_SIZE rows
+at a time, optionally gzipping on the fly, so memory stays at one batch
+however many rows the tenant has. It is a plain generator: StreamingResponse
+iterates it in the threadpool and the session lives as long as the
+response (the request's get_db session is already closed by then).
+"""
+import csv
+import io
+import json
+import logging
+import threading
+import uuid
+import zlib
+from datetime import datetime, date
+from typing import Iterator, Optional, Any
+from sqlalchemy import Select
+from database import SessionLocal
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+def _value(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    return value
+
+
+def _ndjson(rows, columns) -> str:
+    return "".join(
+        json.dumps(dict(zip(columns, map(_value, row))), ensure_ascii=False, default=str) + "\n" for row in rows
+    )
+
+
+def _cell(value: Any) -> Any:
+    if value is None:
+        return ""
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False, default=str)  # JSON columns
+    return _value(value)
+
+
+def _csv(rows) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows([_cell(v) for v in row] for row in rows)
+    return buffer.getvalue()
+
+
+_lock = threading.Lock()
+_active = 0  # exports streaming right now; each one holds a pooled DB connection
+
+
+def export_slot_available() -> bool:
+    """Soft cap on concurrent exports (EXPORT_MAX_CONCURRENT), checked before a response starts."""
+    return _active < settings.EXPORT_MAX_CONCURRENT
+
+
+def export_rows(statement: Select, fmt: str, compress: bool = False, batch_size: Optional[int] = None) -> Iterator[bytes]:
+    """Yield `statement`'s rows as NDJSON or CSV (with a header) bytes, one chunk per batch."""
+    global _active
+    batch_size = batch_size or settings.EXPORT_BATCH_SIZE
+    gzip = zlib.compressobj(wbits=31) if compress else None  # 31: gzip container
+
+    with _lock:
+        _active += 1
+    exported = 0
+    try:
+        with SessionLocal() as db:
+            result = db.execute(statement.execution_options(yield_per=batch_size))
+            columns = list(result.keys())
+            header = _csv([columns]) if fmt == "csv" else ""
+            for rows in result.partitions():
+                exported += len(rows)
+                chunk = (header + _csv(rows) if fmt == "csv" else _ndjson(rows, columns)).encode()
+                header = ""
+                if gzip is not None:
+                    chunk = gzip.compress(chunk)  # b"" while the compressor is still buffering
+                if chunk:
+                    yield chunk
+        if header:  # no rows: CSV header only
+            yield header.encode() if gzip is None else gzip.compress(header.encode())
+        if gzip is not None:
+            yield gzip.flush()
+    finally:
+        with _lock:
+            _active -= 1
+        logger.info(f"Exported {exported} rows as {fmt}{'.gz' if compress else ''}")
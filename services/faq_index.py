@@ -0,0 +1,163 @@
+# services/faq_index.py
+"""
+FAQ retrieval mode: instead of sending every FAQ in the system prompt, send
+the tenant's core prompt (Tenant.ai_core_prompt, generated without the FAQ
+list) plus only the FAQ_TOP_N FAQs closest to the customer's message.
+
+Each tenant's FAQs are embedded once into a TenantVectorIndex, rebuilt only
+when the tenant's full prompt (and therefore its FAQ list) changes. With
+RETRIEVAL_BACKEND=bm25 the FAQs are picked from the tenant's BM25 index instead.
+"""
+import asyncio
+import logging
+import time
+import uuid
+from typing import Optional, Dict, List, Tuple, Any
+import numpy as np
+from services.embeddings import get_embedder
+from services.knowledge_index import TenantVectorIndex, Passage
+from services.bm25 import bm25_index
+from services.reply_cache import prompt_hash
+from services.stats import LatencyWindow
+from services.tokens import estimate_tokens
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class _TenantFAQs:
+    def __init__(self, version: str, embedder_name: str, index: TenantVectorIndex):
+        self.version = version
+        self.embedder_name = embedder_name
+        self.index = index
+
+
+def format_faqs(faqs: List[Passage]) -> str:
+    lines = ["RELEVANT FAQS (the FAQs most related to the customer's message)"]
+    for i, faq in enumerate(faqs, start=1):
+        lines.append(f"{i}. Q: {faq.title}\n   A: {faq.content}")
+    return "\n".join(lines)
+
+
+class FAQIndex:
+    def __init__(self, top_n: int, min_faqs: int):
+        self.top_n = top_n
+        self.min_faqs = min_faqs
+        self._tenants: Dict[uuid.UUID, _TenantFAQs] = {}
+        self._building: Dict[uuid.UUID, asyncio.Lock] = {}
+        self._full_tokens: Dict[uuid.UUID, Tuple[str, int]] = {}  # tenant -> (prompt hash, tokens)
+        self.requests = 0
+        self.builds = 0
+        self.full_prompt_tokens = 0
+        self.sent_prompt_tokens = 0
+        self.select_latency = LatencyWindow()
+
+    def applies(self, core_prompt: Optional[str], faqs: Optional[list]) -> bool:
+        """Retrieval only pays off once a tenant has more FAQs than we would send anyway."""
+        return settings.FAQ_RETRIEVAL_ENABLED and bool(core_prompt) and len(faqs or []) > self.min_faqs
+
+    async def _build(self, version: str, faqs: list) -> _TenantFAQs:
+        embedder = get_embedder()
+        items = [
+            Passage((f.get("question") or "").strip(), (f.get("answer") or "").strip())
+            for f in faqs if f.get("question") or f.get("answer")
+        ]
+        vectors = await embedder.embed([f"{p.title}\n{p.content}" for p in items]) if items else np.zeros((0, embedder.dim), dtype=np.float32)
+        index = TenantVectorIndex.build(list(range(len(items))), vectors, items, settings.KB_IVF_MIN_ROWS, settings.KB_IVF_NPROBE)
+        self.builds += 1
+        return _TenantFAQs(version, embedder.name, index)
+
+    async def _tenant(self, tenant_id: uuid.UUID, system_prompt: str, faqs: list) -> _TenantFAQs:
+        version = prompt_hash(system_prompt)  # the full prompt embeds the FAQ list
+        entry = self._tenants.get(tenant_id)
+        if entry is not None and entry.version == version and entry.embedder_name == get_embedder().name:
+            return entry
+        lock = self._building.setdefault(tenant_id, asyncio.Lock())
+        async with lock:
+            entry = self._tenants.get(tenant_id)
+            if entry is None or entry.version != version or entry.embedder_name != get_embedder().name:
+                entry = self._tenants[tenant_id] = await self._build(version, faqs)
+                logger.info(f"FAQ index built for tenant {tenant_id} ({entry.index.size} FAQs)")
+        return entry
+
+    def _full_prompt_tokens(self, tenant_id: uuid.UUID, system_prompt: str) -> int:
+        version = prompt_hash(system_prompt)
+        cached = self._full_tokens.get(tenant_id)
+        if cached is None or cached[0] != version:
+            cached = self._full_tokens[tenant_id] = (version, estimate_tokens(system_prompt))
+        return cached[1]
+
+    async def _select(
+        self,
+        tenant_id: uuid.UUID,
+        message_text: str,
+        system_prompt: str,
+        faqs: list,
+        services: Optional[list],
+        query_vector: Optional[np.ndarray]
+    ) -> List[Passage]:
+        if settings.RETRIEVAL_BACKEND == "bm25":
+            # services too: this call may be the one that (re)builds the tenant's index
+            snippets = await bm25_index.search(
+                tenant_id, message_text, self.top_n,
+                version=prompt_hash(system_prompt), faqs=faqs, services=services, kinds=("faq",)
+            )
+            return [Passage(s.title, s.text) for s in snippets]
+
+        entry = await self._tenant(tenant_id, system_prompt, faqs)
+        if not entry.index.size:
+            return []
+        if query_vector is None:
+            query_vector = (await get_embedder().embed([message_text]))[0]
+        return [entry.index.passages[row_id] for row_id, _ in entry.index.search(query_vector, self.top_n)]
+
+    async def build_prompt(
+        self,
+        tenant_id: uuid.UUID,
+        message_text: str,
+        system_prompt: str,
+        core_prompt: str,
+        faqs: list,
+        services: Optional[list] = None,
+        query_vector: Optional[np.ndarray] = None
+    ) -> Tuple[str, Dict[str, int]]:
+        """
+        Core prompt + the top-N FAQs for this message, and the token accounting
+        {"full_prompt_tokens", "prompt_tokens", "saved_tokens", "faqs_sent"}.
+        """
+        started = time.perf_counter()
+        selected = await self._select(tenant_id, message_text, system_prompt, faqs, services, query_vector)
+        self.select_latency.add(time.perf_counter() - started)
+
+        prompt = f"{core_prompt}\n\n{format_faqs(selected)}" if selected else core_prompt
+        prompt_tokens = estimate_tokens(prompt)
+        full_prompt_tokens = self._full_prompt_tokens(tenant_id, system_prompt)
+
+        self.requests += 1
+        self.full_prompt_tokens += full_prompt_tokens
+        self.sent_prompt_tokens += prompt_tokens
+        return prompt, {
+            "full_prompt_tokens": full_prompt_tokens,
+            "prompt_tokens": prompt_tokens,
+            "saved_tokens": full_prompt_tokens - prompt_tokens,
+            "faqs_sent": len(selected),
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        saved = self.full_prompt_tokens - self.sent_prompt_tokens
+        return {
+            "enabled": settings.FAQ_RETRIEVAL_ENABLED,
+            "backend": settings.RETRIEVAL_BACKEND,
+            "top_n": self.top_n,
+            "tenants": len(self._tenants),
+            "index_builds": self.builds,
+            "requests": self.requests,
+            "prompt_tokens_full": self.full_prompt_tokens,
+            "prompt_tokens_sent": self.sent_prompt_tokens,
+            "prompt_tokens_saved": saved,
+            "avg_saved_per_request": round(saved / self.requests, 1) if self.requests else 0.0,
+            "select_latency": self.select_latency.summary(),
+        }
+
+
+faq_index = FAQIndex(top_n=settings.FAQ_TOP_N, min_faqs=settings.FAQ_RETRIEVAL_MIN_FAQS)
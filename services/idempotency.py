@@ -0,0 +1,93 @@
+# services/idempotency.py
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Optional, Union, Callable, Awaitable, Dict, Any
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class RecentReplies:
+    """
+    Bounded, TTL'd map of webhook key (Twilio MessageSid / CallSid) -> TwiML body.
+
+    While the first delivery is still being processed the entry is a Future, so a
+    retry that arrives mid-flight waits for the same reply instead of running the
+    AI again. The unique external_id column on messages/voice_messages covers
+    retries that land on another worker or arrive after eviction.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.db_hits = 0
+
+    def _get(self, key: str) -> Optional[Union[bytes, asyncio.Future]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, stored_at = entry
+        if isinstance(value, bytes) and time.monotonic() - stored_at > self.ttl:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def _put(self, key: str, value: Union[bytes, asyncio.Future]) -> None:
+        self._entries[key] = (value, time.monotonic())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            oldest_key = next(iter(self._entries))
+            oldest = self._entries[oldest_key][0]
+            if isinstance(oldest, asyncio.Future):
+                break  # never evict an in-flight delivery; trimmed on a later put
+            del self._entries[oldest_key]
+
+    async def run_once(self, key: Optional[str], handler: Callable[[], Awaitable[bytes]]) -> bytes:
+        """Return the cached reply for `key`, or run `handler` once and cache its reply."""
+        if not key:
+            return await handler()
+
+        cached = self._get(key)
+        if isinstance(cached, bytes):
+            self.hits += 1
+            logger.info(f"Duplicate webhook {key}: returning cached reply")
+            return cached
+        if cached is not None:
+            self.hits += 1
+            logger.info(f"Duplicate webhook {key}: waiting for in-flight reply")
+            try:
+                return await asyncio.shield(cached)
+            except asyncio.CancelledError:
+                if not cached.cancelled():
+                    raise
+                # The first delivery failed; handle this one ourselves
+                return await self.run_once(key, handler)
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._put(key, future)
+        try:
+            body = await handler()
+        except BaseException:
+            self._entries.pop(key, None)
+            future.cancel()
+            raise
+
+        future.set_result(body)
+        self._put(key, body)
+        return body
+
+    def stats(self) -> Dict[str, Any]:
+        return {"hits": self.hits, "db_hits": self.db_hits, "misses": self.misses, "size": len(self._entries)}
+
+
+recent_replies = RecentReplies(
+    maxsize=settings.WEBHOOK_DEDUPE_MAX_SIZE,
+    ttl=settings.WEBHOOK_DEDUPE_TTL_SECONDS
+)
@@ -0,0 +1,376 @@
+# services/knowledge_index.py
+"""
+Per-tenant vector index over knowledge_base rows, used to put the most
+relevant passages into the AI prompt.
+
+A tenant's index is built on its first search from `knowledge_base.embedding`.
+Rows without a stored vector, or with one from a different embedder size, are
+embedded at load time. Small tenants are searched exactly with one matrix-vector
+product. From KB_IVF_MIN_ROWS rows up, vectors are grouped into ~sqrt(n) k-means
+clusters (IVF) and only the KB_IVF_NPROBE closest clusters are scanned. That
+keeps a 100k-chunk search well under a millisecond.
+
+Inserts, updates and deletes of KnowledgeBase rows are applied incrementally
+after the session commits (see the SQLAlchemy event hooks at the bottom), to
+this index and to the tenant's BM25 index.
+"""
+import asyncio
+import logging
+import time
+import uuid
+from typing import Optional, Dict, List, NamedTuple, Tuple, Any
+import numpy as np
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+from database import AsyncSessionLocal
+from models import KnowledgeBase
+from services.embeddings import get_embedder, normalize_rows
+from services.reply_cache import reply_cache
+from services.semantic_cache import semantic_cache
+from services.bm25 import bm25_index
+from services.stats import LatencyWindow
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+KMEANS_ITERATIONS = 8
+KMEANS_SAMPLE_PER_LIST = 16
+ASSIGN_BATCH = 8192
+
+
+class Passage(NamedTuple):
+    title: str
+    content: str
+
+
+class RetrievedPassage(NamedTuple):
+    id: uuid.UUID
+    title: str
+    content: str
+    score: float
+
+
+class _PostingList:
+    """Growable float32 block of vectors plus their row ids."""
+
+    def __init__(self, dim: int, vectors: Optional[np.ndarray] = None, ids: Optional[List[Any]] = None):
+        self.vectors = vectors if vectors is not None else np.zeros((16, dim), dtype=np.float32)
+        self.ids: List[Any] = ids if ids is not None else []
+
+    @property
+    def size(self) -> int:
+        return len(self.ids)
+
+    def append(self, row_id, vector: np.ndarray) -> int:
+        row = self.size
+        if row == len(self.vectors):
+            grown = np.zeros((max(16, row * 2), self.vectors.shape[1]), dtype=np.float32)
+            grown[:row] = self.vectors
+            self.vectors = grown
+        self.vectors[row] = vector
+        self.ids.append(row_id)
+        return row
+
+    def remove(self, row: int) -> Optional[Any]:
+        """Swap-remove `row`; returns the id that moved into it, if any."""
+        last = self.size - 1
+        moved = None
+        if row != last:
+            self.vectors[row] = self.vectors[last]
+            self.ids[row] = self.ids[last]
+            moved = self.ids[row]
+        self.ids.pop()
+        return moved
+
+
+def _train_centroids(vectors: np.ndarray, nlist: int, seed: int = 0) -> np.ndarray:
+    """Spherical k-means on a sample of the rows."""
+    rng = np.random.default_rng(seed)
+    sample_size = min(len(vectors), nlist * KMEANS_SAMPLE_PER_LIST)
+    sample = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+    centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+    for _ in range(KMEANS_ITERATIONS):
+        assign = np.argmax(sample @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, sample)
+        filled = np.bincount(assign, minlength=nlist) > 0
+        centroids[filled] = sums[filled]  # empty clusters keep their old centroid
+        normalize_rows(centroids)
+    return centroids
+
+
+def _assign(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    return np.concatenate([
+        np.argmax(vectors[start:start + ASSIGN_BATCH] @ centroids.T, axis=1)
+        for start in range(0, len(vectors), ASSIGN_BATCH)
+    ]) if len(vectors) else np.zeros(0, dtype=np.int64)
+
+
+class TenantVectorIndex:
+    """
+    Cosine top-k over one tenant's passages. Vectors must be L2-normalized.
+    `centroids is None` means a single exact (flat) list.
+    """
+
+    def __init__(self, dim: int, nprobe: int):
+        self.dim = dim
+        self.nprobe = nprobe
+        self.centroids: Optional[np.ndarray] = None
+        self.lists: List[_PostingList] = [_PostingList(dim)]
+        self.where: Dict[Any, Tuple[int, int]] = {}  # id -> (list, row)
+        self.passages: Dict[Any, Passage] = {}
+        self.built_size = 0
+
+    @classmethod
+    def build(cls, ids: List[Any], vectors: np.ndarray, passages: List[Passage], ivf_min_rows: int, nprobe: int) -> "TenantVectorIndex":
+        index = cls(vectors.shape[1], nprobe)
+        index.passages = dict(zip(ids, passages))
+        index.built_size = len(ids)
+
+        if len(ids) < ivf_min_rows:
+            block = np.zeros((max(16, len(ids)), index.dim), dtype=np.float32)
+            block[:len(ids)] = vectors
+            index.lists = [_PostingList(index.dim, block, list(ids))]
+        else:
+            nlist = int(np.sqrt(len(ids)))
+            index.centroids = _train_centroids(vectors, nlist)
+            assign = _assign(vectors, index.centroids)
+            order = np.argsort(assign, kind="stable")
+            bounds = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=nlist))])
+            index.lists = [
+                _PostingList(index.dim, vectors[order[bounds[l]:bounds[l + 1]]].copy(), [ids[i] for i in order[bounds[l]:bounds[l + 1]]])
+                for l in range(nlist)
+            ]
+
+        for list_no, posting in enumerate(index.lists):
+            for row, row_id in enumerate(posting.ids):
+                index.where[row_id] = (list_no, row)
+        return index
+
+    @property
+    def size(self) -> int:
+        return len(self.where)
+
+    def add(self, row_id, vector: np.ndarray, passage: Passage) -> None:
+        self.remove(row_id)
+        list_no = int(np.argmax(self.centroids @ vector)) if self.centroids is not None else 0
+        self.where[row_id] = (list_no, self.lists[list_no].append(row_id, vector))
+        self.passages[row_id] = passage
+
+    def remove(self, row_id) -> None:
+        location = self.where.pop(row_id, None)
+        if location is None:
+            return
+        list_no, row = location
+        moved = self.lists[list_no].remove(row)
+        if moved is not None:
+            self.where[moved] = (list_no, row)
+        self.passages.pop(row_id, None)
+
+    def search(self, query: np.ndarray, k: int) -> List[Tuple[Any, float]]:
+        query = np.asarray(query, dtype=np.float32)  # a float64 query falls off the BLAS fast path
+        if self.centroids is not None and len(self.lists) > self.nprobe:
+            probe = np.argpartition(-(self.centroids @ query), self.nprobe)[:self.nprobe]
+        else:
+            probe = range(len(self.lists))
+
+        blocks, scores = [], []
+        for list_no in probe:
+            posting = self.lists[list_no]
+            if posting.size:
+                blocks.append(posting)
+                scores.append(posting.vectors[:posting.size] @ query)
+        if not scores:
+            return []
+
+        scores = np.concatenate(scores) if len(scores) > 1 else scores[0]
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+        top = top[np.argsort(-scores[top])]
+
+        offsets = np.cumsum([b.size for b in blocks])
+        results = []
+        for i in top:
+            block = int(np.searchsorted(offsets, i, side="right"))
+            row = int(i - (offsets[block - 1] if block else 0))
+            results.append((blocks[block].ids[row], float(scores[i])))
+        return results
+
+    def needs_rebuild(self, ivf_min_rows: int) -> bool:
+        """Grown enough since the last build that the list layout is off (or IVF is now worth it)."""
+        return self.size >= ivf_min_rows and self.size > 2 * max(self.built_size, 1)
+
+
+class KnowledgeIndex:
+    def __init__(self, top_k: int, min_score: float, ivf_min_rows: int, nprobe: int):
+        self.top_k = top_k
+        self.min_score = min_score
+        self.ivf_min_rows = ivf_min_rows
+        self.nprobe = nprobe
+        self._tenants: Dict[uuid.UUID, TenantVectorIndex] = {}
+        self._loading: Dict[uuid.UUID, asyncio.Lock] = {}
+        self.loads = 0
+        self.incremental_updates = 0
+        self.search_latency = LatencyWindow()
+
+    async def _load(self, tenant_id: uuid.UUID) -> TenantVectorIndex:
+        embedder = get_embedder()
+        async with AsyncSessionLocal() as db:
+            rows = (await db.execute(
+                select(KnowledgeBase.id, KnowledgeBase.title, KnowledgeBase.content, KnowledgeBase.embedding)
+                .where(KnowledgeBase.tenant_id == tenant_id)
+            )).all()
+
+        vectors = np.zeros((len(rows), embedder.dim), dtype=np.float32)
+        missing = []
+        for i, row in enumerate(rows):
+            if row.embedding and len(row.embedding) == embedder.dim:
+                vectors[i] = row.embedding
+            else:
+                missing.append(i)
+        if missing:
+            vectors[missing] = await embedder.embed([f"{rows[i].title}\n{rows[i].content}" for i in missing])
+        normalize_rows(vectors)
+
+        # k-means and cluster assignment are pure NumPy; keep them off the event loop
+        index = await asyncio.to_thread(
+            TenantVectorIndex.build,
+            [r.id for r in rows], vectors, [Passage(r.title, r.content) for r in rows],
+            self.ivf_min_rows, self.nprobe
+        )
+        self.loads += 1
+        logger.info(
+            f"Knowledge index loaded {index.size} passages for tenant {tenant_id} "
+            f"({len(missing)} embedded at load, {'ivf' if index.centroids is not None else 'flat'})"
+        )
+        return index
+
+    async def _index(self, tenant_id: uuid.UUID) -> TenantVectorIndex:
+        index = self._tenants.get(tenant_id)
+        if index is not None and index.dim == get_embedder().dim and not index.needs_rebuild(self.ivf_min_rows):
+            return index
+        lock = self._loading.setdefault(tenant_id, asyncio.Lock())
+        async with lock:
+            index = self._tenants.get(tenant_id)
+            if index is None or index.dim != get_embedder().dim or index.needs_rebuild(self.ivf_min_rows):
+                index = self._tenants[tenant_id] = await self._load(tenant_id)
+        return index
+
+    async def search(
+        self,
+        tenant_id: uuid.UUID,
+        message_text: str,
+        query_vector: Optional[np.ndarray] = None,
+        k: Optional[int] = None
+    ) -> List[RetrievedPassage]:
+        """Top-k passages scoring at least KB_MIN_SCORE; `query_vector` skips re-embedding the message."""
+        index = await self._index(tenant_id)
+        if not index.size:
+            return []
+        if query_vector is None:
+            query_vector = (await get_embedder().embed([message_text]))[0]
+
+        started = time.perf_counter()
+        hits = index.search(query_vector, k or self.top_k)
+        self.search_latency.add(time.perf_counter() - started)
+        return [
+            RetrievedPassage(row_id, index.passages[row_id].title, index.passages[row_id].content, round(score, 4))
+            for row_id, score in hits if score >= self.min_score
+        ]
+
+    def apply_changes(self, changes: List[tuple]) -> None:
+        """Apply committed KnowledgeBase writes to already-loaded tenant indexes."""
+        embedder = get_embedder()
+        for op, row_id, tenant_id, title, content, embedding in changes:
+            # Cached answers may quote the old knowledge base
+            reply_cache.invalidate_tenant(tenant_id)
+            semantic_cache.invalidate_tenant(tenant_id)
+
+            index = self._tenants.get(tenant_id)
+            if index is None:
+                continue  # not loaded yet; the lazy load will see the new rows
+            if op == "delete":
+                index.remove(row_id)
+            elif embedding and len(embedding) == index.dim:
+                index.add(row_id, normalize_rows(np.asarray([embedding], dtype=np.float32))[0], Passage(title, content))
+            elif hasattr(embedder, "embed_sync") and embedder.dim == index.dim:
+                index.add(row_id, embedder.embed_sync([f"{title}\n{content}"])[0], Passage(title, content))
+            else:
+                # Needs a remote embedding call: rebuild on the next search instead
+                self._tenants.pop(tenant_id, None)
+                continue
+            self.incremental_updates += 1
+
+    def invalidate_tenant(self, tenant_id: uuid.UUID) -> None:
+        self._tenants.pop(tenant_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": settings.KB_RETRIEVAL_ENABLED,
+            "tenants": len(self._tenants),
+            "passages": sum(i.size for i in self._tenants.values()),
+            "ivf_tenants": sum(1 for i in self._tenants.values() if i.centroids is not None),
+            "tenant_loads": self.loads,
+            "incremental_updates": self.incremental_updates,
+            "search_latency": self.search_latency.summary(),
+        }
+
+
+knowledge_index = KnowledgeIndex(
+    top_k=settings.KB_TOP_K,
+    min_score=settings.KB_MIN_SCORE,
+    ivf_min_rows=settings.KB_IVF_MIN_ROWS,
+    nprobe=settings.KB_IVF_NPROBE
+)
+
+
+def format_passages(passages: List[RetrievedPassage], max_chars: int) -> str:
+    """Prompt block listing retrieved passages, each trimmed to `max_chars`."""
+    lines = ["Relevant knowledge base excerpts (use them if they answer the question):"]
+    for p in passages:
+        content = p.content if len(p.content) <= max_chars else p.content[:max_chars].rsplit(" ", 1)[0] + "..."
+        lines.append(f"- {p.title}: {content}")
+    return "\n".join(lines)
+
+
+# ==========================================
+# Keep loaded indexes in sync with KnowledgeBase writes
+# ==========================================
+_CHANGES_KEY = "knowledge_index_changes"
+
+
+def _record(op: str, target: KnowledgeBase) -> None:
+    session = Session.object_session(target)
+    if session is None:
+        return
+    session.info.setdefault(_CHANGES_KEY, []).append(
+        (op, target.id, target.tenant_id, target.title, target.content, target.embedding)
+    )
+
+
+@event.listens_for(KnowledgeBase, "after_insert")
+def _kb_inserted(mapper, connection, target):
+    _record("upsert", target)
+
+
+@event.listens_for(KnowledgeBase, "after_update")
+def _kb_updated(mapper, connection, target):
+    _record("upsert", target)
+
+
+@event.listens_for(KnowledgeBase, "after_delete")
+def _kb_deleted(mapper, connection, target):
+    _record("delete", target)
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_kb_changes(session):
+    changes = session.info.pop(_CHANGES_KEY, None)
+    if changes:
+        knowledge_index.apply_changes(changes)
+        bm25_index.apply_kb_changes(changes)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_kb_changes(session):
+    session.info.pop(_CHANGES_KEY, None)
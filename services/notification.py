@@ -0,0 +1,29 @@
+# services/notification.py
+import asyncio
+import logging
+from twilio.rest import Client
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Initialize Twilio client
+twilio_client = None
+if settings.TWILIO_ACCOUNT_SID and settings.TWILIO_AUTH_TOKEN:
+    twilio_client = Client(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN)
+
+
+async def send_sms_message(from_number: str, to_number: str, body: str) -> str:
+    """
+    Send an outbound SMS through Twilio and return its SID.
+    The Twilio SDK is blocking, so the call runs in a worker thread.
+    """
+    if not twilio_client:
+        raise RuntimeError("Twilio is not configured. Check TWILIO_ACCOUNT_SID and TWILIO_AUTH_TOKEN.")
+
+    twilio_message = await asyncio.to_thread(
+        twilio_client.messages.create,
+        body=body,
+        from_=from_number,
+        to=to_number
+    )
+    return twilio_message.sid
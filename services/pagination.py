@@ -0,0 +1,109 @@
+# services/pagination.py
+"""
+Keyset (cursor) pagination for the dashboard list endpoints.
+
+Pages are ordered by (created_at, id) and the next page starts after the last
+row of the previous one, so every page is one index range scan on
+(tenant_id, created_at) however deep the client pages. The cursor handed to
+clients is an opaque token encoding that last (created_at, id).
+
+Totals are optional: counting a busy tenant's history costs a full index scan,
+so ListTotals caches each count for LIST_TOTAL_CACHE_TTL_SECONDS and the
+lists report it as an estimate.
+"""
+import base64
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional, Tuple, List, Hashable, Callable, Dict, Any
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Query
+from config import settings
+
+
+class InvalidCursor(ValueError):
+    """The cursor token could not be decoded."""
+
+
+def encode_cursor(created_at: datetime, row_id: uuid.UUID) -> str:
+    raw = f"{created_at.isoformat()}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token: str) -> Tuple[datetime, uuid.UUID]:
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)).decode()
+        created_at, row_id = raw.split("|")
+        return datetime.fromisoformat(created_at), uuid.UUID(row_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise InvalidCursor(f"invalid cursor: {token!r}") from e
+
+
+def keyset_page(
+    query: Query,
+    created_column,
+    id_column,
+    cursor: Optional[str],
+    limit: int,
+    descending: bool = True
+) -> Tuple[List[Any], Optional[str]]:
+    """
+    One page of `query` ordered by (created_column, id_column); returns
+    (rows, next_cursor), next_cursor being None on the last page.
+    Raises InvalidCursor.
+    """
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        if descending:
+            # created_at <= x keeps a plain range on the (tenant_id, created_at) index
+            after = and_(created_column <= created_at, or_(created_column < created_at, id_column < row_id))
+        else:
+            after = and_(created_column >= created_at, or_(created_column > created_at, id_column > row_id))
+        query = query.filter(after)
+    order = (created_column.desc(), id_column.desc()) if descending else (created_column.asc(), id_column.asc())
+    rows = query.order_by(*order).limit(limit + 1).all()
+
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(getattr(last, created_column.key), getattr(last, id_column.key))
+
+
+class ListTotals:
+    """Bounded, TTL'd cache of list totals (list kind, tenant, filters) -> row count."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, Tuple[int, float]]" = OrderedDict()
+        self._lock = threading.Lock()  # list endpoints run in the threadpool
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, count: Callable[[], int]) -> int:
+        """Cached total for `key`, or run `count` and cache it."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[1] <= self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        total = count()
+        with self._lock:
+            self._entries[key] = (total, now)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return total
+
+    def stats(self) -> Dict[str, Any]:
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses, "ttl_seconds": self.ttl}
+
+
+list_totals = ListTotals(settings.LIST_TOTAL_CACHE_MAX_SIZE, settings.LIST_TOTAL_CACHE_TTL_SECONDS)
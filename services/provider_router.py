@@ -0,0 +1,367 @@
+# services/provider_router.py
+"""
+Routing of AI completions across the configured providers (OpenAI, Gemini).
+
+- Failover: if the tenant's provider fails, the next healthy provider answers.
+- Hedging: if the primary hasn't answered within its p95 latency, the next
+  provider is started as well and the first reply wins (the other is cancelled).
+- Circuit breakers per provider/model: after AI_BREAKER_FAILURES consecutive
+  failures, or an error rate above AI_BREAKER_ERROR_RATE, the provider is
+  skipped for AI_BREAKER_COOLDOWN_SECONDS, then a single probe call is let
+  through (concurrent requests skip the provider until the probe finishes).
+- Admission control (services/rate_limiter.py): every call first takes a slot
+  from its provider/model limiter; a provider that is out of budget is
+  treated like a failed one (without tripping its breaker).
+
+Latency, error rate and breaker state per provider/model are kept in
+ProviderHealth and exposed by stats().
+"""
+import asyncio
+import logging
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import nullcontext
+from typing import Optional, Dict, List, Tuple, Callable, Awaitable, AsyncIterator, Any
+from services.stats import LatencyWindow
+from services.rate_limiter import AILimiter, RateLimited
+from services.tokens import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# (provider, model)
+Candidate = Tuple[str, str]
+
+
+class NoProviderAvailable(Exception):
+    """Every provider failed, is unconfigured or has its circuit breaker open."""
+
+
+class UnsupportedProvider(ValueError):
+    """The tenant's ai_provider is not one the router knows."""
+
+
+class CircuitOpen(Exception):
+    """The provider's breaker is open, or its half-open probe is already in flight."""
+
+
+class ProviderHealth:
+    """Latency / error tracking and circuit breaker for one provider + model."""
+
+    def __init__(self, failure_threshold: int, error_rate_threshold: float, cooldown: float, window: int = 100):
+        self.failure_threshold = failure_threshold
+        self.error_rate_threshold = error_rate_threshold
+        self.cooldown = cooldown
+        self.latency = LatencyWindow()
+        self._outcomes = deque(maxlen=window)  # True = failure
+        self.calls = 0
+        self.errors = 0
+        self.cancelled_calls = 0
+        self.hedges = 0  # times this provider was started as a hedge
+        self.hedge_wins = 0
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self.trips = 0
+        self._probing = False  # the half-open probe slot is taken
+        self._lock = threading.Lock()
+        self.last_error: Optional[str] = None
+
+    @property
+    def error_rate(self) -> float:
+        return sum(self._outcomes) / len(self._outcomes) if self._outcomes else 0.0
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return "half_open"
+        return "open"
+
+    def available(self) -> bool:
+        """Whether a call may be started now (no side effects)."""
+        state = self.state
+        return state == "closed" or (state == "half_open" and not self._probing)
+
+    def begin(self) -> bool:
+        """
+        Claim a call; returns whether it is the half-open probe (pass that to
+        success/failure/cancelled). Raises CircuitOpen while the breaker is
+        open or another call holds the probe slot.
+        """
+        with self._lock:
+            state = self.state
+            if state == "open" or (state == "half_open" and self._probing):
+                raise CircuitOpen(f"circuit breaker {state}")
+            self.calls += 1
+            if state == "half_open":
+                self._probing = True
+                return True
+            return False
+
+    def success(self, seconds: float, probe: bool = False) -> None:
+        self.latency.add(seconds)
+        self._outcomes.append(False)
+        self.consecutive_failures = 0
+        self.opened_at = None
+        if probe:
+            self._probing = False
+
+    def failure(self, error: Exception, probe: bool = False) -> None:
+        self.errors += 1
+        self._outcomes.append(True)
+        self.consecutive_failures += 1
+        self.last_error = f"{type(error).__name__}: {error}"[:200]
+        if probe:
+            self._probing = False
+        tripped = (
+            self.consecutive_failures >= self.failure_threshold
+            or (len(self._outcomes) >= 20 and self.error_rate > self.error_rate_threshold)
+        )
+        if self.opened_at is not None or tripped:
+            if self.opened_at is None:
+                self.trips += 1
+            self.opened_at = time.monotonic()  # (re)open: failed probe restarts the cooldown
+
+    def cancelled(self, probe: bool = False) -> None:
+        """Call abandoned (lost a hedge race, client gone); counts as neither success nor failure."""
+        self.cancelled_calls += 1
+        if probe:
+            self._probing = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "calls": self.calls,
+            "errors": self.errors,
+            "cancelled": self.cancelled_calls,
+            "error_rate": round(self.error_rate, 4),
+            "trips": self.trips,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "latency": self.latency.summary(),
+            "last_error": self.last_error,
+        }
+
+
+class ProviderRouter:
+    def __init__(
+        self,
+        completions: Dict[str, Callable[..., Awaitable[str]]],
+        streams: Dict[str, Callable[..., AsyncIterator[str]]],
+        default_models: Dict[str, str],
+        configured: Callable[[str], bool],
+        hedge_enabled: bool,
+        hedge_default_delay: float,
+        hedge_min_delay: float,
+        hedge_min_samples: int,
+        breaker_failures: int,
+        breaker_error_rate: float,
+        breaker_cooldown: float,
+        limiter: Optional[AILimiter] = None,
+        completion_tokens: int = 300
+    ):
+        self.completions = completions
+        self.streams = streams
+        self.default_models = default_models
+        self.configured = configured
+        self.hedge_enabled = hedge_enabled
+        self.hedge_default_delay = hedge_default_delay
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_min_samples = hedge_min_samples
+        self.breaker_failures = breaker_failures
+        self.breaker_error_rate = breaker_error_rate
+        self.breaker_cooldown = breaker_cooldown
+        self.limiter = limiter
+        self.completion_tokens = completion_tokens  # reply size assumed when charging the tokens-per-minute budget
+        self._health: Dict[Candidate, ProviderHealth] = {}
+        self.fallbacks = 0  # requests no provider could answer
+
+    def health(self, provider: str, model: str) -> ProviderHealth:
+        health = self._health.get((provider, model))
+        if health is None:
+            health = self._health[(provider, model)] = ProviderHealth(
+                self.breaker_failures, self.breaker_error_rate, self.breaker_cooldown
+            )
+        return health
+
+    def candidates(self, ai_provider: str, model: Optional[str]) -> List[Candidate]:
+        """
+        The tenant's provider/model first, then the other configured providers
+        (default models) ordered by error rate and p95 latency. Providers with
+        an open breaker are left out. Raises UnsupportedProvider for a
+        provider the router doesn't know, rather than quietly using the others.
+        """
+        if ai_provider not in self.completions:
+            raise UnsupportedProvider(f"AI provider not supported: {ai_provider}")
+        ordered = []
+        if self.configured(ai_provider):
+            ordered.append((ai_provider, model or self.default_models[ai_provider]))
+        backups = [
+            (name, self.default_models[name]) for name in self.completions
+            if name != ai_provider and self.configured(name)
+        ]
+        backups.sort(key=lambda c: (round(self.health(*c).error_rate, 1), self.health(*c).latency.percentile(95)))
+        return [c for c in ordered + backups if self.health(*c).available()]
+
+    def hedge_delay(self, candidate: Candidate) -> float:
+        """How long to wait for `candidate` before starting a hedge: its p95 latency."""
+        latency = self.health(*candidate).latency
+        if latency.count < self.hedge_min_samples:
+            return self.hedge_default_delay
+        return max(self.hedge_min_delay, latency.percentile(95))
+
+    def _tokens(self, message_text: str, system_prompt: str, history: Optional[list]) -> int:
+        """Estimated prompt + reply tokens of one call, for the tokens-per-minute budget."""
+        tokens = estimate_tokens(system_prompt) + estimate_tokens(message_text) + self.completion_tokens
+        return tokens + sum(estimate_tokens(turn["content"]) for turn in history or ())
+
+    def _slot(self, candidate: Candidate, tenant_id: Optional[uuid.UUID], tokens: int):
+        if self.limiter is None:
+            return nullcontext(0.0)
+        return self.limiter.slot(*candidate, tenant_id, tokens)
+
+    async def _call(self, candidate: Candidate, args: tuple, tenant_id: Optional[uuid.UUID], tokens: int) -> str:
+        provider, model = candidate
+        health = self.health(provider, model)
+        async with self._slot(candidate, tenant_id, tokens):
+            probe = health.begin()
+            started = time.perf_counter()
+            try:
+                reply = await self.completions[provider](args[0], args[1], model, *args[2:])
+                if not reply:
+                    raise ValueError("empty reply")
+            except asyncio.CancelledError:
+                health.cancelled(probe)
+                raise
+            except Exception as e:
+                health.failure(e, probe)
+                logger.warning(f"AI provider {provider}/{model} failed: {e}")
+                raise
+            health.success(time.perf_counter() - started, probe)
+            return reply
+
+    async def complete(
+        self,
+        message_text: str,
+        ai_provider: str,
+        system_prompt: str,
+        model: Optional[str],
+        temperature: float,
+        history: Optional[list] = None,
+        tenant_id: Optional[uuid.UUID] = None
+    ) -> Tuple[str, Candidate]:
+        """
+        Returns (reply, (provider, model) that produced it).
+        `tenant_id` is the fair-queuing key in the limiter.
+        Raises NoProviderAvailable when no provider could answer (including
+        when all of them are out of rate-limit budget), UnsupportedProvider
+        for an unknown `ai_provider`.
+        """
+        queue = self.candidates(ai_provider, model)
+        if not queue:
+            self.fallbacks += 1
+            raise NoProviderAvailable(f"no healthy AI provider for {ai_provider}")
+
+        args = (message_text, system_prompt, temperature, history)
+        tokens = self._tokens(message_text, system_prompt, history)
+        primary = queue.pop(0)
+        tasks: Dict[asyncio.Task, Candidate] = {asyncio.create_task(self._call(primary, args, tenant_id, tokens)): primary}
+        hedged = False
+        errors = []
+        try:
+            while tasks:
+                # Hedge once, only while the primary alone is in flight
+                timeout = self.hedge_delay(primary) if self.hedge_enabled and queue and not hedged else None
+                done, _ = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedged = True
+                    backup = queue.pop(0)
+                    self.health(*backup).hedges += 1
+                    logger.info(f"AI provider {primary[0]} slower than {timeout:.2f}s, hedging with {backup[0]}")
+                    tasks[asyncio.create_task(self._call(backup, args, tenant_id, tokens))] = backup
+                    continue
+
+                for task in done:
+                    candidate = tasks.pop(task)
+                    if task.exception() is None:
+                        if candidate != primary and hedged:
+                            self.health(*candidate).hedge_wins += 1
+                        return task.result(), candidate
+                    errors.append(f"{candidate[0]}: {task.exception()}")
+
+                if not tasks and queue:
+                    # Everything in flight failed: fail over to the next provider
+                    backup = queue.pop(0)
+                    tasks[asyncio.create_task(self._call(backup, args, tenant_id, tokens))] = backup
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        self.fallbacks += 1
+        raise NoProviderAvailable("; ".join(errors))
+
+    async def stream(
+        self,
+        message_text: str,
+        ai_provider: str,
+        system_prompt: str,
+        model: Optional[str],
+        temperature: float,
+        history: Optional[list] = None,
+        tenant_id: Optional[uuid.UUID] = None
+    ) -> AsyncIterator[str]:
+        """
+        Streaming variant of complete(). Fails over to the next provider only
+        until the first chunk is sent; a failure after that is raised.
+        Not hedged (a second stream would double the provider cost per chunk).
+        The limiter slot is held until the stream ends.
+        """
+        errors = []
+        tokens = self._tokens(message_text, system_prompt, history)
+        for candidate in self.candidates(ai_provider, model):
+            provider, model_name = candidate
+            if provider not in self.streams:
+                continue
+            health = self.health(provider, model_name)
+            try:
+                async with self._slot(candidate, tenant_id, tokens):
+                    probe = health.begin()
+                    started = time.perf_counter()
+                    sent = False
+                    try:
+                        async for text in self.streams[provider](
+                            message_text, system_prompt, model_name, temperature, history
+                        ):
+                            sent = True
+                            yield text
+                    except (asyncio.CancelledError, GeneratorExit):
+                        health.cancelled(probe)
+                        raise
+                    except Exception as e:
+                        health.failure(e, probe)
+                        logger.warning(f"AI provider {provider}/{model_name} stream failed: {e}")
+                        if sent:
+                            raise
+                        errors.append(f"{provider}: {e}")
+                        continue
+                    if not sent:
+                        health.failure(ValueError("empty reply"), probe)
+                        errors.append(f"{provider}: empty reply")
+                        continue
+                    health.success(time.perf_counter() - started, probe)
+                    return
+            except (RateLimited, CircuitOpen) as e:
+                errors.append(f"{provider}: {e}")
+
+        self.fallbacks += 1
+        raise NoProviderAvailable("; ".join(errors) or f"no healthy AI provider for {ai_provider}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "hedging": self.hedge_enabled,
+            "fallbacks": self.fallbacks,
+            "providers": {f"{provider}/{model}": h.stats() for (provider, model), h in self._health.items()},
+            "limits": self.limiter.stats() if self.limiter is not None else None,
+        }
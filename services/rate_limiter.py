@@ -0,0 +1,209 @@
+# services/rate_limiter.py
+"""
+Admission control for AI provider calls, per provider + model.
+
+Each ProviderLimiter caps concurrent calls and keeps requests-per-minute and
+tokens-per-minute token buckets, so bursts queue here instead of coming back
+as 429s. Waiting calls are queued per tenant and admitted round-robin across
+tenants, so one tenant's burst cannot starve the others. A call waits at most
+AI_LIMITER_MAX_WAIT_SECONDS; past that (or when the queue is full) it raises
+RateLimited and the caller falls back.
+"""
+import asyncio
+import logging
+import time
+import uuid
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Optional, Dict, Deque, Tuple, Any, AsyncIterator
+from services.stats import LatencyWindow
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimited(Exception):
+    """No capacity for this provider/model within the allowed wait."""
+
+
+class TokenBucket:
+    """Continuously refilled bucket holding up to one minute's allowance."""
+
+    def __init__(self, per_minute: int):
+        self.rate = per_minute / 60.0
+        self.capacity = float(per_minute)
+        self.level = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def delay(self, amount: float) -> float:
+        """Seconds until `amount` can be taken (0 if now)."""
+        self._refill()
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount: float) -> None:
+        self.level -= min(amount, self.capacity)
+
+
+class _Waiter:
+    __slots__ = ("future", "tokens", "enqueued_at")
+
+    def __init__(self, future: asyncio.Future, tokens: int):
+        self.future = future
+        self.tokens = tokens
+        self.enqueued_at = time.monotonic()
+
+
+class ProviderLimiter:
+    def __init__(self, max_concurrency: int, requests_per_minute: int, tokens_per_minute: int, max_wait: float, max_queue: int):
+        self.max_concurrency = max_concurrency
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.max_wait = max_wait
+        self.max_queue = max_queue
+        self.in_flight = 0
+        self.queued = 0
+        # tenant -> waiting calls; the first tenant is served next, then moved to the back
+        self._queues: "OrderedDict[Optional[uuid.UUID], Deque[_Waiter]]" = OrderedDict()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.wait = LatencyWindow()
+        self.admitted = 0
+        self.rejected = 0
+
+    def _delay(self, tokens: int) -> Optional[float]:
+        """0 if a call can start now, seconds until the buckets allow it, or None while at max concurrency."""
+        if self.max_concurrency and self.in_flight >= self.max_concurrency:
+            return None
+        delay = 0.0
+        if self.requests is not None:
+            delay = self.requests.delay(1)
+        if self.tokens is not None:
+            delay = max(delay, self.tokens.delay(tokens))
+        return delay
+
+    def _admit(self, tokens: int) -> None:
+        if self.requests is not None:
+            self.requests.take(1)
+        if self.tokens is not None:
+            self.tokens.take(tokens)
+        self.in_flight += 1
+        self.admitted += 1
+
+    def _dispatch(self) -> None:
+        """Admit waiting calls, one per tenant in turn, while capacity lasts."""
+        self._timer = None
+        while self._queues:
+            tenant_id, waiters = next(iter(self._queues.items()))
+            while waiters and waiters[0].future.done():
+                waiters.popleft()  # gave up (timeout / cancelled)
+            if not waiters:
+                del self._queues[tenant_id]
+                continue
+
+            delay = self._delay(waiters[0].tokens)
+            if delay is None:
+                return  # release() dispatches again
+            if delay > 0:
+                self._timer = asyncio.get_running_loop().call_later(delay, self._dispatch)
+                return
+
+            waiter = waiters.popleft()
+            self._queues.move_to_end(tenant_id)
+            self.queued -= 1
+            self._admit(waiter.tokens)
+            waiter.future.set_result(None)
+
+    async def acquire(self, tenant_id: Optional[uuid.UUID], tokens: int) -> float:
+        """Wait for a slot; returns the seconds spent queued. Raises RateLimited."""
+        if not self._queues and self._delay(tokens) == 0:
+            self._admit(tokens)
+            self.wait.add(0.0)
+            return 0.0
+        if self.queued >= self.max_queue:
+            self.rejected += 1
+            raise RateLimited("limiter queue full")
+
+        waiter = _Waiter(asyncio.get_running_loop().create_future(), tokens)
+        self._queues.setdefault(tenant_id, deque()).append(waiter)
+        self.queued += 1
+        if self._timer is None:
+            self._dispatch()
+        try:
+            await asyncio.wait_for(waiter.future, self.max_wait)
+        except asyncio.TimeoutError:
+            self.queued -= 1
+            self.rejected += 1
+            raise RateLimited(f"no capacity within {self.max_wait:.1f}s")
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                self.release()  # admitted just as the caller went away
+            else:
+                self.queued -= 1
+            raise
+        waited = time.monotonic() - waiter.enqueued_at
+        self.wait.add(waited)
+        return waited
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        if self._queues and self._timer is None:
+            self._dispatch()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "tenants_waiting": len(self._queues),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "queue_wait": self.wait.summary(),
+            "requests_available": int(self.requests.level) if self.requests else None,
+            "tokens_available": int(self.tokens.level) if self.tokens else None,
+        }
+
+
+class AILimiter:
+    """ProviderLimiter per (provider, model), created on first use from the defaults or an override."""
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        requests_per_minute: int,
+        tokens_per_minute: int,
+        max_wait: float,
+        max_queue: int,
+        overrides: Optional[Dict[str, Dict[str, int]]] = None
+    ):
+        self.defaults = {"concurrency": max_concurrency, "rpm": requests_per_minute, "tpm": tokens_per_minute}
+        self.max_wait = max_wait
+        self.max_queue = max_queue
+        self.overrides = overrides or {}
+        self._limiters: Dict[Tuple[str, str], ProviderLimiter] = {}
+
+    def limiter(self, provider: str, model: str) -> ProviderLimiter:
+        limiter = self._limiters.get((provider, model))
+        if limiter is None:
+            limits = {**self.defaults, **self.overrides.get(f"{provider}/{model}", self.overrides.get(provider, {}))}
+            limiter = self._limiters[(provider, model)] = ProviderLimiter(
+                limits["concurrency"], limits["rpm"], limits["tpm"], self.max_wait, self.max_queue
+            )
+        return limiter
+
+    @asynccontextmanager
+    async def slot(self, provider: str, model: str, tenant_id: Optional[uuid.UUID], tokens: int) -> AsyncIterator[float]:
+        """Hold one admitted call for the duration of the block; yields the queue wait in seconds."""
+        limiter = self.limiter(provider, model)
+        waited = await limiter.acquire(tenant_id, tokens)
+        if waited > 1.0:
+            logger.info(f"AI call to {provider}/{model} queued {waited:.2f}s (tenant {tenant_id})")
+        try:
+            yield waited
+        finally:
+            limiter.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {f"{provider}/{model}": l.stats() for (provider, model), l in self._limiters.items()}
@@ -0,0 +1,172 @@
+# services/reply_cache.py
+import hashlib
+import logging
+import re
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Dict, Tuple, Any
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+
+# Rough per-entry bookkeeping cost (tuple key, dataclass, OrderedDict node)
+_ENTRY_OVERHEAD_BYTES = 200
+
+
+def normalize_message(text: str) -> str:
+    """Case/whitespace-insensitive form of an inbound message: "What are your hours? " -> "what are your hours"."""
+    return _WHITESPACE.sub(" ", (text or "").casefold()).strip(" .!?")
+
+
+def prompt_hash(system_prompt: Optional[str]) -> str:
+    return hashlib.sha1((system_prompt or "").encode()).hexdigest()
+
+
+@dataclass
+class CachedReply:
+    reply: str
+    confidence: float
+    latency: float  # seconds the provider took to produce the reply
+    stored_at: float
+    size: int
+
+
+class _TenantReplies:
+    """One tenant's entries, all generated under the same system prompt."""
+
+    def __init__(self, prompt_hash: str):
+        self.prompt_hash = prompt_hash
+        self.entries: "OrderedDict[tuple, CachedReply]" = OrderedDict()
+        self.bytes = 0
+
+
+class ReplyCache:
+    """
+    Exact-match cache of AI replies, keyed on
+    (tenant_id, prompt hash, provider, model, temperature, normalized message).
+
+    Entries are LRU within each tenant and expire after `ttl` seconds. Each
+    tenant is capped at `tenant_max_bytes`, and the least recently used tenant
+    is dropped once more than `max_tenants` are cached. A lookup under a new
+    prompt hash (the tenant re-ran setup) clears that tenant's entries.
+    """
+
+    def __init__(self, ttl: float, tenant_max_bytes: int, max_tenants: int):
+        self.ttl = ttl
+        self.tenant_max_bytes = tenant_max_bytes
+        self.max_tenants = max_tenants
+        self._tenants: "OrderedDict[uuid.UUID, _TenantReplies]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.saved_seconds = 0.0
+
+    def _bucket(self, tenant_id: uuid.UUID, system_prompt_hash: str, create: bool) -> Optional[_TenantReplies]:
+        bucket = self._tenants.get(tenant_id)
+        if bucket is not None and bucket.prompt_hash != system_prompt_hash:
+            # Tenant's prompt changed: every reply generated under the old one is stale
+            del self._tenants[tenant_id]
+            self.invalidations += 1
+            bucket = None
+        if bucket is None:
+            if not create:
+                return None
+            bucket = self._tenants[tenant_id] = _TenantReplies(system_prompt_hash)
+            while len(self._tenants) > self.max_tenants:
+                self._tenants.popitem(last=False)
+                self.evictions += 1
+        self._tenants.move_to_end(tenant_id)
+        return bucket
+
+    @staticmethod
+    def _key(system_prompt_hash: str, provider: str, model: Optional[str], temperature: float, message_text: str) -> tuple:
+        return (system_prompt_hash, provider, model, temperature, normalize_message(message_text))
+
+    def get(
+        self,
+        tenant_id: uuid.UUID,
+        system_prompt: Optional[str],
+        provider: str,
+        model: Optional[str],
+        temperature: float,
+        message_text: str
+    ) -> Optional[CachedReply]:
+        system_prompt_hash = prompt_hash(system_prompt)
+        bucket = self._bucket(tenant_id, system_prompt_hash, create=False)
+        key = self._key(system_prompt_hash, provider, model, temperature, message_text)
+        entry = bucket.entries.get(key) if bucket else None
+
+        if entry is not None and time.monotonic() - entry.stored_at > self.ttl:
+            del bucket.entries[key]
+            bucket.bytes -= entry.size
+            entry = None
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        bucket.entries.move_to_end(key)
+        self.hits += 1
+        self.saved_seconds += entry.latency
+        return entry
+
+    def put(
+        self,
+        tenant_id: uuid.UUID,
+        system_prompt: Optional[str],
+        provider: str,
+        model: Optional[str],
+        temperature: float,
+        message_text: str,
+        reply: str,
+        confidence: float,
+        latency: float
+    ) -> None:
+        system_prompt_hash = prompt_hash(system_prompt)
+        key = self._key(system_prompt_hash, provider, model, temperature, message_text)
+        size = len(reply.encode()) + len(key[-1].encode()) + _ENTRY_OVERHEAD_BYTES
+        if size > self.tenant_max_bytes:
+            return
+
+        bucket = self._bucket(tenant_id, system_prompt_hash, create=True)
+        previous = bucket.entries.pop(key, None)
+        if previous is not None:
+            bucket.bytes -= previous.size
+        bucket.entries[key] = CachedReply(reply, confidence, latency, time.monotonic(), size)
+        bucket.bytes += size
+
+        while bucket.bytes > self.tenant_max_bytes:
+            _, evicted = bucket.entries.popitem(last=False)
+            bucket.bytes -= evicted.size
+            self.evictions += 1
+
+    def invalidate_tenant(self, tenant_id: uuid.UUID) -> None:
+        if self._tenants.pop(tenant_id, None) is not None:
+            self.invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": settings.REPLY_CACHE_ENABLED,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "saved_latency_seconds": round(self.saved_seconds, 3),
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "tenants": len(self._tenants),
+            "entries": sum(len(b.entries) for b in self._tenants.values()),
+            "bytes": sum(b.bytes for b in self._tenants.values()),
+        }
+
+
+reply_cache = ReplyCache(
+    ttl=settings.REPLY_CACHE_TTL_SECONDS,
+    tenant_max_bytes=settings.REPLY_CACHE_TENANT_MAX_BYTES,
+    max_tenants=settings.REPLY_CACHE_MAX_TENANTS
+)
@@ -0,0 +1,361 @@
+# services/responder.py
+"""
+Single entry point the channel handlers use to get an AI reply for an inbound
+message. Tries, in order: the tenant's FAQ fast path (stored answer, no LLM),
+the exact-match reply cache, the semantic cache, then the AI provider. On a
+provider call the prompt is trimmed to the tenant's core prompt plus the
+relevant FAQs (FAQ retrieval mode), and the most relevant knowledge base
+passages are appended, followed by the earlier turns of the conversation
+that fit in MAX_CONVERSATION_TOKENS. Identical provider calls already in
+flight are shared (single-flight). stream_ai_reply is the same pipeline for
+channels that forward the reply as it is generated.
+"""
+import logging
+import time
+import uuid
+from collections import Counter
+from typing import Optional, NamedTuple, Dict, Tuple, Any, AsyncIterator
+import numpy as np
+from ai_providers import get_ai_response, stream_ai_response
+from services.stats import LatencyWindow
+from services.reply_cache import reply_cache, prompt_hash, normalize_message
+from services.semantic_cache import semantic_cache
+from services.knowledge_index import knowledge_index, format_passages, RetrievedPassage
+from services.faq_index import faq_index
+from services.bm25 import bm25_index
+from services.conversation import conversation_store, ConversationKey
+from services.tokens import estimate_tokens
+from services.single_flight import SingleFlight
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Message.reply_source -> replies served this process
+_sources: Counter = Counter()
+
+# Request received -> first reply chunk sent, for streaming channels
+stream_ttfb = LatencyWindow()
+
+# Provider calls in flight, keyed like the reply cache
+ai_flights = SingleFlight()
+
+
+class AIReply(NamedTuple):
+    reply: str
+    confidence: float
+    source: str  # stored as Message.reply_source: ai / ai_history / faq / reply_cache / semantic_cache / coalesced
+
+
+def _served(reply: str, confidence: float, source: str) -> AIReply:
+    _sources[source] += 1
+    return AIReply(reply, confidence, source)
+
+
+def _provider_source(history: list) -> str:
+    """
+    "ai_history" for a provider reply that depended on earlier turns, so it is
+    never reused for another customer's standalone question (semantic cache
+    hydration only takes "ai" rows).
+    """
+    return "ai_history" if history else "ai"
+
+
+async def _shortcut(
+    tenant_id: uuid.UUID,
+    message_text: str,
+    ai_provider: str,
+    system_prompt: Optional[str],
+    model: Optional[str],
+    temperature: float,
+    use_cache: bool,
+    faqs: Optional[list],
+    services: Optional[list],
+    faq_fast_path_threshold: Optional[float]
+) -> Tuple[Optional[AIReply], Optional[np.ndarray]]:
+    """FAQ fast path and caches. Returns (reply or None, message embedding if one was computed)."""
+    if faq_fast_path_threshold is not None and faqs:
+        try:
+            answer = await bm25_index.fast_answer(
+                tenant_id, message_text, prompt_hash(system_prompt), faqs, services,
+                threshold=faq_fast_path_threshold
+            )
+        except Exception as e:
+            logger.error(f"FAQ fast path failed for tenant {tenant_id}: {e}")
+            answer = None
+        if answer is not None:
+            return AIReply(answer.answer, answer.confidence, "faq"), None
+
+    if not use_cache:
+        return None, None
+    cached = reply_cache.get(tenant_id, system_prompt, ai_provider, model, temperature, message_text)
+    if cached is not None:
+        return AIReply(cached.reply, cached.confidence, "reply_cache"), None
+    if semantic_cache.enabled:
+        match, vector = await semantic_cache.lookup(tenant_id, system_prompt, message_text)
+        if match is not None:
+            return AIReply(match.reply, match.confidence, "semantic_cache"), vector
+        return None, vector
+    return None, None
+
+
+async def _provider_prompt(
+    tenant_id: uuid.UUID,
+    message_text: str,
+    system_prompt: Optional[str],
+    core_prompt: Optional[str],
+    faqs: Optional[list],
+    services: Optional[list],
+    vector: Optional[np.ndarray]
+) -> str:
+    """System prompt for a provider call: FAQ retrieval mode and KB passages applied."""
+    prompt = system_prompt or ""
+    if faq_index.applies(core_prompt, faqs):
+        try:
+            prompt, tokens = await faq_index.build_prompt(
+                tenant_id, message_text, prompt, core_prompt, faqs, services, query_vector=vector
+            )
+            logger.info(
+                f"FAQ retrieval for tenant {tenant_id}: {tokens['faqs_sent']} of {len(faqs)} FAQs, "
+                f"prompt ~{tokens['prompt_tokens']} tokens (saved ~{tokens['saved_tokens']})"
+            )
+        except Exception as e:
+            logger.error(f"FAQ retrieval failed for tenant {tenant_id}, sending full prompt: {e}")
+            prompt = system_prompt or ""
+
+    if settings.KB_RETRIEVAL_ENABLED:
+        try:
+            if settings.RETRIEVAL_BACKEND == "bm25":
+                # Service documents ("Facial: $80") come back with the KB passages
+                snippets = await bm25_index.search(
+                    tenant_id, message_text, settings.KB_TOP_K,
+                    version=prompt_hash(system_prompt), faqs=faqs, services=services, kinds=("kb", "service")
+                )
+                passages = [RetrievedPassage(s.key, s.title, s.text, s.score) for s in snippets]
+            else:
+                passages = await knowledge_index.search(tenant_id, message_text, query_vector=vector)
+        except Exception as e:
+            logger.error(f"Knowledge base retrieval failed for tenant {tenant_id}: {e}")
+            passages = []
+        if passages:
+            prompt = f"{prompt}\n\n{format_passages(passages, settings.KB_PASSAGE_MAX_CHARS)}"
+    return prompt
+
+
+async def _ongoing(conversation: Optional[ConversationKey]) -> bool:
+    """
+    Whether the customer is mid-conversation. A cached reply answers a
+    standalone question, so a message that may lean on earlier turns ("yes",
+    "how much is that?") must not be looked up in the reply / semantic caches.
+    """
+    if conversation is None or not settings.CONVERSATION_MEMORY_ENABLED:
+        return False
+    return await conversation_store.has_turns(conversation)
+
+
+async def _history(conversation: Optional[ConversationKey], prompt: str, message_text: str) -> list:
+    """Earlier turns that fit in the token budget left after the system prompt and message."""
+    if conversation is None or not settings.CONVERSATION_MEMORY_ENABLED:
+        return []
+    budget = settings.MAX_CONVERSATION_TOKENS - estimate_tokens(prompt) - estimate_tokens(message_text)
+    return await conversation_store.history(conversation, budget)
+
+
+def _remember(
+    tenant_id: uuid.UUID,
+    message_text: str,
+    ai_provider: str,
+    system_prompt: Optional[str],
+    model: Optional[str],
+    temperature: float,
+    vector: Optional[np.ndarray],
+    reply: str,
+    confidence: float,
+    latency: float
+) -> None:
+    """
+    Cache a fresh provider reply. Caches stay keyed on the tenant's base prompt;
+    KB edits invalidate them instead. Zero confidence means a provider error /
+    unsupported provider: never cache those. Callers skip this for replies that
+    depended on conversation history.
+    """
+    if confidence <= 0:
+        return
+    reply_cache.put(tenant_id, system_prompt, ai_provider, model, temperature, message_text, reply, confidence, latency)
+    if vector is not None:
+        semantic_cache.add(tenant_id, system_prompt, message_text, vector, reply, confidence)
+
+
+async def generate_ai_reply(
+    tenant_id: uuid.UUID,
+    message_text: str,
+    ai_provider: Optional[str],
+    system_prompt: Optional[str],
+    model: Optional[str] = None,
+    temperature: Optional[float] = 0.7,
+    use_cache: bool = True,
+    core_prompt: Optional[str] = None,
+    faqs: Optional[list] = None,
+    services: Optional[list] = None,
+    faq_fast_path_threshold: Optional[float] = None,
+    conversation: Optional[ConversationKey] = None
+) -> AIReply:
+    """
+    Returns (reply, confidence, source).
+    `use_cache=False` is the per-channel opt-out (Channel.ai_cache_enabled).
+    `core_prompt` / `faqs` (Tenant.ai_core_prompt / Tenant.faqs) enable FAQ retrieval mode;
+    `faqs` / `services` also seed the tenant's BM25 index.
+    `faq_fast_path_threshold` (see faq_fast_path_threshold()) answers strong FAQ
+    matches with the stored answer; None leaves the fast path off.
+    `conversation` sends the earlier turns with this customer to the provider
+    and records this one.
+    """
+    ai_provider = (ai_provider or "openai").lower()
+    temperature = 0.7 if temperature is None else temperature
+    use_cache = use_cache and settings.REPLY_CACHE_ENABLED
+
+    shortcut, vector = await _shortcut(
+        tenant_id, message_text, ai_provider, system_prompt, model, temperature,
+        use_cache and not await _ongoing(conversation), faqs, services, faq_fast_path_threshold
+    )
+    if shortcut is not None:
+        conversation_store.append(conversation, message_text, shortcut.reply)
+        return _served(*shortcut)
+
+    prompt = await _provider_prompt(tenant_id, message_text, system_prompt, core_prompt, faqs, services, vector)
+    history = await _history(conversation, prompt, message_text)
+
+    async def call_provider() -> Tuple[str, float]:
+        started = time.perf_counter()
+        reply, confidence = await get_ai_response(
+            message_text=message_text,
+            ai_provider=ai_provider,
+            system_prompt=prompt,
+            model=model,
+            temperature=temperature,
+            history=history,
+            tenant_id=tenant_id
+        )
+        if use_cache and not history:
+            _remember(
+                tenant_id, message_text, ai_provider, system_prompt, model, temperature,
+                vector, reply, confidence, time.perf_counter() - started
+            )
+        return reply, confidence
+
+    shared = False
+    if use_cache and not history and settings.AI_SINGLE_FLIGHT_ENABLED:
+        # Same rules as the reply cache: identical (normalized) message, prompt and model
+        key = (tenant_id, prompt_hash(system_prompt), normalize_message(message_text), ai_provider, model, temperature)
+        (reply, confidence), shared = await ai_flights.run(key, call_provider)
+    else:
+        reply, confidence = await call_provider()
+
+    if confidence > 0:
+        conversation_store.append(conversation, message_text, reply)
+    return _served(reply, confidence, "coalesced" if shared else _provider_source(history))
+
+
+class ReplyStream:
+    """
+    Async iterator over reply text chunks (see stream_ai_reply). Once it is
+    exhausted, `reply`, `confidence` and `source` hold the complete result.
+    """
+
+    def __init__(self):
+        self.reply = ""
+        self.confidence = 0.0
+        self.source = "ai"
+        self._chunks: Optional[AsyncIterator[str]] = None
+
+    def __aiter__(self) -> AsyncIterator[str]:
+        return self._chunks
+
+    async def aclose(self) -> None:
+        """Stop early (client gone); closes the provider stream."""
+        await self._chunks.aclose()
+
+
+def stream_ai_reply(
+    tenant_id: uuid.UUID,
+    message_text: str,
+    ai_provider: Optional[str],
+    system_prompt: Optional[str],
+    model: Optional[str] = None,
+    temperature: Optional[float] = 0.7,
+    use_cache: bool = True,
+    core_prompt: Optional[str] = None,
+    faqs: Optional[list] = None,
+    services: Optional[list] = None,
+    faq_fast_path_threshold: Optional[float] = None,
+    conversation: Optional[ConversationKey] = None
+) -> ReplyStream:
+    """
+    Streaming variant of generate_ai_reply (same arguments). Fast-path and
+    cached replies arrive as a single chunk; provider replies are forwarded
+    chunk by chunk as the provider streams them.
+    """
+    ai_provider = (ai_provider or "openai").lower()
+    temperature = 0.7 if temperature is None else temperature
+    use_cache = use_cache and settings.REPLY_CACHE_ENABLED
+    result = ReplyStream()
+
+    async def chunks() -> AsyncIterator[str]:
+        shortcut, vector = await _shortcut(
+            tenant_id, message_text, ai_provider, system_prompt, model, temperature,
+            use_cache and not await _ongoing(conversation), faqs, services, faq_fast_path_threshold
+        )
+        if shortcut is not None:
+            result.reply, result.confidence, result.source = _served(*shortcut)
+            conversation_store.append(conversation, message_text, result.reply)
+            yield result.reply
+            return
+
+        prompt = await _provider_prompt(tenant_id, message_text, system_prompt, core_prompt, faqs, services, vector)
+        history = await _history(conversation, prompt, message_text)
+        result.source = _provider_source(history)
+        started = time.perf_counter()
+        parts = []
+        try:
+            async for text in stream_ai_response(
+                message_text, ai_provider, prompt, model, temperature, history, tenant_id
+            ):
+                parts.append(text)
+                yield text
+            result.confidence = 0.9  # same placeholder as get_ai_response
+        except Exception as e:
+            logger.error(f"AI stream error for provider {ai_provider}: {str(e)}")
+            if not parts:
+                parts.append(settings.AI_FALLBACK_REPLY)
+                yield parts[0]
+        result.reply = "".join(parts)
+        if use_cache and not history:
+            _remember(
+                tenant_id, message_text, ai_provider, system_prompt, model, temperature,
+                vector, result.reply, result.confidence, time.perf_counter() - started
+            )
+        if result.confidence > 0:
+            conversation_store.append(conversation, message_text, result.reply)
+        _served(result.reply, result.confidence, result.source)
+
+    result._chunks = chunks()
+    return result
+
+
+def faq_fast_path_threshold(enabled: Optional[bool], threshold: Optional[float]) -> Optional[float]:
+    """Threshold to pass to generate_ai_reply from a tenant's fast-path settings, or None when off."""
+    if not enabled or not settings.FAQ_FAST_PATH_ENABLED:
+        return None
+    return threshold if threshold is not None else settings.FAQ_FAST_PATH_THRESHOLD
+
+
+def responder_stats() -> Dict[str, Any]:
+    total = sum(_sources.values())
+    avoided = total - _sources["ai"] - _sources["ai_history"]  # includes coalesced replies
+    return {
+        "replies": total,
+        "by_source": dict(_sources),
+        "llm_calls_avoided": avoided,
+        "llm_avoided_ratio": round(avoided / total, 4) if total else 0.0,
+        "stream_ttfb": stream_ttfb.summary(),
+        "single_flight": ai_flights.stats(),
+    }
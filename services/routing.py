@@ -0,0 +1,130 @@
+# services/routing.py
+import logging
+import threading
+import time
+import uuid
+from typing import Optional, Dict, Tuple, NamedTuple, Any
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import AsyncSessionLocal
+from models import Tenant, Channel
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Channel types whose inbound webhooks are routed by (type, identifier)
+ROUTED_CHANNEL_TYPES = ("sms", "voice")
+
+
+class ChannelRoute(NamedTuple):
+    """Everything an inbound webhook needs to answer without touching the DB."""
+    channel_id: uuid.UUID
+    tenant_id: uuid.UUID
+    business_name: str
+    ai_provider: Optional[str]
+    ai_system_prompt: Optional[str]
+    ai_core_prompt: Optional[str]
+    faqs: Optional[list]
+    faq_fast_path_enabled: bool
+    faq_fast_path_threshold: Optional[float]
+    open_time: Optional[str]
+    close_time: Optional[str]
+    services: Optional[list]
+    ai_cache_enabled: bool
+    loaded_at: float
+
+
+# (channel type, identifier) -> ChannelRoute
+_routes: Dict[Tuple[str, str], ChannelRoute] = {}
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "refreshes": 0}
+
+
+def _route_query():
+    return select(
+        Channel.type,
+        Channel.identifier,
+        Channel.id,
+        Tenant.id,
+        Tenant.business_name,
+        Tenant.ai_provider,
+        Tenant.ai_system_prompt,
+        Tenant.ai_core_prompt,
+        Tenant.faqs,
+        Tenant.faq_fast_path_enabled,
+        Tenant.faq_fast_path_threshold,
+        Tenant.open_time,
+        Tenant.close_time,
+        Tenant.services,
+        Channel.ai_cache_enabled,
+    ).join(Tenant, Channel.tenant_id == Tenant.id).where(
+        Channel.type.in_(ROUTED_CHANNEL_TYPES)
+    )
+
+
+def _store(rows) -> int:
+    now = time.monotonic()
+    count = 0
+    with _lock:
+        for channel_type, identifier, *fields in rows:
+            _routes[(channel_type, identifier)] = ChannelRoute(*fields, loaded_at=now)
+            count += 1
+    return count
+
+
+async def warm_routes() -> None:
+    """Load every routed channel into memory (called on app startup)."""
+    try:
+        async with AsyncSessionLocal() as db:
+            rows = (await db.execute(_route_query())).all()
+        count = _store(rows)
+        logger.info(f"Channel routing table warmed with {count} routes")
+    except Exception as e:
+        # Webhooks still work through the DB fallback in resolve_route
+        logger.error(f"Failed to warm channel routing table: {e}")
+
+
+async def resolve_route(db: AsyncSession, channel_type: str, identifier: str) -> Optional[ChannelRoute]:
+    """
+    Look up the channel + tenant settings for an inbound webhook.
+    Served from memory; falls back to one joined query on a miss or when the
+    entry is older than CHANNEL_ROUTE_TTL_SECONDS (picks up changes made by
+    other workers).
+    """
+    key = (channel_type, identifier)
+    route = _routes.get(key)
+    if route is not None and time.monotonic() - route.loaded_at < settings.CHANNEL_ROUTE_TTL_SECONDS:
+        _stats["hits"] += 1
+        return route
+
+    _stats["misses"] += 1
+    row = (await db.execute(
+        _route_query().where(Channel.type == channel_type, Channel.identifier == identifier).limit(1)
+    )).first()
+    if row is None:
+        with _lock:
+            _routes.pop(key, None)
+        return None
+
+    _store([row])
+    return _routes.get(key)
+
+
+def refresh_tenant_routes(db: Session, tenant_id) -> None:
+    """Rebuild the routes of one tenant after its channels or AI settings change."""
+    rows = db.execute(_route_query().where(Channel.tenant_id == tenant_id)).all()
+    with _lock:
+        for key in [k for k, r in _routes.items() if r.tenant_id == tenant_id]:
+            del _routes[key]
+    _store(rows)
+    _stats["refreshes"] += 1
+
+
+def routing_stats() -> Dict[str, Any]:
+    lookups = _stats["hits"] + _stats["misses"]
+    return {
+        **_stats,
+        "size": len(_routes),
+        "hit_ratio": round(_stats["hits"] / lookups, 4) if lookups else 0.0,
+    }
@@ -0,0 +1,256 @@
+# services/semantic_cache.py
+"""
+Semantic reply cache: reuse a tenant's earlier AI answer when a new message
+is close enough (cosine similarity) to a question that was already answered.
+
+Each tenant gets a float32 matrix of question embeddings plus the matching
+replies. It is hydrated lazily from recent `messages` rows on the tenant's
+first lookup, then grows as new AI replies are generated. Once a tenant holds
+SEMANTIC_CACHE_MAX_ENTRIES questions the oldest row is overwritten.
+
+Needs a real (semantic) embedder: the hashing embedder only measures word
+overlap, so "are you open on Monday" and "... on Sunday" score as a match.
+With it the cache stays off even when SEMANTIC_CACHE_ENABLED is set.
+"""
+import asyncio
+import logging
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Optional, Dict, List, NamedTuple, Tuple, Any
+import numpy as np
+from sqlalchemy import select, or_, and_
+from database import AsyncSessionLocal
+from models import Message, Channel
+from services.embeddings import get_embedder
+from services.reply_cache import normalize_message, prompt_hash
+from services.stats import LatencyWindow
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class SemanticMatch(NamedTuple):
+    reply: str
+    confidence: float
+    similarity: float
+
+
+class _TenantVectors:
+    """Ring buffer of (question embedding, reply, confidence) for one tenant."""
+
+    def __init__(self, prompt_hash: str, embedder_name: str, dim: int, capacity: int):
+        self.prompt_hash = prompt_hash
+        self.embedder_name = embedder_name
+        self.capacity = capacity
+        self.vectors = np.zeros((min(capacity, 64), dim), dtype=np.float32)
+        self.replies: List[str] = []
+        self.confidences: List[float] = []
+        self.questions: List[str] = []
+        self.rows: Dict[str, int] = {}  # normalized question -> row
+        self.written = 0
+
+    @property
+    def size(self) -> int:
+        return len(self.replies)
+
+    def add(self, question: str, vector: np.ndarray, reply: str, confidence: float) -> None:
+        row = self.rows.get(question)
+        if row is None:
+            if self.size < self.capacity:
+                row = self.size
+                if row == len(self.vectors):
+                    grown = np.zeros((min(self.capacity, row * 2), self.vectors.shape[1]), dtype=np.float32)
+                    grown[:row] = self.vectors
+                    self.vectors = grown
+                self.replies.append(reply)
+                self.confidences.append(confidence)
+                self.questions.append(question)
+            else:
+                # Full: overwrite the oldest row
+                row = self.written % self.capacity
+                del self.rows[self.questions[row]]
+                self.questions[row] = question
+            self.written += 1
+            self.rows[question] = row
+        self.vectors[row] = vector
+        self.replies[row] = reply
+        self.confidences[row] = confidence
+
+    def best(self, vector: np.ndarray) -> Tuple[int, float]:
+        similarities = self.vectors[:self.size] @ vector
+        row = int(np.argmax(similarities))
+        return row, float(similarities[row])
+
+
+class SemanticCache:
+    def __init__(self, threshold: float, min_confidence: float, max_entries: int, lookback_days: int):
+        self.threshold = threshold
+        self.min_confidence = min_confidence
+        self.max_entries = max_entries
+        self.lookback_days = lookback_days
+        self._tenants: Dict[uuid.UUID, _TenantVectors] = {}
+        self._loading: Dict[uuid.UUID, asyncio.Lock] = {}
+        self._not_before: Dict[uuid.UUID, datetime] = {}  # history older than this is stale
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.errors = 0
+        self.embed_latency = LatencyWindow()
+        self.search_latency = LatencyWindow()
+        self._skip_logged = False
+
+    @property
+    def enabled(self) -> bool:
+        """SEMANTIC_CACHE_ENABLED and a semantic embedder configured (not the word-hashing one)."""
+        if not settings.SEMANTIC_CACHE_ENABLED:
+            return False
+        if get_embedder().name.startswith("hashing"):
+            if not self._skip_logged:
+                self._skip_logged = True
+                logger.warning(
+                    "Semantic cache disabled: the hashing embedder matches on word overlap, not meaning "
+                    "(set EMBEDDING_PROVIDER to a real embedder to use it)"
+                )
+            return False
+        return True
+
+    def _history_query(self, tenant_id: uuid.UUID):
+        """Recent answered questions worth reusing: confident, AI-generated, cache-enabled channels."""
+        since = datetime.utcnow() - timedelta(days=self.lookback_days)
+        since = max(since, self._not_before.get(tenant_id, since))
+        return (
+            select(Message.message_text, Message.ai_response, Message.confidence_score)
+            .join(Channel, Channel.id == Message.channel_id)
+            .where(
+                Message.tenant_id == tenant_id,
+                Message.direction == "incoming",
+                Message.message_text.isnot(None),
+                Message.ai_response.isnot(None),
+                Message.confidence_score >= self.min_confidence,
+                Message.created_at >= since,
+                Channel.ai_cache_enabled.is_(True),
+                # Standalone provider replies only ("ai_history" ones answered
+                # earlier turns). Rows from before reply_source existed: SMS ones
+                # may be booking confirmations, so only trust chat/email history
+                or_(
+                    Message.reply_source == "ai",
+                    and_(Message.reply_source.is_(None), Channel.type != "sms")
+                )
+            )
+            .order_by(Message.created_at.desc())
+            .limit(self.max_entries)
+        )
+
+    async def _load(self, tenant_id: uuid.UUID, system_prompt_hash: str) -> _TenantVectors:
+        embedder = get_embedder()
+        bucket = _TenantVectors(system_prompt_hash, embedder.name, embedder.dim, self.max_entries)
+        async with AsyncSessionLocal() as db:
+            rows = (await db.execute(self._history_query(tenant_id))).all()
+        if rows:
+            rows.reverse()  # oldest first, so the ring overwrites the oldest
+            vectors = await embedder.embed([r.message_text for r in rows])
+            for row, vector in zip(rows, vectors):
+                bucket.add(normalize_message(row.message_text), vector, row.ai_response, row.confidence_score)
+        self.loads += 1
+        logger.info(f"Semantic cache loaded {bucket.size} answers for tenant {tenant_id}")
+        return bucket
+
+    async def _bucket(self, tenant_id: uuid.UUID, system_prompt_hash: str) -> _TenantVectors:
+        embedder = get_embedder()
+        bucket = self._tenants.get(tenant_id)
+        if bucket is not None and bucket.embedder_name == embedder.name:
+            if bucket.prompt_hash != system_prompt_hash:
+                # New prompt: answers given under the old one may be wrong now
+                self.invalidate_tenant(tenant_id)
+                bucket = self._tenants[tenant_id] = _TenantVectors(
+                    system_prompt_hash, embedder.name, embedder.dim, self.max_entries
+                )
+            return bucket
+
+        lock = self._loading.setdefault(tenant_id, asyncio.Lock())
+        async with lock:
+            bucket = self._tenants.get(tenant_id)
+            if bucket is None or bucket.embedder_name != embedder.name:
+                bucket = self._tenants[tenant_id] = await self._load(tenant_id, system_prompt_hash)
+        return await self._bucket(tenant_id, system_prompt_hash)
+
+    async def lookup(
+        self,
+        tenant_id: uuid.UUID,
+        system_prompt: Optional[str],
+        message_text: str
+    ) -> Tuple[Optional[SemanticMatch], Optional[np.ndarray]]:
+        """
+        Best earlier answer above the similarity threshold, plus the message
+        embedding so the caller can add() the fresh reply without re-embedding.
+        Failures (e.g. embedding API down) count as a miss.
+        """
+        try:
+            bucket = await self._bucket(tenant_id, prompt_hash(system_prompt))
+            started = time.perf_counter()
+            vector = (await get_embedder().embed([message_text]))[0]
+            self.embed_latency.add(time.perf_counter() - started)
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Semantic cache lookup failed for tenant {tenant_id}: {e}")
+            return None, None
+
+        if bucket.size:
+            started = time.perf_counter()
+            row, similarity = bucket.best(vector)
+            self.search_latency.add(time.perf_counter() - started)
+            if similarity >= self.threshold:
+                self.hits += 1
+                # Scale by similarity so a looser match reports lower confidence
+                confidence = round(bucket.confidences[row] * similarity, 4)
+                return SemanticMatch(bucket.replies[row], confidence, round(similarity, 4)), vector
+
+        self.misses += 1
+        return None, vector
+
+    def add(
+        self,
+        tenant_id: uuid.UUID,
+        system_prompt: Optional[str],
+        message_text: str,
+        vector: np.ndarray,
+        reply: str,
+        confidence: float
+    ) -> None:
+        bucket = self._tenants.get(tenant_id)
+        if bucket is None or bucket.prompt_hash != prompt_hash(system_prompt) or confidence < self.min_confidence:
+            return
+        bucket.add(normalize_message(message_text), vector, reply, confidence)
+
+    def invalidate_tenant(self, tenant_id: uuid.UUID) -> None:
+        """Forget the tenant's answers, and don't reload anything older than now."""
+        self._not_before[tenant_id] = datetime.utcnow()
+        bucket = self._tenants.get(tenant_id)
+        if bucket is not None:
+            self._tenants[tenant_id] = _TenantVectors(bucket.prompt_hash, bucket.embedder_name, bucket.vectors.shape[1], self.max_entries)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "embedder": get_embedder().name,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "errors": self.errors,
+            "tenant_loads": self.loads,
+            "tenants": len(self._tenants),
+            "entries": sum(b.size for b in self._tenants.values()),
+            "embed_latency": self.embed_latency.summary(),
+            "search_latency": self.search_latency.summary(),
+        }
+
+
+semantic_cache = SemanticCache(
+    threshold=settings.SEMANTIC_CACHE_THRESHOLD,
+    min_confidence=settings.SEMANTIC_CACHE_MIN_CONFIDENCE,
+    max_entries=settings.SEMANTIC_CACHE_MAX_ENTRIES,
+    lookback_days=settings.SEMANTIC_CACHE_LOOKBACK_DAYS
+)
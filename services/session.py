@@ -0,0 +1,113 @@
+# services/session.py
+"""
+In-process state of live voice calls, keyed by Twilio CallSid.
+
+The first webhook of a call resolves the voice channel and tenant settings
+once; every later <Gather> round-trip of the same call reuses them. The turns
+themselves live in the conversation store (services/conversation.py) and
+voice_messages; a session only counts them. Sessions end when Twilio reports the call
+finished (POST /api/voice/status) or after VOICE_SESSION_IDLE_TIMEOUT_SECONDS
+without a turn.
+"""
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Optional, Dict, Any
+from services.routing import ChannelRoute
+from services.conversation import ConversationKey
+from services.stats import LatencyWindow
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Twilio CallStatus values after which no more webhooks arrive for the call
+FINAL_CALL_STATUSES = ("completed", "busy", "failed", "no-answer", "canceled")
+
+
+@dataclass
+class CallSession:
+    call_sid: str
+    route: ChannelRoute
+    from_number: str
+    opened_at: float = field(default_factory=time.monotonic)
+    last_seen: float = field(default_factory=time.monotonic)
+    turns: int = 0
+
+    @property
+    def conversation(self) -> ConversationKey:
+        return ConversationKey(self.route.tenant_id, self.route.channel_id, self.from_number, voice=True)
+
+
+class CallSessionStore:
+    def __init__(self, idle_timeout: float, max_sessions: int):
+        self.idle_timeout = idle_timeout
+        self.max_sessions = max_sessions
+        # Least recently active first, so expired sessions are always at the front
+        self._sessions: "OrderedDict[str, CallSession]" = OrderedDict()
+        self.opened = 0
+        self.hits = 0
+        self.hung_up = 0
+        self.expired = 0
+        self.call_duration = LatencyWindow()
+
+    def _expire(self, now: float) -> None:
+        while self._sessions:
+            session = next(iter(self._sessions.values()))
+            if now - session.last_seen < self.idle_timeout and len(self._sessions) <= self.max_sessions:
+                break
+            self._end(session.call_sid, now)
+            self.expired += 1
+
+    def _end(self, call_sid: str, now: float) -> Optional[CallSession]:
+        session = self._sessions.pop(call_sid, None)
+        if session is not None:
+            self.call_duration.add(now - session.opened_at)
+        return session
+
+    def get(self, call_sid: str) -> Optional[CallSession]:
+        """The live session for `call_sid` (marked active), or None."""
+        now = time.monotonic()
+        self._expire(now)
+        session = self._sessions.get(call_sid)
+        if session is None:
+            return None
+        self.hits += 1
+        session.last_seen = now
+        self._sessions.move_to_end(call_sid)
+        return session
+
+    def open(self, call_sid: str, route: ChannelRoute, from_number: str) -> CallSession:
+        session = self._sessions[call_sid] = CallSession(call_sid, route, from_number)
+        self._sessions.move_to_end(call_sid)
+        self.opened += 1
+        self._expire(session.opened_at)
+        return session
+
+    def close(self, call_sid: str) -> Optional[CallSession]:
+        """End the session on hangup; returns it (None if unknown or already expired)."""
+        session = self._end(call_sid, time.monotonic())
+        if session is not None:
+            self.hung_up += 1
+            logger.info(
+                f"Call {call_sid} ended after {session.turns} turns, "
+                f"{time.monotonic() - session.opened_at:.0f}s"
+            )
+        return session
+
+    def stats(self) -> Dict[str, Any]:
+        self._expire(time.monotonic())
+        return {
+            "open": len(self._sessions),
+            "opened": self.opened,
+            "turn_hits": self.hits,
+            "hung_up": self.hung_up,
+            "expired": self.expired,
+            "call_duration": self.call_duration.summary(),
+        }
+
+
+call_sessions = CallSessionStore(
+    idle_timeout=settings.VOICE_SESSION_IDLE_TIMEOUT_SECONDS,
+    max_sessions=settings.VOICE_SESSION_MAX_SESSIONS
+)
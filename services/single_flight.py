@@ -0,0 +1,58 @@
+# services/single_flight.py
+import asyncio
+import logging
+from typing import Dict, Hashable, Callable, Awaitable, Tuple, Any
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """
+    At most one call per key in flight. Callers that arrive while a call for
+    their key is running await its result instead of starting their own
+    (e.g. dozens of identical promo SMS -> one provider call).
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+        self.leaders = 0
+        self.followers = 0
+
+    async def run(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Returns (result, shared); `shared` is True when another caller's call produced it."""
+        future = self._calls.get(key)
+        if future is not None:
+            self.followers += 1
+            try:
+                return await asyncio.shield(future), True
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                # The leading caller went away before finishing; run it ourselves
+                return await self.run(key, fn)
+
+        future = self._calls[key] = asyncio.get_running_loop().create_future()
+        self.leaders += 1
+        try:
+            result = await fn()
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # followers (if any) get it; don't warn when there are none
+            raise
+        except BaseException:
+            future.cancel()
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            del self._calls[key]
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.leaders + self.followers
+        return {
+            "in_flight": len(self._calls),
+            "calls": self.leaders,
+            "coalesced": self.followers,
+            "coalesced_ratio": round(self.followers / total, 4) if total else 0.0,
+        }
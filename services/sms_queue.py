@@ -0,0 +1,356 @@
+# services/sms_queue.py
+"""
+Deferred SMS replies.
+
+When SMS_DEFERRED_REPLIES is on, receive_sms stores the inbound Message with
+status "pending", enqueues an SMSJob and answers Twilio with an empty
+<Response/>. The SMSPipeline worker pool then generates the reply and sends it
+with the Twilio REST API.
+
+Backends:
+- DatabaseQueueBackend: the messages table itself is the queue. Pending rows
+  are claimed with FOR UPDATE SKIP LOCKED, so several workers/processes can
+  share it and nothing is lost on restart.
+- InMemoryQueueBackend: process-local stand-in for tests and local runs.
+
+Both backends' get() take the tenants to skip: once a tenant has
+SMS_TENANT_MAX_PARKED jobs waiting over its concurrency cap, its rows stay
+in the queue instead of being claimed and parked in memory.
+"""
+import asyncio
+import logging
+import time
+import uuid
+from collections import defaultdict, deque
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Dict, Deque, List, Set, Collection, Callable, Awaitable, Any
+from sqlalchemy import select, update, func
+from database import AsyncSessionLocal
+from models import Channel, Message
+from services.stats import LatencyWindow
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class SMSJob:
+    message_id: uuid.UUID
+    tenant_id: uuid.UUID
+    channel_id: uuid.UUID
+    from_number: str  # customer
+    to_number: str  # tenant's Twilio number
+    message_text: str
+    enqueued_at: float = field(default_factory=time.time)
+
+
+class InMemoryQueueBackend:
+    """Process-local queue. Jobs are lost on restart; meant for tests and dev."""
+
+    def __init__(self):
+        self._jobs: Deque[SMSJob] = deque()
+        self._wakeup = asyncio.Event()
+
+    async def start(self) -> None:
+        pass
+
+    async def put(self, job: SMSJob) -> None:
+        self._jobs.append(job)
+        self._wakeup.set()
+
+    def wake(self) -> None:
+        self._wakeup.set()
+
+    async def get(self, exclude: Collection[uuid.UUID] = ()) -> SMSJob:
+        """Oldest job whose tenant is not in `exclude` (re-checked on every wakeup)."""
+        while True:
+            for i, job in enumerate(self._jobs):
+                if job.tenant_id not in exclude:
+                    del self._jobs[i]
+                    return job
+            self._wakeup.clear()
+            await self._wakeup.wait()
+
+    async def requeue(self, jobs: List[SMSJob]) -> None:
+        self._jobs.extendleft(reversed(jobs))
+        self._wakeup.set()
+
+    async def depth(self) -> int:
+        return len(self._jobs)
+
+
+class DatabaseQueueBackend:
+    """Claims pending inbound SMS rows straight from the messages table."""
+
+    def __init__(self, poll_interval: float = 1.0, stale_after: timedelta = timedelta(minutes=5)):
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self._wakeup = asyncio.Event()
+
+    def _pending_sms(self):
+        return select(Message.id).join(Channel, Channel.id == Message.channel_id).where(
+            Message.status == "pending",
+            Message.direction == "incoming",
+            Channel.type == "sms"
+        )
+
+    async def start(self) -> None:
+        """Return rows orphaned in "processing" by a crashed worker to the queue."""
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                update(Message)
+                .where(
+                    Message.status == "processing",
+                    Message.updated_at < datetime.utcnow() - self.stale_after,
+                    Message.channel_id.in_(select(Channel.id).where(Channel.type == "sms"))
+                )
+                .values(status="pending", updated_at=datetime.utcnow())
+            )
+            await db.commit()
+        if result.rowcount:
+            logger.info(f"Requeued {result.rowcount} stale SMS jobs")
+
+    async def put(self, job: SMSJob) -> None:
+        # The row is already persisted as pending; just wake the dispatcher.
+        self._wakeup.set()
+
+    def wake(self) -> None:
+        self._wakeup.set()
+
+    async def requeue(self, jobs: List[SMSJob]) -> None:
+        """Hand claimed jobs that were never run back to the queue (pending again)."""
+        if not jobs:
+            return
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(Message)
+                .where(Message.id.in_([job.message_id for job in jobs]), Message.status == "processing")
+                .values(status="pending", updated_at=datetime.utcnow())
+            )
+            await db.commit()
+
+    async def _claim(self, exclude: Collection[uuid.UUID]) -> Optional[SMSJob]:
+        pending = self._pending_sms()
+        if exclude:
+            pending = pending.where(Message.tenant_id.notin_(list(exclude)))
+        async with AsyncSessionLocal() as db:
+            next_id = (
+                pending
+                .order_by(Message.created_at)
+                .limit(1)
+                .with_for_update(of=Message, skip_locked=True)
+                .scalar_subquery()
+            )
+            row = (await db.execute(
+                update(Message)
+                .where(Message.id == next_id)
+                .values(status="processing", updated_at=datetime.utcnow())
+                .returning(
+                    Message.id, Message.tenant_id, Message.channel_id,
+                    Message.customer_contact, Message.message_text, Message.created_at
+                )
+            )).first()
+            if row is None:
+                await db.rollback()
+                return None
+            to_number = await db.scalar(select(Channel.identifier).where(Channel.id == row.channel_id))
+            await db.commit()
+
+        return SMSJob(
+            message_id=row.id,
+            tenant_id=row.tenant_id,
+            channel_id=row.channel_id,
+            from_number=row.customer_contact,
+            to_number=to_number,
+            message_text=row.message_text,
+            enqueued_at=row.created_at.replace(tzinfo=timezone.utc).timestamp() if row.created_at else time.time()
+        )
+
+    async def get(self, exclude: Collection[uuid.UUID] = ()) -> SMSJob:
+        """Claim the oldest pending row whose tenant is not in `exclude` (re-read on every poll)."""
+        while True:
+            self._wakeup.clear()
+            try:
+                job = await self._claim(exclude)
+            except Exception as e:
+                logger.error(f"Failed to claim SMS job: {e}")
+                job = None
+            if job is not None:
+                return job
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def depth(self) -> int:
+        async with AsyncSessionLocal() as db:
+            return await db.scalar(select(func.count()).select_from(self._pending_sms().subquery())) or 0
+
+
+SMSProcessor = Callable[[SMSJob], Awaitable[None]]
+
+
+class SMSPipeline:
+    """
+    Worker pool for deferred SMS replies.
+
+    At most `concurrency` jobs run at once and at most `tenant_concurrency` per
+    tenant. Jobs over a tenant's cap wait in a per-tenant deque (they hold no
+    worker slot), so one busy tenant cannot starve the others. Once
+    `max_parked` jobs are waiting there, the tenant is skipped when claiming
+    until its deque drains below that again, so its backlog stays in the queue.
+    """
+
+    def __init__(self, backend=None, concurrency: int = 20, tenant_concurrency: int = 4, max_parked: int = 20):
+        self.backend = backend or InMemoryQueueBackend()
+        self.concurrency = concurrency
+        self.tenant_concurrency = tenant_concurrency
+        self.max_parked = max_parked
+        self.latency = LatencyWindow()
+        self.processed = 0
+        self.failed = 0
+        self._processor: Optional[SMSProcessor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._in_flight: Dict[uuid.UUID, int] = defaultdict(int)
+        self._deferred: Dict[uuid.UUID, Deque[SMSJob]] = defaultdict(deque)
+        self._saturated: Set[uuid.UUID] = set()  # tenants with max_parked jobs parked: not claimed from
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._tasks: set = set()
+
+    @property
+    def running(self) -> bool:
+        return self._dispatcher is not None
+
+    def use_backend(self, backend) -> None:
+        """Swap the queue backend (e.g. InMemoryQueueBackend in tests). Call before start()."""
+        if self.running:
+            raise RuntimeError("Cannot swap the SMS queue backend while the pipeline is running")
+        self.backend = backend
+
+    async def start(self, processor: SMSProcessor) -> None:
+        if self.running:
+            return
+        self._processor = processor
+        self._slots = asyncio.Semaphore(self.concurrency)
+        await self.backend.start()
+        self._dispatcher = asyncio.create_task(self._dispatch())
+        logger.info(f"SMS pipeline started ({type(self.backend).__name__}, {self.concurrency} workers)")
+
+    async def stop(self) -> None:
+        """
+        Stop claiming jobs, hand the parked (over tenant cap) ones back to the
+        backend so the next start picks them up, and wait for the running ones.
+        """
+        if not self.running:
+            return
+        self._dispatcher.cancel()
+        try:
+            await self._dispatcher
+        except asyncio.CancelledError:
+            pass
+        self._dispatcher = None
+
+        parked = [job for deferred in self._deferred.values() for job in deferred]
+        self._deferred.clear()
+        self._saturated.clear()
+        if parked:
+            try:
+                await self.backend.requeue(parked)
+                logger.info(f"Requeued {len(parked)} parked SMS jobs")
+            except Exception as e:
+                logger.error(f"Failed to requeue {len(parked)} parked SMS jobs: {e}")
+        while self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def enqueue(self, job: SMSJob) -> None:
+        await self.backend.put(job)
+
+    async def _dispatch(self) -> None:
+        while True:
+            await self._slots.acquire()
+            try:
+                job = await self.backend.get(self._saturated)
+            except BaseException:
+                self._slots.release()
+                raise
+
+            if self._in_flight[job.tenant_id] >= self.tenant_concurrency:
+                # Tenant is at its cap: park the job without holding a slot
+                deferred = self._deferred[job.tenant_id]
+                deferred.append(job)
+                if len(deferred) >= self.max_parked:
+                    self._saturated.add(job.tenant_id)
+                self._slots.release()
+                continue
+
+            self._in_flight[job.tenant_id] += 1
+            self._spawn(job)
+
+    def _spawn(self, job: SMSJob) -> None:
+        task = asyncio.create_task(self._run(job))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, job: SMSJob) -> None:
+        try:
+            await self._processor(job)
+            self.processed += 1
+        except Exception as e:
+            self.failed += 1
+            logger.error(f"SMS job {job.message_id} failed: {e}")
+        finally:
+            self.latency.add(time.time() - job.enqueued_at)
+            self._release(job.tenant_id)
+
+    def _release(self, tenant_id: uuid.UUID) -> None:
+        deferred = self._deferred.get(tenant_id)
+        if deferred:
+            # Hand this worker slot and tenant permit straight to the tenant's next job
+            self._spawn(deferred.popleft())
+            if tenant_id in self._saturated and len(deferred) < self.max_parked:
+                self._saturated.discard(tenant_id)
+                self.backend.wake()  # its rows are claimable again
+            return
+        self._deferred.pop(tenant_id, None)
+        self._in_flight[tenant_id] -= 1
+        if self._in_flight[tenant_id] <= 0:
+            del self._in_flight[tenant_id]
+        self._slots.release()
+
+    async def stats(self) -> Dict[str, Any]:
+        try:
+            queued = await self.backend.depth()
+        except Exception as e:
+            logger.error(f"Failed to read SMS queue depth: {e}")
+            queued = None
+        return {
+            "enabled": settings.SMS_DEFERRED_REPLIES,
+            "running": self.running,
+            "backend": type(self.backend).__name__,
+            "queue_depth": queued,
+            "deferred_over_tenant_cap": sum(len(d) for d in self._deferred.values()),
+            "tenants_not_claimed": len(self._saturated),
+            "max_parked_per_tenant": self.max_parked,
+            "in_flight": sum(self._in_flight.values()),
+            "concurrency": self.concurrency,
+            "tenant_concurrency_cap": self.tenant_concurrency,
+            "tenants_at_cap": sum(1 for n in self._in_flight.values() if n >= self.tenant_concurrency),
+            "processed": self.processed,
+            "failed": self.failed,
+            "latency": self.latency.summary(),
+        }
+
+
+def _default_backend():
+    if settings.SMS_QUEUE_BACKEND == "memory":
+        return InMemoryQueueBackend()
+    return DatabaseQueueBackend()
+
+
+sms_pipeline = SMSPipeline(
+    backend=_default_backend(),
+    concurrency=settings.SMS_WORKER_CONCURRENCY,
+    tenant_concurrency=settings.SMS_TENANT_CONCURRENCY,
+    max_parked=settings.SMS_TENANT_MAX_PARKED
+)
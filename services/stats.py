@@ -0,0 +1,34 @@
+# services/stats.py
+from collections import deque
+from typing import Dict, Iterable, List
+
+
+def _nearest_rank(ordered: List[float], pct: float) -> float:
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+
+class LatencyWindow:
+    """Rolling window of recent latencies (seconds) with percentile summaries."""
+
+    def __init__(self, size: int = 1000):
+        self._samples = deque(maxlen=size)
+        self.count = 0
+
+    def add(self, seconds: float) -> None:
+        self._samples.append(seconds)
+        self.count += 1
+
+    def percentile(self, pct: float) -> float:
+        """Nearest-rank percentile of the window in seconds, 0.0 when empty."""
+        if not self._samples:
+            return 0.0
+        return _nearest_rank(sorted(self._samples), pct)
+
+    def summary(self, percentiles: Iterable[int] = (50, 95, 99)) -> Dict[str, float]:
+        """Sample count plus percentiles in milliseconds, e.g. {"p50_ms": 12.3, ...}."""
+        ordered = sorted(self._samples)
+        result = {"count": self.count}
+        for pct in percentiles:
+            result[f"p{pct}_ms"] = round(_nearest_rank(ordered, pct) * 1000, 2) if ordered else 0.0
+        return result
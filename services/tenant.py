@@ -0,0 +1,66 @@
+# services/tenant.py
+import logging
+import threading
+from typing import Optional, Dict, Any
+from cachetools import TTLCache
+from sqlalchemy.orm import Session, make_transient_to_detached
+from models import Tenant
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# tenant_id -> column snapshot of the Tenant row (TTL + LRU eviction)
+_tenant_cache: TTLCache = TTLCache(
+    maxsize=settings.TENANT_CACHE_MAX_SIZE,
+    ttl=settings.TENANT_CACHE_TTL_SECONDS
+)
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+
+def _snapshot(tenant: Tenant) -> Dict[str, Any]:
+    """Copy the column values of a loaded Tenant so it can outlive its session."""
+    return {attr.key: getattr(tenant, attr.key) for attr in Tenant.__mapper__.column_attrs}
+
+
+def get_tenant_cached(db: Session, tenant_id) -> Optional[Tenant]:
+    """
+    Resolve a tenant by id, serving repeat lookups from the in-process cache.
+    Cache hits are merged into `db` without a SELECT, so callers get a normal
+    session-bound Tenant they can update and commit.
+    """
+    key = str(tenant_id)
+    with _lock:
+        values = _tenant_cache.get(key)
+        if values is None:
+            _stats["misses"] += 1
+        else:
+            _stats["hits"] += 1
+
+    if values is None:
+        tenant = db.query(Tenant).filter(Tenant.id == tenant_id).first()
+        if tenant is not None:
+            with _lock:
+                _tenant_cache[key] = _snapshot(tenant)
+        return tenant
+
+    cached = Tenant(**values)
+    make_transient_to_detached(cached)
+    return db.merge(cached, load=False)
+
+
+def invalidate_tenant(tenant_id) -> None:
+    """Drop a tenant from the cache after its row changes."""
+    with _lock:
+        if _tenant_cache.pop(str(tenant_id), None) is not None:
+            _stats["invalidations"] += 1
+
+
+def tenant_cache_stats() -> Dict[str, Any]:
+    with _lock:
+        lookups = _stats["hits"] + _stats["misses"]
+        return {
+            **_stats,
+            "size": len(_tenant_cache),
+            "hit_ratio": round(_stats["hits"] / lookups, 4) if lookups else 0.0,
+        }
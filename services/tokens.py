@@ -0,0 +1,15 @@
+# services/tokens.py
+import re
+
+# Words, numbers and single punctuation marks; close enough to BPE counts for budgeting
+_PIECES = re.compile(r"\w+|[^\w\s]")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Cheap token estimate without a tokenizer: ~4 characters per token, but
+    never fewer than the number of words/punctuation marks.
+    """
+    if not text:
+        return 0
+    return max(len(_PIECES.findall(text)), (len(text) + 3) // 4)
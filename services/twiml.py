@@ -0,0 +1,65 @@
+# services/twiml.py
+"""
+TwiML bodies for the SMS and voice webhooks.
+
+Replies are rendered with a single f-string. Every text goes through
+xml_escape(), which also drops the control characters XML 1.0 forbids (Twilio
+rejects TwiML containing them); plain text takes its no-copy fast path.
+Greetings only depend on the business name and the voice, so their bodies are
+cached whole.
+"""
+import re
+from functools import lru_cache
+from typing import Optional
+from config import settings
+
+_XML_DECLARATION = b'<?xml version="1.0" encoding="UTF-8"?>'
+
+# Control characters XML 1.0 forbids (tab, newline and carriage return are allowed)
+_CONTROL = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+EMPTY_RESPONSE = _XML_DECLARATION + b"<Response/>"
+
+
+def xml_escape(text: str, quote: bool = False) -> str:
+    """Escape text for an XML element (or attribute with `quote=True`); drops forbidden control characters."""
+    if not quote and "&" not in text and "<" not in text and ">" not in text and (
+        text.isprintable() or not _CONTROL.search(text)
+    ):
+        return text  # common case: plain reply text
+    text = text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+    if quote:
+        text = text.replace('"', "&quot;")
+    return _CONTROL.sub("", text)
+
+
+def sms_reply(reply_text: Optional[str]) -> bytes:
+    """TwiML for an SMS webhook reply; None gives an empty <Response/> that sends nothing back."""
+    if reply_text is None:
+        return EMPTY_RESPONSE
+    return f'<?xml version="1.0" encoding="UTF-8"?><Response><Message>{xml_escape(reply_text)}</Message></Response>'.encode()
+
+
+@lru_cache(maxsize=16)
+def _voice_attribute(voice: str) -> str:
+    return xml_escape(voice, quote=True)
+
+
+def voice_reply(say_text: str, voice: Optional[str] = None) -> bytes:
+    """TwiML that speaks `say_text` and keeps gathering speech."""
+    return f"""<?xml version="1.0" encoding="UTF-8"?>
+<Response>
+    <Say voice="{_voice_attribute(voice or settings.TWILIO_VOICE)}">{xml_escape(say_text)}</Say>
+    <Gather input="speech" action="/api/voice/receive" method="POST" speechTimeout="auto"/>
+</Response>""".encode()
+
+
+@lru_cache(maxsize=4096)
+def greeting(business_name: str, voice: Optional[str] = None) -> bytes:
+    """Opening TwiML of a call; cached per (business name, voice)."""
+    return voice_reply(f"Hello! This is {business_name}. How can I help you today?", voice)
+
+
+def twiml_stats() -> dict:
+    info = greeting.cache_info()
+    return {"greeting_hits": info.hits, "greeting_misses": info.misses, "greetings_cached": info.currsize}
@@ -0,0 +1,9 @@
+import os
+import sys
+
+# The app reads these at import time; unit tests never connect to the database
+# or call a provider, so placeholders are enough.
+os.environ.setdefault("DATABASE_URL", "postgresql://postgres@localhost/supportdesk_test")
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,73 @@
+import asyncio
+import uuid
+import pytest
+from services import responder
+from services.conversation import conversation_store, Conversation, ConversationKey, make_turn
+from config import settings
+
+QUESTION = "how much is that?"
+
+
+@pytest.fixture
+def provider(monkeypatch):
+    """Fake provider that answers from the conversation context it was given."""
+    calls = []
+
+    def answer(history):
+        return f"that one is ${len(history) * 10}" if history else "what would you like a price for?"
+
+    async def get_ai_response(message_text, ai_provider, system_prompt, model, temperature, history, tenant_id):
+        calls.append(history)
+        return answer(history), 0.9
+
+    async def stream_ai_response(message_text, ai_provider, system_prompt, model, temperature, history, tenant_id):
+        calls.append(history)
+        yield answer(history)
+
+    monkeypatch.setattr(responder, "get_ai_response", get_ai_response)
+    monkeypatch.setattr(responder, "stream_ai_response", stream_ai_response)
+    monkeypatch.setattr(settings, "KB_RETRIEVAL_ENABLED", False)
+    monkeypatch.setattr(settings, "AI_SINGLE_FLIGHT_ENABLED", False)
+    return calls
+
+
+def _conversation(tenant_id, channel_id, contact, turns=()):
+    """Seed the in-memory conversation store (no DB load)."""
+    key = ConversationKey(tenant_id, channel_id, contact)
+    conversation = Conversation(conversation_store.max_turns, conversation_store.max_tokens)
+    for message, reply in turns:
+        conversation.append(make_turn(message, reply))
+    conversation_store._store(key, conversation)
+    return key
+
+
+async def _stream(**kwargs):
+    stream = responder.stream_ai_reply(**kwargs)
+    async for _ in stream:
+        pass
+    return stream.reply, stream.source
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_mid_conversation_message_skips_reply_cache(provider, streaming):
+    tenant_id, channel_id = uuid.uuid4(), uuid.uuid4()
+    newcomer = _conversation(tenant_id, channel_id, "+15550001")
+    regular = _conversation(tenant_id, channel_id, "+15550002", [("do you do facials?", "Yes, 60 minutes.")])
+
+    async def ask(conversation):
+        kwargs = dict(tenant_id=tenant_id, message_text=QUESTION, ai_provider="openai",
+                      system_prompt="spa", conversation=conversation)
+        if streaming:
+            return await _stream(**kwargs)
+        reply, _, source = await responder.generate_ai_reply(**kwargs)
+        return reply, source
+
+    async def run():
+        return await ask(newcomer), await ask(regular)
+
+    (first_reply, first_source), (second_reply, second_source) = asyncio.run(run())
+
+    assert first_source == "ai"
+    assert second_source == "ai_history"  # not "reply_cache": the standalone answer is not reused
+    assert first_reply != second_reply
+    assert len(provider) == 2 and provider[1]
@@ -0,0 +1,19 @@
+import xml.dom.minidom
+import pytest
+from services import twiml
+
+RENDERERS = [twiml.sms_reply, lambda text: twiml.voice_reply(text, "Polly.Joanna")]
+
+
+@pytest.mark.parametrize("render", RENDERERS, ids=["sms", "voice"])
+@pytest.mark.parametrize("text", ["Open 9\x0bto 5", "Press \x1b[1mnow\x1b[0m", "Tom & Jerry <spa>\x00"])
+def test_forbidden_control_characters_are_dropped(render, text):
+    body = render(text).decode()
+    assert not any(ord(c) < 0x20 and c not in "\t\n\r" for c in body)
+    xml.dom.minidom.parseString(body)  # valid TwiML
+
+
+@pytest.mark.parametrize("render", RENDERERS, ids=["sms", "voice"])
+def test_plain_text_and_newlines_are_kept(render):
+    text = "We are open 9 to 5.\nSee you soon!"
+    assert text in render(text).decode()